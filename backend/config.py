@@ -1,36 +1,136 @@
 import json
 import os
-from typing import List, Dict
+import threading
+import time
+from typing import List, Dict, Optional, Tuple
 from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
 
+from . import database, models
+
+# Legacy settings file, imported into the database on first use
 SETTINGS_FILE = "settings.json"
 
+# Seconds a worker serves settings from memory before re-checking the
+# version in the database (other workers/instances may have written)
+SETTINGS_CACHE_TTL = float(os.getenv("TDM_SETTINGS_CACHE_TTL", "2"))
+
+SETTINGS_ROW_ID = 1
+
 class CustomColumn(BaseModel):
     name: str
     key: str # metadata key
     type: str = "text" # text, number, date
 
+class ReplenishRule(BaseModel):
+    document_type: str = "CPF"
+    region: Optional[str] = None
+    financial_status: Optional[str] = None
+    low_watermark: int = 50 # replenish when AVAILABLE count drops below this
+    target: int = 200 # AVAILABLE count after replenishing
+    counters: Dict[str, Dict[int, float]] = {}
+    tags: List[str] = []
+
 class Settings(BaseModel):
     custom_columns: List[CustomColumn] = []
     hidden_columns: List[str] = [] # List of column keys to hide
     column_order: List[str] = [] # List of column keys in order
+    replenish_rules: List[ReplenishRule] = []
 
-def load_settings() -> Settings:
+class SettingsConflict(Exception):
+    """The settings changed since the version the writer based its edit on."""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"Settings changed (current version {current_version})")
+        self.current_version = current_version
+
+
+_cache = {"settings": None, "version": None, "checked_at": 0.0}
+_cache_lock = threading.Lock()
+
+
+def _legacy_settings() -> Settings:
     if not os.path.exists(SETTINGS_FILE):
         return Settings()
-    
     try:
         with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return Settings(**data)
+            return Settings(**json.load(f))
     except Exception as e:
         print(f"Error loading settings: {e}")
         return Settings()
 
-def save_settings(settings: Settings):
+
+def _read_row(db) -> models.AppSettings:
+    row = db.get(models.AppSettings, SETTINGS_ROW_ID)
+    if row is not None:
+        return row
+    # First start on this database: import settings.json if there is one
+    db.add(models.AppSettings(id=SETTINGS_ROW_ID, version=1, data=_legacy_settings().dict()))
     try:
-        with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-            # indent=4 for readability if user inspects file
-            json.dump(settings.dict(), f, indent=4, ensure_ascii=False)
-    except Exception as e:
-        print(f"Error saving settings: {e}")
+        db.commit()
+    except IntegrityError:
+        db.rollback()  # Another worker seeded it first
+    return db.get(models.AppSettings, SETTINGS_ROW_ID)
+
+
+def get_settings() -> Tuple[Settings, int]:
+    """
+    Returns (settings, version). Served from memory; after SETTINGS_CACHE_TTL
+    only the version number is read back, and the settings are reloaded
+    when it changed.
+    """
+    with _cache_lock:
+        if _cache["settings"] is not None and time.monotonic() - _cache["checked_at"] < SETTINGS_CACHE_TTL:
+            return _cache["settings"], _cache["version"]
+
+        db = database.SessionLocal()
+        try:
+            version = db.query(models.AppSettings.version).filter(models.AppSettings.id == SETTINGS_ROW_ID).scalar()
+            if version is None or version != _cache["version"]:
+                row = _read_row(db)
+                _cache["settings"] = Settings(**(row.data or {}))
+                _cache["version"] = row.version
+        except Exception as e:
+            print(f"Error loading settings: {e}")
+            if _cache["settings"] is None:
+                return Settings(), 0
+        finally:
+            db.close()
+
+        _cache["checked_at"] = time.monotonic()
+        return _cache["settings"], _cache["version"]
+
+
+def load_settings() -> Settings:
+    return get_settings()[0]
+
+
+def save_settings(settings: Settings, expected_version: Optional[int] = None) -> int:
+    """
+    Writes `settings` in one atomic UPDATE that also bumps the version.
+    With `expected_version`, the write only happens if nobody else wrote
+    since (raises SettingsConflict otherwise). Returns the new version.
+    """
+    db = database.SessionLocal()
+    try:
+        _read_row(db)  # Make sure the row exists
+        query = db.query(models.AppSettings).filter(models.AppSettings.id == SETTINGS_ROW_ID)
+        if expected_version is not None:
+            query = query.filter(models.AppSettings.version == expected_version)
+        updated = query.update({
+            models.AppSettings.data: settings.dict(),
+            models.AppSettings.version: models.AppSettings.version + 1,
+        }, synchronize_session=False)
+        # Read inside the same transaction: the row is locked by our UPDATE,
+        # so this is the version we just wrote (or the current one on conflict)
+        version = db.query(models.AppSettings.version).filter(models.AppSettings.id == SETTINGS_ROW_ID).scalar()
+        db.commit()
+        if not updated:
+            raise SettingsConflict(version)
+    finally:
+        db.close()
+
+    with _cache_lock:
+        if version > (_cache["version"] or 0):
+            _cache.update(settings=settings, version=version, checked_at=time.monotonic())
+    return version
@@ -13,13 +13,33 @@ if SQLCHEMY_DATABASE_URL.startswith("postgres://"):
 # SQLite needs specific args
 connect_args = {"check_same_thread": False} if "sqlite" in SQLCHEMY_DATABASE_URL else {}
 
-engine = create_engine(
-    SQLCHEMY_DATABASE_URL, connect_args=connect_args
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
 Base = declarative_base()
 
+# The engine (and its DB driver import) is created on first use rather
+# than at import time, so importing the app stays cheap.
+_engine = None
+_session_factory = None
+
+def get_engine():
+    global _engine, _session_factory
+    if _engine is None:
+        _engine = create_engine(
+            SQLCHEMY_DATABASE_URL, connect_args=connect_args
+        )
+        _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=_engine)
+    return _engine
+
+def SessionLocal():
+    if _session_factory is None:
+        get_engine()
+    return _session_factory()
+
+def __getattr__(name):
+    # Backwards compatibility for code that used the module-level engine
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def get_db():
     db = SessionLocal()
     try:
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import insert
+
+from . import models, database
+
+# Event types
+CHECKOUT = "CHECKOUT"
+RELEASE = "RELEASE"
+CONSUME = "CONSUME"
+BLOCK = "BLOCK"
+EXPIRE = "EXPIRE"
+EXHAUSTED = "EXHAUSTED"  # checkout found no AVAILABLE massa for the criteria
+
+# Event recorded when a massa moves to a given status
+STATUS_EVENTS = {
+    "IN_USE": CHECKOUT,
+    "AVAILABLE": RELEASE,
+    "CONSUMED": CONSUME,
+    "BLOCKED": BLOCK,
+}
+
+# Events that end a reservation (their hold time is recorded)
+END_EVENTS = (RELEASE, CONSUME, BLOCK, EXPIRE)
+
+FLUSH_INTERVAL = float(os.getenv("TDM_EVENT_FLUSH_INTERVAL", "2"))
+FLUSH_SIZE = int(os.getenv("TDM_EVENT_FLUSH_SIZE", "500"))
+
+# Events kept in memory while the database can't take them (oldest dropped first)
+MAX_BUFFER = int(os.getenv("TDM_EVENT_MAX_BUFFER", "50000"))
+
+
+def criteria_key(**criteria) -> str:
+    """Canonical, indexable form of checkout criteria: "financial_status=X&region=Y"."""
+    parts = [f"{key}={value}" for key, value in sorted(criteria.items()) if value not in (None, "")]
+    return "&".join(parts) or "*"
+
+
+class EventRecorder:
+    """
+    Buffers reservation events in memory and writes them in batched
+    inserts, so recording an event never adds a database round trip to
+    the request that caused it.
+    """
+
+    def __init__(self, flush_size: int = FLUSH_SIZE, max_buffer: int = MAX_BUFFER):
+        self.flush_size = flush_size
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._buffer: List[dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flushing = False  # A size-triggered flush thread is running
+
+    def record(
+        self,
+        event_type: str,
+        massa_id: Optional[int] = None,
+        consumer_id: Optional[str] = None,
+        criteria: Optional[str] = None,
+        held_since: Optional[datetime] = None,
+        details: Optional[dict] = None,
+    ):
+        now = datetime.now()
+        held_seconds = None
+        if held_since is not None:
+            # last_used_at may come back timezone-aware depending on the backend
+            held_seconds = (now - held_since.replace(tzinfo=None)).total_seconds()
+
+        event = {
+            "event_type": event_type,
+            "massa_id": massa_id,
+            "consumer_id": consumer_id,
+            "criteria": criteria,
+            "held_seconds": held_seconds,
+            "details": details or {},
+            "created_at": now,
+        }
+        with self._lock:
+            self._buffer.append(event)
+            self._trim()
+            # One flush thread at a time: while the database is down the
+            # buffer stays full and every record() would start another
+            start_flush = len(self._buffer) >= self.flush_size and not self._flushing
+            if start_flush:
+                self._flushing = True
+        if start_flush:
+            # Large bursts are written by whoever fills the buffer
+            threading.Thread(target=self._flush_in_background, daemon=True).start()
+
+    def _trim(self):
+        """Drops the oldest events past max_buffer. Call with _lock held."""
+        excess = len(self._buffer) - self.max_buffer
+        if excess > 0:
+            del self._buffer[:excess]
+            self.dropped += excess
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._flushing = False
+
+    def record_status_change(self, massa: models.Massa, new_status: str, previous_status: Optional[str] = None):
+        """Records the event matching a status transition of `massa`, if any."""
+        event_type = STATUS_EVENTS.get(new_status)
+        if event_type is None or new_status == previous_status:
+            return
+        ends_hold = event_type in END_EVENTS and previous_status == "IN_USE"
+        self.record(
+            event_type, massa_id=massa.id, consumer_id=massa.last_used_by,
+            # End events carry the checkout's criteria, for hold time per criteria
+            criteria=massa.checkout_criteria if ends_hold else None,
+            held_since=massa.last_used_at if ends_hold else None,
+        )
+
+    def flush(self) -> int:
+        """Writes every buffered event. Returns how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                events, self._buffer = self._buffer, []
+            if not events:
+                return 0
+
+            db = database.SessionLocal()
+            try:
+                db.execute(insert(models.MassaEvent.__table__), events)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                # Put them back so the next flush retries
+                with self._lock:
+                    self._buffer[:0] = events
+                    self._trim()
+                    dropped = self.dropped
+                print(f"Error writing events ({len(events)} buffered, {dropped} dropped so far): {e}")
+                return 0
+            finally:
+                db.close()
+            return len(events)
+
+
+recorder = EventRecorder()
+
+
+async def flush_scheduler(interval: float = FLUSH_INTERVAL):
+    """Background loop that writes buffered events every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(recorder.flush)
@@ -0,0 +1,133 @@
+import json
+import re
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import String, cast
+from sqlalchemy.orm import Query
+
+from . import models, schemas, search
+
+# Compact counter predicate, e.g. "uc_ligada>=2" or "fat_renegociacao=0"
+PREDICATE_PATTERN = re.compile(r"^\s*(\w+?)\s*(>=|<=|==|=|>|<)\s*(-?\d+)\s*$")
+
+
+def _counter_column(name: str):
+    if name not in schemas.COUNTER_COLUMNS:
+        raise ValueError(f"Unknown counter column: {name}")
+    return getattr(models.Massa, name)
+
+
+def parse_predicate(expression: str) -> Tuple[str, str, int]:
+    """Splits "uc_ligada>=2" into ("uc_ligada", ">=", 2)."""
+    match = PREDICATE_PATTERN.match(expression)
+    if not match:
+        raise ValueError(f"Invalid predicate: {expression!r} (expected e.g. uc_ligada>=2)")
+    name, op, value = match.groups()
+    _counter_column(name)
+    return name, op, int(value)
+
+
+def _names_counter(key: str) -> bool:
+    """True for parameters that look like counter filters, e.g. "min_uc_ligada" or "uc_ligada>"."""
+    if key.startswith(("min_", "max_")):
+        key = key[4:]
+    return key.startswith(tuple(schemas.COUNTER_COLUMNS))
+
+
+def _add_bound(bounds_min: Dict[str, int], bounds_max: Dict[str, int], name: str, op: str, value: int):
+    # Strict comparisons become inclusive ones: counters are integers
+    if op == ">":
+        op, value = ">=", value + 1
+    elif op == "<":
+        op, value = "<=", value - 1
+    if op in (">=", "=", "=="):
+        bounds_min[name] = max(value, bounds_min.get(name, value))
+    if op in ("<=", "=", "=="):
+        bounds_max[name] = min(value, bounds_max.get(name, value))
+
+
+def counter_bounds(params: Mapping[str, str], where: Iterable[str] = ()) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Collects counter bounds from query parameters. Accepts:
+      - min_<counter>=N / max_<counter>=N
+      - <counter>=N (exact value)
+      - <counter>>=N / <counter><=N written straight into the URL
+        (parsed by the server as key "<counter>>" / "<counter><")
+      - <counter>>N / <counter><N written straight into the URL
+        (parsed as a key with an empty value)
+      - where expressions, e.g. where=uc_ligada>=2,fat_renegociacao=0
+      - uc_status=<ligada|desligada|suspensa> (at least one UC in that status)
+    Returns (min, max) for MassaCriteria; raises ValueError on bad input,
+    including any other parameter that names a counter, so a predicate the
+    server can't read never widens the match.
+    """
+    bounds_min: Dict[str, int] = {}
+    bounds_max: Dict[str, int] = {}
+
+    def to_int(key, value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for {key}: {value!r}")
+
+    for key, value in params.items():
+        if value == "" and PREDICATE_PATTERN.match(key):
+            _add_bound(bounds_min, bounds_max, *parse_predicate(key))
+        elif key.startswith(("min_", "max_")) and key[4:] in schemas.COUNTER_COLUMNS:
+            op = ">=" if key.startswith("min_") else "<="
+            _add_bound(bounds_min, bounds_max, key[4:], op, to_int(key, value))
+        elif key in schemas.COUNTER_COLUMNS:
+            _add_bound(bounds_min, bounds_max, key, "=", to_int(key, value))
+        elif key[-1:] in (">", "<") and key[:-1] in schemas.COUNTER_COLUMNS:
+            _add_bound(bounds_min, bounds_max, key[:-1], key[-1] + "=", to_int(key, value))
+        elif key == "uc_status" and value:
+            name = f"uc_{value.lower()}"
+            if name not in schemas.COUNTER_COLUMNS:
+                raise ValueError(f"Unknown uc_status: {value}")
+            _add_bound(bounds_min, bounds_max, name, ">=", 1)
+        elif _names_counter(key):
+            raise ValueError(f"Invalid counter parameter: {key!r} (expected e.g. uc_ligada>=2)")
+
+    for expressions in where:
+        for expression in expressions.split(","):
+            if expression.strip():
+                _add_bound(bounds_min, bounds_max, *parse_predicate(expression))
+
+    return bounds_min, bounds_max
+
+
+def split_tags(tags: Optional[str]) -> List[str]:
+    """Parses the comma-separated `tags` query parameter."""
+    return [tag.strip() for tag in (tags or "").split(",") if tag.strip()]
+
+
+def apply_criteria(query: Query, criteria: schemas.MassaCriteria) -> Query:
+    """Filters `query` to massas matching `criteria`."""
+    if criteria.document_type:
+        query = query.filter(models.Massa.document_type == criteria.document_type)
+    if criteria.region:
+        query = query.filter(models.Massa.region == criteria.region)
+    if criteria.financial_status:
+        query = query.filter(models.Massa.financial_status == criteria.financial_status)
+    for tag in criteria.tags:
+        # tags is a JSON list; its text form contains the quoted tag
+        pattern = f"%{search._escape_like(json.dumps(tag))}%"
+        query = query.filter(cast(models.Massa.tags, String).like(pattern, escape="\\"))
+    for name, value in criteria.min.items():
+        query = query.filter(_counter_column(name) >= value)
+    for name, value in criteria.max.items():
+        query = query.filter(_counter_column(name) <= value)
+    return query
+
+
+def criteria_fields(criteria: schemas.MassaCriteria) -> dict:
+    """Flat {name: value} form of `criteria`, for events.criteria_key()."""
+    parts = {
+        "document_type": criteria.document_type,
+        "region": criteria.region,
+        "financial_status": criteria.financial_status,
+        "tags": ",".join(sorted(criteria.tags)) or None,
+    }
+    parts.update({f"min_{k}": v for k, v in criteria.min.items()})
+    parts.update({f"max_{k}": v for k, v in criteria.max.items()})
+    return parts
@@ -0,0 +1,321 @@
+import asyncio
+import json
+import os
+import random
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy import DateTime, String, column, func, insert, table
+from sqlalchemy.orm import Session
+
+from . import models, schemas, config, database, filters, locks
+
+# Rows per INSERT statement (and per commit) when bulk loading generated massas
+INSERT_CHUNK_SIZE = 5000
+
+# Document numbers per IN (...) when checking fresh numbers against the table
+LOOKUP_CHUNK_SIZE = 1000
+
+# Seconds between watermark checks (0 disables the scheduler)
+REPLENISH_INTERVAL = int(os.getenv("TDM_REPLENISH_INTERVAL", "60"))
+
+# Every uvicorn worker runs the scheduler; this DB lock lets only one of
+# them top up the pool at a time. Held at most this many seconds, so a
+# worker killed mid-run doesn't block replenishing for good.
+REPLENISH_LOCK = "replenish"
+REPLENISH_LOCK_TTL = 600
+
+# Bind types for the bulk insert; the JSON columns go in pre-serialized
+COLUMN_TYPES = {"tags": String, "metadata_info": String, "updated_at": DateTime(timezone=True)}
+
+CPF_WEIGHTS_1 = (10, 9, 8, 7, 6, 5, 4, 3, 2)
+CPF_WEIGHTS_2 = (11, 10, 9, 8, 7, 6, 5, 4, 3, 2)
+CNPJ_WEIGHTS_1 = (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+CNPJ_WEIGHTS_2 = (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+
+FIRST_NAMES = [
+    "Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Felipe", "Gabriela", "Henrique",
+    "Isabela", "João", "Larissa", "Marcos", "Natália", "Otávio", "Paula", "Rafael",
+    "Sabrina", "Thiago", "Vanessa", "Wagner",
+]
+LAST_NAMES = [
+    "Almeida", "Barbosa", "Cardoso", "Costa", "Ferreira", "Gomes", "Lima", "Martins",
+    "Oliveira", "Pereira", "Ribeiro", "Rocha", "Santos", "Silva", "Souza",
+]
+# Region used when a spec has no region distribution (region is required on massas)
+DEFAULT_REGION = "Brasília"
+
+COMPANY_SUFFIXES = ["Comércio LTDA", "Serviços ME", "Indústria S.A.", "Distribuidora EIRELI"]
+
+
+def _weighted_sum_tables(weights) -> List[List[int]]:
+    """
+    Lookup tables with the weighted digit sum of every 3-digit chunk,
+    least significant chunk first. Turns check digit math into a few
+    list lookups instead of a per-digit loop.
+    """
+    tables = []
+    for end in range(len(weights), 0, -3):
+        w = weights[end - 3:end]
+        tables.append([a * w[0] + b * w[1] + c * w[2] for a in range(10) for b in range(10) for c in range(10)])
+    return tables
+
+
+def _check_digit(total: int) -> int:
+    remainder = total % 11
+    return 0 if remainder < 2 else 11 - remainder
+
+
+class _DocumentFormat:
+    def __init__(self, weights_1, weights_2):
+        self.tables = list(zip(_weighted_sum_tables(weights_1), _weighted_sum_tables(weights_2[:-1])))
+        self.last_weight = weights_2[-1]
+
+    def build(self, number: int) -> str:
+        s1 = s2 = 0
+        for t1, t2 in self.tables:
+            number_rest, chunk = divmod(number, 1000)
+            s1 += t1[chunk]
+            s2 += t2[chunk]
+            number = number_rest
+        d1 = _check_digit(s1)
+        d2 = _check_digit(s2 + d1 * self.last_weight)
+        return f"{d1}{d2}"
+
+
+_CPF = _DocumentFormat(CPF_WEIGHTS_1, CPF_WEIGHTS_2)
+_CNPJ = _DocumentFormat(CNPJ_WEIGHTS_1, CNPJ_WEIGHTS_2)
+
+
+def cpf_from_base(base: int) -> str:
+    """Returns the 11-digit CPF for a 9-digit base number, check digits included."""
+    return f"{base:09d}{_CPF.build(base)}"
+
+
+def cnpj_from_base(base: int, branch: int = 1) -> str:
+    """Returns the 14-digit CNPJ for an 8-digit root and 4-digit branch number."""
+    number = base * 10000 + branch
+    return f"{number:012d}{_CNPJ.build(number)}"
+
+
+def is_valid_document(number: str) -> bool:
+    """Validates the check digits of a CPF or CNPJ (digits only)."""
+    if not number.isdigit() or len(set(number)) == 1:
+        return False
+    if len(number) == 11:
+        return cpf_from_base(int(number[:9])) == number
+    if len(number) == 14:
+        return cnpj_from_base(int(number[:8]), int(number[8:12])) == number
+    return False
+
+
+def generate_documents(
+    document_type: str, count: int, rng: random.Random,
+    existing: Callable[[Set[str]], Set[str]] = lambda batch: set(),
+) -> List[str]:
+    """
+    Mints `count` unique, valid document numbers. `existing(batch)` returns
+    the numbers of a drawn batch that are already taken; they are skipped.
+    Base numbers are drawn in batches and deduplicated with set operations.
+    """
+    is_cpf = document_type == "CPF"
+    space = 10 ** 9 if is_cpf else 10 ** 8
+    result: List[str] = []
+    seen: Set[str] = set()
+
+    while len(result) < count:
+        missing = count - len(result)
+        # Oversample a little so collisions rarely need another round
+        bases = {rng.randrange(1, space) for _ in range(missing + missing // 10 + 16)}
+        if is_cpf:
+            batch = {cpf_from_base(b) for b in bases}
+        else:
+            batch = {cnpj_from_base(b) for b in bases}
+        batch -= seen
+        # Repeated digits (000..., 111...) are rejected by most validators
+        batch = {d for d in batch if len(set(d)) > 1}
+        batch -= existing(batch)
+        fresh = list(batch)[:missing]
+        seen.update(fresh)
+        result.extend(fresh)
+
+    return result
+
+
+def _weighted_sample(distribution: Dict, count: int, rng: random.Random) -> list:
+    """Draws `count` values from a {value: weight} mapping."""
+    if not distribution:
+        return [None] * count
+    values = list(distribution.keys())
+    weights = list(distribution.values())
+    return rng.choices(values, weights=weights, k=count)
+
+
+def _random_names(document_type: str, count: int, rng: random.Random) -> List[str]:
+    firsts = rng.choices(FIRST_NAMES, k=count)
+    lasts = rng.choices(LAST_NAMES, k=count)
+    if document_type == "CNPJ":
+        suffixes = rng.choices(COMPANY_SUFFIXES, k=count)
+        return [f"{l} {s}" for l, s in zip(lasts, suffixes)]
+    return [f"{f} {l}" for f, l in zip(firsts, lasts)]
+
+
+def build_massas(
+    spec: schemas.GenerateRequest, existing: Callable[[Set[str]], Set[str]] = lambda batch: set()
+) -> List[dict]:
+    """
+    Builds the per-row column values for `spec.count` new massas.
+    `existing` filters out document numbers already taken (see generate_documents).
+    """
+    rng = random.Random(spec.seed)
+    count = spec.count
+
+    columns = {
+        "document_number": generate_documents(spec.document_type, count, rng, existing),
+        "nome": _random_names(spec.document_type, count, rng),
+        "region": _weighted_sample(spec.region or {DEFAULT_REGION: 1}, count, rng),
+        "financial_status": _weighted_sample(spec.financial_status, count, rng),
+    }
+    for counter in schemas.COUNTER_COLUMNS:
+        distribution = spec.counters.get(counter)
+        columns[counter] = _weighted_sample(distribution, count, rng) if distribution else [0] * count
+
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+
+def _existing_documents(db: Session, docs: Set[str]) -> Set[str]:
+    """Which of `docs` are already in the table, looked up by the unique index."""
+    docs = list(docs)
+    found = set()
+    for start in range(0, len(docs), LOOKUP_CHUNK_SIZE):
+        chunk = docs[start:start + LOOKUP_CHUNK_SIZE]
+        found.update(
+            doc for (doc,) in
+            db.query(models.Massa.document_number).filter(models.Massa.document_number.in_(chunk))
+        )
+    return found
+
+
+def generate_massas(db: Session, spec: schemas.GenerateRequest) -> int:
+    """
+    Generates and bulk-inserts massas following `spec`.
+    Returns the number of rows inserted.
+
+    Each chunk is stamped right before its INSERT and committed right
+    after it: a chunk must commit within sync.SYNC_OVERLAP of its
+    updated_at or delta clients could skip it.
+    """
+    rows = build_massas(spec, lambda batch: _existing_documents(db, batch))
+
+    # Values shared by every generated row are serialized once up front.
+    # The JSON columns are bound as plain strings through a lightweight
+    # table clause so SQLAlchemy doesn't re-encode them row by row.
+    shared = {
+        "document_type": spec.document_type,
+        "uf": spec.uf,
+        "status": "AVAILABLE",
+        "tags": json.dumps(list(spec.tags)),
+        "metadata_info": json.dumps({"generated": True}),
+    }
+    for row in rows:
+        row.update(shared)
+
+    keys = list(rows[0]) + ["updated_at"] if rows else []
+    target = table(
+        models.Massa.__tablename__,
+        *[column(key, COLUMN_TYPES.get(key)) for key in keys],
+    )
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        chunk = rows[start:start + INSERT_CHUNK_SIZE]
+        # The bulk insert bypasses the model's default
+        now = datetime.now()
+        for row in chunk:
+            row["updated_at"] = now
+        db.execute(insert(target), chunk)
+        db.commit()
+    return len(rows)
+
+
+def rule_criteria(rule: config.ReplenishRule) -> schemas.MassaCriteria:
+    """
+    The bucket a rule fills: its document type, region, financial status and
+    tags, with each generated counter within the range of its distribution.
+    """
+    bounds_min, bounds_max = {}, {}
+    for counter, distribution in rule.counters.items():
+        values = [int(value) for value, weight in distribution.items() if weight > 0]
+        if values:
+            bounds_min[counter], bounds_max[counter] = min(values), max(values)
+    return schemas.MassaCriteria(
+        document_type=rule.document_type, region=rule.region, financial_status=rule.financial_status,
+        tags=rule.tags, min=bounds_min, max=bounds_max,
+    )
+
+
+def _available_count(db: Session, rule: config.ReplenishRule) -> int:
+    query = db.query(func.count(models.Massa.id)).filter(models.Massa.status == "AVAILABLE")
+    return filters.apply_criteria(query, rule_criteria(rule)).scalar() or 0
+
+
+def replenish_pool(db: Session, rules: Optional[List[config.ReplenishRule]] = None) -> List[dict]:
+    """
+    Checks every replenish rule and tops up the buckets whose AVAILABLE
+    count dropped below their low watermark. Returns an empty report
+    without doing anything if another worker is replenishing right now.
+    """
+    token = locks.acquire(db, REPLENISH_LOCK, REPLENISH_LOCK_TTL)
+    if token is None:
+        return []
+    try:
+        return _replenish(db, rules)
+    finally:
+        locks.release(db, REPLENISH_LOCK, token)
+
+
+def _replenish(db: Session, rules: Optional[List[config.ReplenishRule]]) -> List[dict]:
+    if rules is None:
+        rules = config.load_settings().replenish_rules
+
+    report = []
+    for rule in rules:
+        available = _available_count(db, rule)
+        if available >= rule.low_watermark or available >= rule.target:
+            continue
+        spec = schemas.GenerateRequest(
+            document_type=rule.document_type,
+            count=rule.target - available,
+            region={rule.region: 1} if rule.region else {},
+            financial_status={rule.financial_status: 1} if rule.financial_status else {},
+            counters=rule.counters,
+            tags=rule.tags,
+        )
+        created = generate_massas(db, spec)
+        report.append({
+            "document_type": rule.document_type,
+            "region": rule.region,
+            "financial_status": rule.financial_status,
+            "available_before": available,
+            "created": created,
+        })
+    return report
+
+
+def _replenish_once() -> List[dict]:
+    db = database.SessionLocal()
+    try:
+        return replenish_pool(db)
+    finally:
+        db.close()
+
+
+async def replenish_scheduler(interval: int = REPLENISH_INTERVAL):
+    """Background loop that applies the replenish rules every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            report = await asyncio.to_thread(_replenish_once)
+            for entry in report:
+                print(f"[TDM] Pool reabastecido: {entry}")
+        except Exception as e:
+            print(f"Error replenishing pool: {e}")
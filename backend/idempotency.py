@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, database
+
+# Seconds a stored result is replayed for a repeated Idempotency-Key
+KEY_TTL = int(os.getenv("TDM_IDEMPOTENCY_TTL", str(24 * 3600)))
+
+# Seconds between sweeps for expired keys (0 disables the purge)
+PURGE_INTERVAL = int(os.getenv("TDM_IDEMPOTENCY_PURGE_INTERVAL", "600"))
+
+# A retry that arrives while the first request is still running waits
+# this long for its result before getting 409
+PENDING_WAIT = 5.0
+PENDING_POLL = 0.05
+
+# A key still pending after this many seconds belongs to a request that died
+# before storing its result (e.g. the worker was killed); a retry takes it over
+PENDING_TIMEOUT = int(os.getenv("TDM_IDEMPOTENCY_PENDING_TIMEOUT", "60"))
+
+MAX_KEY_LENGTH = 255
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(request: Request, payload: Any = None) -> str:
+    """Hash of what the request asks for, so a key can't be reused for another request."""
+    parts = {
+        "method": request.method,
+        "path": request.url.path,
+        "query": sorted(request.query_params.multi_items()),
+        "payload": jsonable_encoder(payload),
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _claim(db: Session, key: str, request_hash: str, now: datetime) -> Optional[models.IdempotencyKey]:
+    """
+    Inserts a pending row for `key`. Returns None if this request owns the
+    key now, or the existing row if another request got there first.
+    A pending row older than PENDING_TIMEOUT is taken over by the retry.
+    """
+    Key = models.IdempotencyKey
+    # An expired key is free again
+    db.query(Key).filter(Key.key == key, Key.expires_at <= now).delete(synchronize_session=False)
+    db.add(Key(
+        key=key, fingerprint=request_hash, created_at=now, expires_at=now + timedelta(seconds=KEY_TTL),
+    ))
+    try:
+        db.commit()
+        return None
+    except IntegrityError:
+        db.rollback()
+
+    record = db.get(Key, key)
+    if record is None:
+        # The owner failed and gave the key up in the meantime
+        return _claim(db, key, request_hash, now)
+    abandoned = (
+        record.status_code is None
+        and record.fingerprint == request_hash
+        and record.created_at <= now - timedelta(seconds=PENDING_TIMEOUT)
+    )
+    if abandoned:
+        # Conditional on created_at so only one retry takes the key over
+        taken = db.query(Key).filter(
+            Key.key == key, Key.status_code.is_(None), Key.created_at == record.created_at
+        ).update({
+            Key.created_at: now, Key.expires_at: now + timedelta(seconds=KEY_TTL),
+        }, synchronize_session=False)
+        db.commit()
+        if taken:
+            return None
+        # Another retry won the takeover (or the key changed): look again
+        db.expire(record)
+        return _claim(db, key, request_hash, now)
+    return record
+
+
+def _replay(db: Session, record: models.IdempotencyKey, request_hash: str) -> JSONResponse:
+    if record.fingerprint != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+    deadline = time.monotonic() + PENDING_WAIT
+    while record.status_code is None:
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        time.sleep(PENDING_POLL)
+        db.expire(record)
+        record = db.get(models.IdempotencyKey, record.key)
+        if record is None:
+            # The first request failed and gave the key up
+            raise HTTPException(status_code=409, detail="The original request with this Idempotency-Key failed; retry it")
+
+    return JSONResponse(
+        content=record.response, status_code=record.status_code, headers={REPLAYED_HEADER: "true"}
+    )
+
+
+def execute(db: Session, key: Optional[str], request: Request, operation: Callable[[], Any], payload: Any = None):
+    """
+    Runs `operation` at most once per Idempotency-Key. A repeated key gets
+    the stored result of the first call back instead of running it again.
+    Only successful results are stored: if `operation` raises, the key is
+    released so the client can retry.
+    """
+    if not key:
+        return operation()
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key longer than {MAX_KEY_LENGTH} characters")
+
+    request_hash = fingerprint(request, payload)
+    record = _claim(db, key, request_hash, datetime.now())
+    if record is not None:
+        return _replay(db, record, request_hash)
+
+    try:
+        result = operation()
+    except Exception:
+        db.rollback()
+        db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).delete(synchronize_session=False)
+        db.commit()
+        raise
+
+    db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).update({
+        models.IdempotencyKey.status_code: 200,
+        models.IdempotencyKey.response: jsonable_encoder(result),
+    }, synchronize_session=False)
+    db.commit()
+    return result
+
+
+def purge_expired(db: Session, now: Optional[datetime] = None) -> int:
+    """Deletes expired keys (an indexed range on expires_at). Returns how many."""
+    deleted = db.query(models.IdempotencyKey).filter(
+        models.IdempotencyKey.expires_at <= (now or datetime.now())
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def _purge_once() -> int:
+    db = database.SessionLocal()
+    try:
+        return purge_expired(db)
+    finally:
+        db.close()
+
+
+async def purge_scheduler(interval: int = PURGE_INTERVAL):
+    """Background loop that drops expired idempotency keys every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(_purge_once)
+        except Exception as e:
+            print(f"Error purging idempotency keys: {e}")
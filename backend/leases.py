@@ -0,0 +1,162 @@
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Query, Session
+
+from . import models, database, events, locks
+
+# Seconds a checkout holds a massa unless renewed through a heartbeat
+DEFAULT_LEASE_TTL = int(os.getenv("TDM_LEASE_TTL", "900"))
+MAX_LEASE_TTL = int(os.getenv("TDM_LEASE_MAX_TTL", str(24 * 3600)))
+
+# Seconds between sweeps for expired leases (0 disables the reaper)
+REAP_INTERVAL = int(os.getenv("TDM_LEASE_REAP_INTERVAL", "30"))
+
+# Massas returned to the pool per UPDATE statement
+REAP_BATCH_SIZE = 500
+
+# Every uvicorn worker runs the reaper; only the one holding this DB lock
+# sweeps, so each expiry is reclaimed (and recorded) once
+REAP_LOCK = "reap_leases"
+REAP_LOCK_TTL = 300
+
+# AVAILABLE ids a checkout reads before claiming one; concurrent checkouts
+# try them in random order so they rarely collide on the same row
+CHECKOUT_CANDIDATES = 20
+
+
+def lease_expiry(ttl: Optional[int] = None, now: Optional[datetime] = None) -> datetime:
+    """Expiry time for a lease granted (or renewed) now."""
+    ttl = DEFAULT_LEASE_TTL if ttl is None else min(ttl, MAX_LEASE_TTL)
+    return (now or datetime.now()) + timedelta(seconds=ttl)
+
+
+def checkout(
+    db: Session, query: Query, consumer_id: str, ttl: Optional[int] = None, criteria: Optional[str] = None
+) -> Optional[models.Massa]:
+    """
+    Claims one AVAILABLE massa from `query` and leases it to `consumer_id`.
+    The claim is a conditional UPDATE (status must still be AVAILABLE), so
+    two concurrent checkouts can never get the same massa.
+    Returns None only once no matching massa is left: if other checkouts win
+    every candidate read, the window is read again.
+    """
+    while True:
+        candidates = [massa_id for (massa_id,) in query.with_entities(models.Massa.id).limit(CHECKOUT_CANDIDATES)]
+        if not candidates:
+            return None
+        random.shuffle(candidates)
+
+        for massa_id in candidates:
+            now = datetime.now()
+            claimed = (
+                db.query(models.Massa)
+                .filter(models.Massa.id == massa_id, models.Massa.status == "AVAILABLE")
+                .update({
+                    models.Massa.status: "IN_USE",
+                    models.Massa.last_used_at: now,
+                    models.Massa.last_used_by: consumer_id,
+                    models.Massa.lease_expires_at: lease_expiry(ttl, now),
+                    # Single checkouts don't belong to a run
+                    models.Massa.run_id: None,
+                    models.Massa.checkout_criteria: criteria,
+                }, synchronize_session=False)
+            )
+            db.commit()
+            if claimed:
+                return db.get(models.Massa, massa_id)
+
+
+def reap_expired(db: Session, now: Optional[datetime] = None) -> int:
+    """
+    Returns massas whose lease expired to AVAILABLE, REAP_BATCH_SIZE at a
+    time. Only leased massas have lease_expires_at set, so the indexed
+    range lookup is empty (and cheap) when nothing has expired.
+    Returns the number of massas reclaimed (0 if another worker is
+    sweeping right now).
+    """
+    token = locks.acquire(db, REAP_LOCK, REAP_LOCK_TTL)
+    if token is None:
+        return 0
+    try:
+        return _reap(db, now or datetime.now())
+    finally:
+        locks.release(db, REAP_LOCK, token)
+
+
+def _reap(db: Session, now: datetime) -> int:
+    reclaimed = 0
+
+    while True:
+        expired = (
+            db.query(
+                models.Massa.id, models.Massa.status, models.Massa.last_used_by,
+                models.Massa.last_used_at, models.Massa.run_id, models.Massa.checkout_criteria,
+            )
+            # Filter on the lease column alone so the planner uses its index;
+            # every transition out of IN_USE clears lease_expires_at
+            .filter(models.Massa.lease_expires_at <= now)
+            .limit(REAP_BATCH_SIZE)
+            .all()
+        )
+        if not expired:
+            return reclaimed
+
+        ids = [row.id for row in expired]
+        # Re-check the expiry: a heartbeat may have renewed one in between.
+        # RETURNING tells which rows this UPDATE actually reclaimed.
+        updated = {
+            massa_id for (massa_id,) in db.execute(
+                update(models.Massa)
+                .where(
+                    models.Massa.id.in_(ids),
+                    models.Massa.status == "IN_USE",
+                    models.Massa.lease_expires_at <= now,
+                )
+                .values(status="AVAILABLE", lease_expires_at=None, run_id=None)
+                .returning(models.Massa.id)
+                .execution_options(synchronize_session=False)
+            )
+        }
+        # Drop leases left on massas that are no longer IN_USE, so they
+        # aren't selected again on the next pass
+        db.query(models.Massa).filter(
+            models.Massa.id.in_(ids), models.Massa.status != "IN_USE"
+        ).update({models.Massa.lease_expires_at: None}, synchronize_session=False)
+        db.commit()
+        reclaimed += len(updated)
+
+        for row in expired:
+            if row.id not in updated:
+                continue
+            details = {"run_id": row.run_id} if row.run_id else None
+            events.recorder.record(
+                events.EXPIRE, massa_id=row.id, consumer_id=row.last_used_by,
+                criteria=row.checkout_criteria, held_since=row.last_used_at, details=details,
+            )
+        if len(expired) < REAP_BATCH_SIZE:
+            return reclaimed
+
+
+def _reap_once() -> int:
+    db = database.SessionLocal()
+    try:
+        return reap_expired(db)
+    finally:
+        db.close()
+
+
+async def reaper_scheduler(interval: int = REAP_INTERVAL):
+    """Background loop that reclaims expired leases every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            reclaimed = await asyncio.to_thread(_reap_once)
+            if reclaimed:
+                print(f"[TDM] {reclaimed} massas com reserva expirada devolvidas ao pool")
+        except Exception as e:
+            print(f"Error reaping expired leases: {e}")
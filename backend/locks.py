@@ -0,0 +1,41 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+def acquire(db: Session, name: str, ttl: int) -> Optional[str]:
+    """
+    Takes the lock `name` for up to `ttl` seconds across every worker and
+    process sharing the database. Returns a token for release(), or None
+    if someone else holds it. A lock whose holder died frees up after `ttl`.
+    """
+    Lock = models.SchedulerLock
+    token = uuid.uuid4().hex
+    now = datetime.now()
+    expires_at = now + timedelta(seconds=ttl)
+
+    db.add(Lock(name=name, holder=token, expires_at=expires_at))
+    try:
+        db.commit()
+        return token
+    except IntegrityError:
+        db.rollback()
+
+    # The row exists: take it over only if it expired (conditional UPDATE)
+    taken = db.query(Lock).filter(Lock.name == name, Lock.expires_at <= now).update(
+        {Lock.holder: token, Lock.expires_at: expires_at}, synchronize_session=False
+    )
+    db.commit()
+    return token if taken else None
+
+
+def release(db: Session, name: str, token: str):
+    """Releases the lock if `token` still holds it."""
+    Lock = models.SchedulerLock
+    db.query(Lock).filter(Lock.name == name, Lock.holder == token).delete(synchronize_session=False)
+    db.commit()
@@ -1,28 +1,50 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+# Imported first so the startup clock also covers the imports below
+from .profiling import profile, FirstRequestTimer
+
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, Request, Response, Header
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
+from sqlalchemy import func, case
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Union
 from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
 
-from . import models, schemas, database, config
-
-models.Base.metadata.create_all(bind=database.engine)
+from . import models, schemas, database, config, generator, events, search, schema, runs, filters, leases, idempotency, sync
 
-app = FastAPI(title="TDM - Test Data Management")
+profile.mark("imports")
 
 # Define frontend path
 FRONTEND_PATH = Path(__file__).parent.parent / "frontend"
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+router = APIRouter()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema checks run before serving but are skipped when the database
+    # already reports the current schema version.
+    migrated = await asyncio.to_thread(schema.ensure_schema, database.get_engine())
+    profile.mark("schema" if migrated else "schema_check")
+
+    # Keep references so the tasks are not garbage collected
+    tasks = [asyncio.create_task(events.flush_scheduler())]
+    if generator.REPLENISH_INTERVAL > 0:
+        tasks.append(asyncio.create_task(generator.replenish_scheduler()))
+    if leases.REAP_INTERVAL > 0:
+        tasks.append(asyncio.create_task(leases.reaper_scheduler()))
+    if idempotency.PURGE_INTERVAL > 0:
+        tasks.append(asyncio.create_task(idempotency.purge_scheduler()))
+    profile.mark("background_tasks")
+    profile.mark_ready()
+
+    yield
+
+    for task in tasks:
+        task.cancel()
+    events.recorder.flush()
 
 # Dependency
 def get_db():
@@ -32,7 +54,7 @@ def get_db():
     finally:
         db.close()
 
-@app.post("/massas/", response_model=schemas.Massa)
+@router.post("/massas/", response_model=schemas.Massa)
 def create_massa(massa: schemas.MassaCreate, db: Session = Depends(get_db)):
     db_massa = models.Massa(**massa.dict())
     db.add(db_massa)
@@ -40,98 +62,222 @@ def create_massa(massa: schemas.MassaCreate, db: Session = Depends(get_db)):
     db.refresh(db_massa)
     return db_massa
 
-@app.get("/massas/", response_model=List[schemas.Massa])
+@router.get("/massas/", response_model=Union[List[schemas.Massa], schemas.MassaDelta])
 def read_massas(
+    request: Request,
     skip: int = 0, 
     limit: int = 10000,  # Increased to support larger datasets
     region: Optional[str] = None,
     status: Optional[str] = None,
-    uc_status: Optional[str] = None,
+    uc_status: Optional[str] = None,  # ligada, desligada or suspensa (at least one UC)
     financial_status: Optional[str] = None, 
+    document_type: Optional[str] = None,
+    tags: Optional[str] = None,  # Comma-separated; massa must have every tag
+    q: Optional[str] = None,  # Substring of nome or document_number (masks are ignored)
+    where: List[str] = Query([]),  # Counter predicates, e.g. uc_ligada>=2,fat_vencidas>0
+    updated_since: Optional[datetime] = None,  # Delta sync cursor (see below)
+    after_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
+    """
+    Lists massas. Besides the parameters below, every uc_*/fat_* counter
+    accepts min_<counter>, max_<counter>, <counter>=N and <counter>>=N.
+
+    With updated_since the response is a delta instead (schemas.MassaDelta):
+    massas changed since then plus tombstones for deleted ids, and the
+    cursor to send next time. Start with updated_since=1970-01-01.
+    """
+    try:
+        bounds_min, bounds_max = filters.counter_bounds(request.query_params, where)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    criteria = schemas.MassaCriteria(
+        region=region, financial_status=financial_status, document_type=document_type,
+        tags=filters.split_tags(tags), min=bounds_min, max=bounds_max
+    )
+
+    if updated_since is not None:
+        # A filtered delta can't report massas that stopped matching the filter
+        filtered = any(value is not None for value in filters.criteria_fields(criteria).values())
+        if q or status or uc_status or filtered:
+            raise HTTPException(status_code=400, detail="updated_since cannot be combined with filters")
+        return sync.delta(db, updated_since, after_id, limit)
+
     query = db.query(models.Massa)
-    if region:
-        query = query.filter(models.Massa.region == region)
+    if q:
+        query = search.apply_search(query, q)
     if status:
         query = query.filter(models.Massa.status == status)
-    if uc_status:
-        query = query.filter(models.Massa.uc_status == uc_status)
-    if financial_status:
-        query = query.filter(models.Massa.financial_status == financial_status)
+    query = filters.apply_criteria(query, criteria)
         
     return query.offset(skip).limit(limit).all()
 
-@app.get("/massas/{massa_id}", response_model=schemas.Massa)
+@router.get("/massas/{massa_id}", response_model=schemas.Massa)
 def read_massa(massa_id: int, db: Session = Depends(get_db)):
     db_massa = db.query(models.Massa).filter(models.Massa.id == massa_id).first()
     if db_massa is None:
         raise HTTPException(status_code=404, detail="Massa not found")
     return db_massa
 
-@app.put("/massas/{massa_id}", response_model=schemas.Massa)
-def update_massa(massa_id: int, massa_update: schemas.MassaUpdate, db: Session = Depends(get_db)):
+@router.put("/massas/{massa_id}", response_model=schemas.Massa)
+def update_massa(
+    massa_id: int,
+    massa_update: schemas.MassaUpdate,
+    ttl: Optional[int] = Query(None, gt=0),  # Lease seconds when setting IN_USE
+    consumer_id: Optional[str] = None,  # Lease holder when setting IN_USE
+    db: Session = Depends(get_db)
+):
+    """
+    Setting status to IN_USE with a ttl or consumer_id leases the massa like
+    a checkout does, so a reservation made here is reclaimed too if its
+    holder disappears. Without either (e.g. marked by hand in the dashboard,
+    which can't send heartbeats) the massa stays IN_USE until changed again.
+    """
     db_massa = db.query(models.Massa).filter(models.Massa.id == massa_id).first()
     if not db_massa:
         raise HTTPException(status_code=404, detail="Massa not found")
     
+    previous_status = db_massa.status
     update_data = massa_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_massa, key, value)
+
+    new_status = update_data.get("status")
+    if new_status and new_status != previous_status:
+        if new_status == "IN_USE" and consumer_id:
+            db_massa.last_used_by = consumer_id
+        events.recorder.record_status_change(db_massa, new_status, previous_status)
+        # A status change ends any run allocation, so the run can't release
+        # or renew the massa once someone else holds it
+        db_massa.run_id = None
+        if new_status == "IN_USE":
+            db_massa.last_used_at = datetime.now()
+            leased = ttl is not None or consumer_id is not None
+            db_massa.lease_expires_at = leases.lease_expiry(ttl, db_massa.last_used_at) if leased else None
+            db_massa.checkout_criteria = None  # Reserved by id, not by criteria
+        else:
+            db_massa.lease_expires_at = None
     
     db.commit()
     db.refresh(db_massa)
     return db_massa
 
-@app.post("/massas/checkout", response_model=schemas.Massa)
+@router.post("/massas/checkout", response_model=schemas.Massa)
 def checkout_massa(
+    request: Request,
     region: Optional[str] = None,
-    uc_status: Optional[str] = None,
+    uc_status: Optional[str] = None,  # ligada, desligada or suspensa (at least one UC)
     financial_status: Optional[str] = None,
+    document_type: Optional[str] = None,
+    tags: Optional[str] = None,  # Comma-separated; massa must have every tag
+    where: List[str] = Query([]),  # Counter predicates, e.g. uc_ligada>=2,fat_renegociacao=0
     consumer_id: str = "automated_test",
+    ttl: Optional[int] = Query(None, gt=0),  # Lease seconds (default TDM_LEASE_TTL)
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """
     Finds a FREE massa matching criteria, marks it IN_USE, and returns it.
-    This is atomic for the user.
+    This is atomic for the user. Counter predicates work as in GET /massas.
+
+    The massa is leased: unless renewed through /massas/{id}/heartbeat it
+    goes back to AVAILABLE once lease_expires_at passes.
+
+    Send an Idempotency-Key header to make retries safe: a repeated key
+    returns the massa from the first call instead of leasing another one.
     """
+    try:
+        bounds_min, bounds_max = filters.counter_bounds(request.query_params, where)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    criteria = schemas.MassaCriteria(
+        region=region, financial_status=financial_status, document_type=document_type,
+        tags=filters.split_tags(tags), min=bounds_min, max=bounds_max
+    )
+
     query = db.query(models.Massa).filter(models.Massa.status == "AVAILABLE")
-    
-    if region:
-        query = query.filter(models.Massa.region == region)
-    if uc_status:
-        query = query.filter(models.Massa.uc_status == uc_status)
-    if financial_status:
-        query = query.filter(models.Massa.financial_status == financial_status)
-        
-    # Get the first match
-    db_massa = query.first()
-    
-    if not db_massa:
-        raise HTTPException(status_code=404, detail="No available massa found for criteria")
-        
-    db_massa.status = "IN_USE"
-    db_massa.last_used_at = datetime.now()
-    db_massa.last_used_by = consumer_id
-    db.commit()
-    db.refresh(db_massa)
-    return db_massa
+    query = filters.apply_criteria(query, criteria)
+
+    def checkout():
+        criteria_key = events.criteria_key(**filters.criteria_fields(criteria))
+        db_massa = leases.checkout(db, query, consumer_id, ttl, criteria_key)
+
+        if not db_massa:
+            events.recorder.record(events.EXHAUSTED, consumer_id=consumer_id, criteria=criteria_key)
+            raise HTTPException(status_code=404, detail="No available massa found for criteria")
+
+        events.recorder.record(events.CHECKOUT, massa_id=db_massa.id, consumer_id=consumer_id, criteria=criteria_key)
+        return schemas.Massa.model_validate(db_massa)
+
+    return idempotency.execute(db, idempotency_key, request, checkout)
 
-@app.post("/massas/{massa_id}/release")
-def release_massa(massa_id: int, new_status: str = "AVAILABLE", db: Session = Depends(get_db)):
+@router.post("/massas/{massa_id}/release")
+def release_massa(
+    request: Request,
+    massa_id: int,
+    new_status: str = "AVAILABLE",
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    With an Idempotency-Key, a retried release is answered from the first
+    call, so it can't free the massa again after someone else checked it out.
+    """
+    def release():
+        db_massa = db.query(models.Massa).filter(models.Massa.id == massa_id).first()
+        if not db_massa:
+            raise HTTPException(status_code=404, detail="Massa not found")
+
+        previous_status = db_massa.status
+        db_massa.status = new_status
+        db_massa.lease_expires_at = None
+        db_massa.run_id = None
+        db.commit()
+        events.recorder.record_status_change(db_massa, new_status, previous_status)
+        return {"message": f"Massa {massa_id} released as {new_status}"}
+
+    return idempotency.execute(db, idempotency_key, request, release)
+
+@router.post("/massas/{massa_id}/heartbeat", response_model=schemas.Lease)
+def heartbeat_massa(
+    massa_id: int,
+    ttl: Optional[int] = Query(None, gt=0),
+    consumer_id: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Renews the lease of a checked out massa for another `ttl` seconds."""
     db_massa = db.query(models.Massa).filter(models.Massa.id == massa_id).first()
     if not db_massa:
         raise HTTPException(status_code=404, detail="Massa not found")
-        
-    db_massa.status = new_status
+    if db_massa.status != "IN_USE" or db_massa.lease_expires_at is None:
+        # Already released, or the reaper reclaimed it
+        raise HTTPException(status_code=409, detail="Massa is not leased")
+    if consumer_id and db_massa.last_used_by != consumer_id:
+        raise HTTPException(status_code=409, detail="Massa is leased by another consumer")
+
+    db_massa.lease_expires_at = leases.lease_expiry(ttl)
     db.commit()
-    return {"message": f"Massa {massa_id} released as {new_status}"}
+    return {"id": db_massa.id, "lease_expires_at": db_massa.lease_expires_at}
 
-@app.post("/massas/upload-csv")
+@router.post("/massas/leases/reap")
+def reap_leases(db: Session = Depends(get_db)):
+    """Returns every massa whose lease expired to the pool right away."""
+    reclaimed = leases.reap_expired(db)
+    return {"message": f"{reclaimed} expired leases reclaimed", "reclaimed": reclaimed}
+
+@router.post("/massas/upload-csv")
 def upload_csv(massas: List[schemas.MassaCreate], db: Session = Depends(get_db)):
     """
     Bulk create massas. Skips duplicates based on document_number.
+    The dashboard sends large imports as several batches, so this is safe
+    to call again with a batch that was already (partially) imported.
     """
+    docs = {massa.document_number for massa in massas}
+    existing = {
+        doc for (doc,) in
+        db.query(models.Massa.document_number).filter(models.Massa.document_number.in_(docs))
+    }
+
     count = 0
     skipped = 0
     seen_docs = set()
@@ -139,54 +285,258 @@ def upload_csv(massas: List[schemas.MassaCreate], db: Session = Depends(get_db))
     for massa in massas:
         doc_num = massa.document_number
         
-        # Skip if we've already seen this document in this batch
-        if doc_num in seen_docs:
+        # Skip if already in the database or seen earlier in this batch
+        if doc_num in existing or doc_num in seen_docs:
             skipped += 1
             continue
         seen_docs.add(doc_num)
-        
-        # Check if exists in database
-        exists = db.query(models.Massa).filter(models.Massa.document_number == doc_num).first()
-        if exists:
-            skipped += 1
-            continue
             
         db_massa = models.Massa(**massa.dict())
         db.add(db_massa)
         count += 1
     
     db.commit()
-    return {"message": f"Importados {count} itens. {skipped} duplicados ignorados."}
+    return {
+        "message": f"Importados {count} itens. {skipped} duplicados ignorados.",
+        "created": count,
+        "skipped": skipped,
+    }
 
-@app.delete("/massas/all")
+@router.post("/massas/generate")
+def generate_massas(spec: schemas.GenerateRequest, db: Session = Depends(get_db)):
+    """
+    Generates synthetic massas with valid CPF/CNPJ check digits.
+    Document numbers already in the database are never reused.
+    """
+    if spec.document_type not in ("CPF", "CNPJ"):
+        raise HTTPException(status_code=400, detail="document_type must be CPF or CNPJ")
+    unknown = set(spec.counters) - set(schemas.COUNTER_COLUMNS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown counter columns: {sorted(unknown)}")
+
+    created = generator.generate_massas(db, spec)
+    return {"message": f"Geradas {created} massas {spec.document_type}.", "created": created}
+
+@router.post("/massas/replenish")
+def replenish_massas(db: Session = Depends(get_db)):
+    """Applies the replenish rules from settings immediately."""
+    return {"replenished": generator.replenish_pool(db)}
+
+@router.delete("/massas/all")
 def delete_all_massas(db: Session = Depends(get_db)):
     """Delete all massas from the database"""
+    sync.record_tombstones(db)
     count = db.query(models.Massa).delete()
     db.commit()
     return {"message": f"Deleted {count} massas"}
 
-@app.delete("/massas/{massa_id}")
+@router.delete("/massas/{massa_id}")
 def delete_massa(massa_id: int, db: Session = Depends(get_db)):
     """Delete a single massa by ID"""
     db_massa = db.query(models.Massa).filter(models.Massa.id == massa_id).first()
     if not db_massa:
         raise HTTPException(status_code=404, detail="Massa not found")
     
-    db.delete(db_massa)
-    db.commit()
+    sync.record_tombstones(db, models.Massa.id == massa_id)
     db.delete(db_massa)
     db.commit()
     return {"message": f"Massa {massa_id} deleted"}
 
-@app.get("/settings")
-def get_settings():
-    return config.load_settings()
+@router.post("/runs", response_model=schemas.RunAllocation)
+def create_run(
+    request: Request,
+    run_request: schemas.RunCreate,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Allocates every line of a manifest (criteria -> count) in one
+    transaction. Either the whole run gets its massas or none are taken.
+    A repeated Idempotency-Key returns the run allocated by the first call.
+    """
+    def allocate():
+        try:
+            run, plan = runs.allocate_run(db, run_request)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except runs.RunInfeasible as e:
+            raise HTTPException(status_code=409, detail={"message": str(e), "shortages": e.shortages})
+
+        massas = db.query(models.Massa).filter(models.Massa.run_id == run.id).all()
+        return schemas.RunAllocation.model_validate(
+            {"run": run, "lines": plan, "massas": massas}, from_attributes=True
+        )
+
+    return idempotency.execute(db, idempotency_key, request, allocate, payload=run_request)
+
+@router.get("/runs/{run_id}", response_model=schemas.RunAllocation)
+def read_run(run_id: str, db: Session = Depends(get_db)):
+    run = db.query(models.Run).filter(models.Run.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    massas = db.query(models.Massa).filter(models.Massa.run_id == run.id).all()
+    lines = [line.get("massa_ids", []) for line in run.manifest]
+    return {"run": run, "lines": lines, "massas": massas}
+
+@router.post("/runs/{run_id}/release")
+def release_run(
+    request: Request,
+    run_id: str,
+    new_status: str = "AVAILABLE",
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Returns (or consumes/blocks) every massa of the run in one update."""
+    def release():
+        run = db.query(models.Run).filter(models.Run.id == run_id).first()
+        if not run:
+            raise HTTPException(status_code=404, detail="Run not found")
+        released = runs.release_run(db, run, new_status)
+        return {"message": f"Run {run_id}: {released} massas released as {new_status}", "released": released}
+
+    return idempotency.execute(db, idempotency_key, request, release)
+
+@router.post("/runs/{run_id}/heartbeat")
+def heartbeat_run(run_id: str, ttl: Optional[int] = Query(None, gt=0), db: Session = Depends(get_db)):
+    """Renews the lease of every massa the run still holds."""
+    run = db.query(models.Run).filter(models.Run.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    renewed = runs.renew_run(db, run, ttl)
+    return {"renewed": renewed}
+
+@router.get("/events", response_model=List[schemas.MassaEvent])
+def read_events(
+    massa_id: Optional[int] = None,
+    consumer_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    criteria: Optional[str] = None,
+    since: Optional[datetime] = None,
+    limit: int = Query(1000, le=10000),
+    db: Session = Depends(get_db)
+):
+    """Reservation events, newest first."""
+    events.recorder.flush()
+    query = db.query(models.MassaEvent)
+    if massa_id is not None:
+        query = query.filter(models.MassaEvent.massa_id == massa_id)
+    if consumer_id:
+        query = query.filter(models.MassaEvent.consumer_id == consumer_id)
+    if event_type:
+        query = query.filter(models.MassaEvent.event_type == event_type)
+    if criteria:
+        query = query.filter(models.MassaEvent.criteria == criteria)
+    if since:
+        query = query.filter(models.MassaEvent.created_at >= since)
+    return query.order_by(models.MassaEvent.created_at.desc()).limit(limit).all()
+
+@router.get("/events/stats/consumers", response_model=List[schemas.ConsumerStats])
+def consumer_stats(since: Optional[datetime] = None, db: Session = Depends(get_db)):
+    """Checkouts and hold times per consumer, longest average hold first."""
+    events.recorder.flush()
+    Event = models.MassaEvent
+    query = db.query(
+        Event.consumer_id,
+        func.sum(case((Event.event_type == events.CHECKOUT, 1), else_=0)).label("checkouts"),
+        func.sum(case((Event.event_type.in_(events.END_EVENTS), 1), else_=0)).label("releases"),
+        func.avg(Event.held_seconds).label("avg_held_seconds"),
+        func.max(Event.held_seconds).label("max_held_seconds"),
+    ).filter(Event.event_type.in_((events.CHECKOUT,) + events.END_EVENTS))
+    if since:
+        query = query.filter(Event.created_at >= since)
+    rows = query.group_by(Event.consumer_id).order_by(func.avg(Event.held_seconds).desc()).all()
+    return [schemas.ConsumerStats(**row._asdict()) for row in rows]
+
+@router.get("/events/stats/criteria", response_model=List[schemas.CriteriaStats])
+def criteria_stats(since: Optional[datetime] = None, db: Session = Depends(get_db)):
+    """
+    Checkouts, pool exhaustion and hold times per checkout criteria, most
+    exhausted first. End events (release, consume, block, expire) carry the
+    criteria of the checkout they end.
+    """
+    events.recorder.flush()
+    Event = models.MassaEvent
+    exhausted = func.sum(case((Event.event_type == events.EXHAUSTED, 1), else_=0))
+    query = db.query(
+        Event.criteria,
+        func.sum(case((Event.event_type == events.CHECKOUT, 1), else_=0)).label("checkouts"),
+        exhausted.label("exhausted"),
+        func.max(case((Event.event_type == events.EXHAUSTED, Event.created_at))).label("last_exhausted_at"),
+        func.sum(case((Event.event_type.in_(events.END_EVENTS), 1), else_=0)).label("releases"),
+        func.avg(Event.held_seconds).label("avg_held_seconds"),
+        func.max(Event.held_seconds).label("max_held_seconds"),
+    ).filter(Event.event_type.in_((events.CHECKOUT, events.EXHAUSTED) + events.END_EVENTS))
+    if since:
+        query = query.filter(Event.created_at >= since)
+    rows = query.group_by(Event.criteria).order_by(exhausted.desc()).all()
+    return [schemas.CriteriaStats(**row._asdict()) for row in rows]
+
+def _settings_etag(version: int) -> str:
+    return f'"settings-v{version}"'
+
+@router.get("/settings", response_model=config.Settings)
+def get_settings(request: Request, response: Response):
+    """Served from the in-process cache; supports If-None-Match (304)."""
+    settings, version = config.get_settings()
+    etag = _settings_etag(version)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return settings
+
+@router.post("/settings", response_model=config.Settings)
+def update_settings(settings: config.Settings, response: Response, if_match: Optional[str] = Header(None)):
+    """
+    Replaces the settings. Send the ETag from GET /settings as If-Match to
+    avoid overwriting someone else's edit: a stale ETag gets 412.
+    """
+    expected_version = None
+    if if_match and if_match.strip() != "*":
+        tag = if_match.strip().removeprefix("W/").strip('"')
+        if not tag.startswith("settings-v") or not tag[len("settings-v"):].isdigit():
+            raise HTTPException(status_code=400, detail="Invalid If-Match header")
+        expected_version = int(tag[len("settings-v"):])
 
-@app.post("/settings")
-def update_settings(settings: config.Settings):
-    config.save_settings(settings)
+    try:
+        version = config.save_settings(settings, expected_version)
+    except config.SettingsConflict as e:
+        raise HTTPException(
+            status_code=412,
+            detail={"message": "Settings were changed by someone else", "version": e.current_version},
+        )
+    response.headers["ETag"] = _settings_etag(version)
     return settings
 
-# Serve static files from the frontend directory
-# This MUST be the last route/mount to avoid overlapping with API endpoints
-app.mount("/", StaticFiles(directory=FRONTEND_PATH, html=True), name="static")
+@router.get("/health")
+def health():
+    """Cheap liveness probe (no database access)."""
+    return {"status": "ok"}
+
+@router.get("/health/startup")
+def startup_report():
+    """Cold start timeline: startup phases and time to the first request."""
+    return profile.report()
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="TDM - Test Data Management", lifespan=lifespan)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag", idempotency.REPLAYED_HEADER],
+    )
+    app.add_middleware(FirstRequestTimer)
+    app.include_router(router)
+
+    # Serve static files from the frontend directory
+    # This MUST be the last route/mount to avoid overlapping with API endpoints
+    app.mount("/", StaticFiles(directory=FRONTEND_PATH, html=True), name="static")
+
+    profile.mark("create_app")
+    return app
+
+app = create_app()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, JSON, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, JSON, DateTime, Float, Index
 from sqlalchemy.sql import func
 from .database import Base
 import datetime
@@ -40,3 +40,96 @@ class Massa(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_used_at = Column(DateTime(timezone=True), nullable=True)
     last_used_by = Column(String, nullable=True) # Session ID or Test Name
+    run_id = Column(String, index=True, nullable=True) # Set while allocated to a run manifest
+    lease_expires_at = Column(DateTime(timezone=True), index=True, nullable=True) # Set while checked out
+    checkout_criteria = Column(String, nullable=True) # events.criteria_key of the last checkout, copied onto its end event
+    # Set by SQLAlchemy on every insert/update (ORM and bulk query.update alike);
+    # delta sync (GET /massas/?updated_since=) reads changes through its index
+    updated_at = Column(DateTime(timezone=True), default=datetime.datetime.now, onupdate=datetime.datetime.now)
+
+    # Counter range predicates (e.g. uc_ligada>=2) are almost always combined
+    # with a status filter (checkout only looks at AVAILABLE massas)
+    __table_args__ = (
+        Index("ix_massas_status_uc_ligada", "status", "uc_ligada"),
+        Index("ix_massas_status_uc_desligada", "status", "uc_desligada"),
+        Index("ix_massas_status_uc_suspensa", "status", "uc_suspensa"),
+        Index("ix_massas_status_fat_vencidas", "status", "fat_vencidas"),
+        Index("ix_massas_status_fat_a_vencer", "status", "fat_a_vencer"),
+        Index("ix_massas_status_fat_pagas", "status", "fat_pagas"),
+        Index("ix_massas_status_fat_boleto_unico", "status", "fat_boleto_unico"),
+        Index("ix_massas_status_fat_multifaturas", "status", "fat_multifaturas"),
+        Index("ix_massas_status_fat_renegociacao", "status", "fat_renegociacao"),
+        # Delta sync pages through changes ordered by (updated_at, id)
+        Index("ix_massas_updated_at_id", "updated_at", "id"),
+    )
+
+
+class MassaTombstone(Base):
+    """Ids of deleted massas, so delta sync clients can drop them from their cache."""
+    __tablename__ = "massa_tombstones"
+
+    massa_id = Column(Integer, primary_key=True) # No FK: the massa is gone
+    deleted_at = Column(DateTime(timezone=True), index=True, nullable=False)
+
+
+class MassaEvent(Base):
+    """Append-only log of reservation events (checkout, release, consume, ...)."""
+    __tablename__ = "massa_events"
+
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String, nullable=False) # CHECKOUT, RELEASE, CONSUME, BLOCK, EXPIRE, EXHAUSTED
+    massa_id = Column(Integer, index=True, nullable=True) # No FK: events outlive deleted massas
+    consumer_id = Column(String, nullable=True)
+    criteria = Column(String, nullable=True) # Canonical checkout criteria, e.g. "region=NE"
+    held_seconds = Column(Float, nullable=True) # Set on events that end a reservation
+    details = Column(JSON, default={})
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_massa_events_type_created", "event_type", "created_at"),
+        Index("ix_massa_events_consumer_created", "consumer_id", "created_at"),
+        Index("ix_massa_events_criteria_created", "criteria", "created_at"),
+    )
+
+
+class Run(Base):
+    """A test run that allocated a manifest of massas in one transaction."""
+    __tablename__ = "runs"
+
+    id = Column(String, primary_key=True)
+    consumer_id = Column(String, nullable=True)
+    manifest = Column(JSON, default=[])
+    status = Column(String, default="ACTIVE") # ACTIVE, RELEASED
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    released_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class AppSettings(Base):
+    """Dashboard/app settings, a single versioned row (id = 1)."""
+    __tablename__ = "app_settings"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False) # Bumped on every write (optimistic concurrency)
+    data = Column(JSON, default={})
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class IdempotencyKey(Base):
+    """Stored result of a checkout/release sent with an Idempotency-Key header."""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False) # Hash of method, path, query and body
+    status_code = Column(Integer, nullable=True) # NULL while the first request is still running
+    response = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), index=True, nullable=False)
+
+
+class SchedulerLock(Base):
+    """Named lock shared by every worker, e.g. so only one replenishes the pool at a time."""
+    __tablename__ = "scheduler_locks"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False) # Random token of the worker holding it
+    expires_at = Column(DateTime(timezone=True), nullable=False) # Taken over after this, if the holder died
@@ -0,0 +1,62 @@
+import time
+from typing import List, Optional
+
+# Taken when the backend package is first imported, i.e. as early as possible
+_STARTED = time.perf_counter()
+
+
+class StartupProfile:
+    """
+    Timeline of a cold start: how long each startup phase took and how
+    long until the first request was answered.
+    """
+
+    def __init__(self):
+        self.started = _STARTED
+        self.last = _STARTED
+        self.phases: List[dict] = []
+        self.ready_ms: Optional[float] = None
+        self.first_request_ms: Optional[float] = None
+        self.first_request_path: Optional[str] = None
+
+    def _elapsed_ms(self, since: float) -> float:
+        return round((time.perf_counter() - since) * 1000, 1)
+
+    def mark(self, phase: str):
+        """Records the time spent since the previous mark under `phase`."""
+        self.phases.append({"phase": phase, "ms": self._elapsed_ms(self.last)})
+        self.last = time.perf_counter()
+
+    def mark_ready(self):
+        self.ready_ms = self._elapsed_ms(self.started)
+        print(f"[TDM] Startup: {self.ready_ms} ms " + ", ".join(f"{p['phase']}={p['ms']}ms" for p in self.phases))
+
+    def mark_first_request(self, path: str):
+        if self.first_request_ms is None:
+            self.first_request_ms = self._elapsed_ms(self.started)
+            self.first_request_path = path
+
+    def report(self) -> dict:
+        return {
+            "phases": self.phases,
+            "ready_ms": self.ready_ms,
+            "first_request_ms": self.first_request_ms,
+            "first_request_path": self.first_request_path,
+        }
+
+
+profile = StartupProfile()
+
+
+class FirstRequestTimer:
+    """ASGI middleware that records when the first HTTP response completes."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if profile.first_request_ms is not None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+        profile.mark_first_request(scope["path"])
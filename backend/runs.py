@@ -0,0 +1,185 @@
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from . import models, schemas, filters, events, leases
+
+
+class RunInfeasible(Exception):
+    """The pool can't satisfy the manifest; nothing was allocated."""
+
+    def __init__(self, shortages: List[dict]):
+        super().__init__("Manifest cannot be satisfied")
+        self.shortages = shortages
+
+
+def _candidate_ids(db: Session, line: schemas.ManifestLine, limit: int) -> List[int]:
+    query = db.query(models.Massa.id).filter(models.Massa.status == "AVAILABLE")
+    query = filters.apply_criteria(query, line)
+    # Lock the candidates where the database supports it (ignored by SQLite)
+    query = query.order_by(models.Massa.id).limit(limit).with_for_update(skip_locked=True)
+    return [massa_id for (massa_id,) in query]
+
+
+def _augment(line: int, candidates: List[List[int]], owner: Dict[int, int]) -> bool:
+    """
+    Gives `line` one more massa, reassigning massas between lines along an
+    augmenting path (breadth first) if every candidate is already taken.
+    Returns False if no assignment can make room for it.
+    """
+    parent: Dict[int, Optional[int]] = {}
+    queue = deque()
+    for massa_id in candidates[line]:
+        if massa_id not in parent:
+            parent[massa_id] = None
+            queue.append(massa_id)
+
+    while queue:
+        massa_id = queue.popleft()
+        holder = owner.get(massa_id)
+        if holder is None:
+            # Walk back: every massa on the path moves to the line that
+            # reached it, and `line` takes the first one
+            while massa_id is not None:
+                previous = parent[massa_id]
+                owner[massa_id] = line if previous is None else owner[previous]
+                massa_id = previous
+            return True
+        if holder == line:
+            continue
+        for other in candidates[holder]:
+            if other not in parent:
+                parent[other] = massa_id
+                queue.append(other)
+    return False
+
+
+def match_lines(candidates: List[List[int]], counts: List[int]) -> List[List[int]]:
+    """
+    Bipartite matching of massas to manifest lines: line i gets counts[i]
+    of its candidates[i] and no massa goes to two lines. Finds an
+    allocation whenever one exists. Raises RunInfeasible otherwise.
+    """
+    owner: Dict[int, int] = {}
+    shortages = []
+    for line, count in enumerate(counts):
+        granted = 0
+        while granted < count and _augment(line, candidates, owner):
+            granted += 1
+        if granted < count:
+            shortages.append({"line": line, "requested": count, "available": granted})
+    if shortages:
+        raise RunInfeasible(shortages)
+
+    allocation: List[List[int]] = [[] for _ in counts]
+    for massa_id, line in owner.items():
+        allocation[line].append(massa_id)
+    return [sorted(line_ids) for line_ids in allocation]
+
+
+def plan_allocation(db: Session, lines: List[schemas.ManifestLine]) -> List[List[int]]:
+    """
+    Picks massa ids for every manifest line without giving one massa to two lines.
+
+    Each line only needs `count + (sum of other counts)` candidates: the
+    other lines can take at most that many of them.
+    """
+    total = sum(line.count for line in lines)
+    candidates = [_candidate_ids(db, line, total) for line in lines]
+    return match_lines(candidates, [line.count for line in lines])
+
+
+def allocate_run(db: Session, request: schemas.RunCreate):
+    """
+    Allocates the whole manifest in one transaction, all or nothing.
+    Returns (run, per-line massa ids).
+    """
+    try:
+        plan = plan_allocation(db, request.lines)
+        massa_ids = [massa_id for line_ids in plan for massa_id in line_ids]
+
+        run = models.Run(
+            id=uuid.uuid4().hex,
+            consumer_id=request.consumer_id,
+            # Each line keeps the ids it was given, so the run can be read back later
+            manifest=[{**line.dict(), "massa_ids": ids} for line, ids in zip(request.lines, plan)],
+            status="ACTIVE",
+        )
+        db.add(run)
+
+        now = datetime.now()
+        updated = 0
+        # One UPDATE per line so each massa remembers the criteria it was taken for
+        for line, line_ids in zip(request.lines, plan):
+            updated += (
+                db.query(models.Massa)
+                .filter(models.Massa.id.in_(line_ids), models.Massa.status == "AVAILABLE")
+                .update({
+                    models.Massa.status: "IN_USE",
+                    models.Massa.run_id: run.id,
+                    models.Massa.last_used_at: now,
+                    models.Massa.last_used_by: request.consumer_id,
+                    models.Massa.lease_expires_at: leases.lease_expiry(request.ttl, now),
+                    models.Massa.checkout_criteria: events.criteria_key(**filters.criteria_fields(line)),
+                }, synchronize_session=False)
+            )
+        if updated != len(massa_ids):
+            # A concurrent checkout took some of the planned massas
+            raise RunInfeasible([{"line": None, "requested": len(massa_ids), "available": updated}])
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    for line, line_ids in zip(request.lines, plan):
+        criteria = events.criteria_key(**filters.criteria_fields(line))
+        for massa_id in line_ids:
+            events.recorder.record(
+                events.CHECKOUT, massa_id=massa_id, consumer_id=request.consumer_id,
+                criteria=criteria, details={"run_id": run.id},
+            )
+    return run, plan
+
+
+def release_run(db: Session, run: models.Run, new_status: str = "AVAILABLE") -> int:
+    """Returns or consumes every massa still held by `run` in one update."""
+    held = (
+        db.query(models.Massa.id, models.Massa.last_used_at, models.Massa.checkout_criteria)
+        .filter(models.Massa.run_id == run.id, models.Massa.status == "IN_USE")
+        .all()
+    )
+    released = (
+        db.query(models.Massa)
+        .filter(models.Massa.run_id == run.id, models.Massa.status == "IN_USE")
+        .update({
+            models.Massa.status: new_status,
+            models.Massa.run_id: None,
+            models.Massa.lease_expires_at: None,
+        }, synchronize_session=False)
+    )
+    run.status = "RELEASED"
+    run.released_at = datetime.now()
+    db.commit()
+
+    event_type = events.STATUS_EVENTS.get(new_status, events.RELEASE)
+    for massa_id, last_used_at, criteria in held:
+        events.recorder.record(
+            event_type, massa_id=massa_id, consumer_id=run.consumer_id, criteria=criteria,
+            held_since=last_used_at, details={"run_id": run.id},
+        )
+    return released
+
+
+def renew_run(db: Session, run: models.Run, ttl: Optional[int] = None) -> int:
+    """Extends the lease of every massa still held by `run`."""
+    renewed = (
+        db.query(models.Massa)
+        .filter(models.Massa.run_id == run.id, models.Massa.status == "IN_USE")
+        .update({models.Massa.lease_expires_at: leases.lease_expiry(ttl)}, synchronize_session=False)
+    )
+    db.commit()
+    return renewed
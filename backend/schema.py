@@ -0,0 +1,75 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, MetaData, Table, inspect, select, text
+from sqlalchemy.engine import Engine
+
+from . import models, search
+
+# Bump whenever models or search indexes change, so the next start
+# re-runs the schema checks below. Unchanged deployments skip them.
+SCHEMA_VERSION = 9
+
+_meta = MetaData()
+schema_version_table = Table(
+    "tdm_schema_version", _meta,
+    Column("version", Integer, nullable=False),
+)
+
+
+def _current_version(engine: Engine):
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(schema_version_table.c.version)).scalar()
+    except Exception:
+        # Table doesn't exist yet (fresh database)
+        return None
+
+
+def _add_missing_columns(conn):
+    """
+    create_all only creates missing tables; add columns introduced after a
+    table was created. New columns are always added as nullable.
+    """
+    inspector = inspect(conn)
+    quote = conn.dialect.identifier_preparer.quote
+    for table in models.Base.metadata.sorted_tables:
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+# Values for columns added to tables that already had rows. Bound to the
+# app clock (:now) since the columns are written with datetime.now().
+_BACKFILL = [
+    "UPDATE massas SET updated_at = :now WHERE updated_at IS NULL",
+]
+
+
+def ensure_schema(engine: Engine, force: bool = False) -> bool:
+    """
+    Creates/updates tables and search indexes unless the database already
+    reports the current schema version. Returns True if anything ran.
+    """
+    if not force and _current_version(engine) == SCHEMA_VERSION:
+        search.use_existing_index(engine)
+        return False
+
+    models.Base.metadata.create_all(bind=engine)
+    _meta.create_all(bind=engine)
+    with engine.begin() as conn:
+        _add_missing_columns(conn)
+        for statement in _BACKFILL:
+            conn.execute(text(statement), {"now": datetime.now()})
+    search.setup_search_index(engine)
+    if search.backend is None:
+        # Leave the version unset so the next start retries the index
+        return True
+
+    with engine.begin() as conn:
+        conn.execute(schema_version_table.delete())
+        conn.execute(schema_version_table.insert().values(version=SCHEMA_VERSION))
+    return True
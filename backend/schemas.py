@@ -1,7 +1,14 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
+# Integer UC/invoice counter columns shared by massas and generation specs
+COUNTER_COLUMNS = [
+    "uc_ligada", "uc_desligada", "uc_suspensa",
+    "fat_vencidas", "fat_a_vencer", "fat_pagas",
+    "fat_boleto_unico", "fat_multifaturas", "fat_renegociacao",
+]
+
 class MassaBase(BaseModel):
     nome: Optional[str] = None
     document_type: str
@@ -48,6 +55,95 @@ class Massa(MassaBase):
     created_at: Optional[datetime]
     last_used_at: Optional[datetime]
     last_used_by: Optional[str]
+    run_id: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class GenerateRequest(BaseModel):
+    document_type: str = "CPF"  # CPF, CNPJ
+    count: int = Field(100, gt=0, le=5_000_000)
+    # Distributions are {value: weight}, e.g. {"NE": 3, "SE": 1}
+    region: Dict[str, float] = {}
+    financial_status: Dict[str, float] = {}
+    counters: Dict[str, Dict[int, float]] = {}  # {"fat_vencidas": {0: 7, 1: 2, 3: 1}}
+    uf: Optional[str] = None
+    tags: List[str] = []
+    seed: Optional[int] = None
+
+class MassaEvent(BaseModel):
+    id: int
+    event_type: str
+    massa_id: Optional[int]
+    consumer_id: Optional[str]
+    criteria: Optional[str]
+    held_seconds: Optional[float]
+    details: Dict[str, Any] = {}
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ConsumerStats(BaseModel):
+    consumer_id: Optional[str]
+    checkouts: int
+    releases: int
+    avg_held_seconds: Optional[float]
+    max_held_seconds: Optional[float]
+
+class CriteriaStats(BaseModel):
+    criteria: Optional[str]
+    checkouts: int
+    exhausted: int
+    last_exhausted_at: Optional[datetime]
+    releases: int = 0
+    avg_held_seconds: Optional[float] = None
+    max_held_seconds: Optional[float] = None
+
+class MassaCriteria(BaseModel):
+    document_type: Optional[str] = None
+    region: Optional[str] = None
+    financial_status: Optional[str] = None
+    tags: List[str] = []  # massa must have every tag
+    # Counter bounds (inclusive), e.g. {"fat_vencidas": 1}
+    min: Dict[str, int] = {}
+    max: Dict[str, int] = {}
+
+class ManifestLine(MassaCriteria):
+    count: int = Field(1, gt=0)
+
+class RunCreate(BaseModel):
+    consumer_id: str = "automated_test"
+    lines: List[ManifestLine] = Field(..., min_length=1)
+    ttl: Optional[int] = Field(None, gt=0)  # Lease seconds; server default if omitted
+
+class Run(BaseModel):
+    id: str
+    consumer_id: Optional[str]
+    manifest: List[Dict[str, Any]]
+    status: str
+    created_at: Optional[datetime]
+    released_at: Optional[datetime]
 
     class Config:
         from_attributes = True
+
+class RunAllocation(BaseModel):
+    run: Run
+    lines: List[List[int]]  # massa ids allocated to each manifest line, in order
+    massas: List[Massa]
+
+class Lease(BaseModel):
+    id: int
+    lease_expires_at: datetime
+
+class MassaDelta(BaseModel):
+    """Changes since a sync cursor; pass updated_since/after_id back to continue."""
+    massas: List[Massa]
+    deleted: List[int]  # Tombstones: ids deleted since the cursor
+    updated_since: datetime
+    after_id: Optional[int] = None
+    has_more: bool = False  # More changes left: call again right away with the new cursor
+    full: bool = False  # Cursor too old to have tombstones: drop the local cache first
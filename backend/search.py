@@ -0,0 +1,126 @@
+import re
+
+from sqlalchemy import func, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Query
+
+from . import models
+
+# Input made only of digits and document punctuation, e.g. "123.456.789-00"
+DOCUMENT_PATTERN = re.compile(r"^[\d.\-/\s]+$")
+
+# Trigram indexes need at least 3 characters to match anything
+MIN_TRIGRAM_LENGTH = 3
+
+FTS_TABLE = "massas_fts"
+
+# SQLite: strip the usual CPF/CNPJ masks inside triggers
+_SQLITE_DIGITS = "replace(replace(replace(replace({col}, '.', ''), '-', ''), '/', ''), ' ', '')"
+
+_SQLITE_SETUP = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(nome, doc, tokenize='trigram')",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS massas_fts_insert AFTER INSERT ON massas BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, nome, doc)
+        VALUES (new.id, coalesce(new.nome, ''), {_SQLITE_DIGITS.format(col="new.document_number")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS massas_fts_update AFTER UPDATE OF nome, document_number ON massas BEGIN
+        UPDATE {FTS_TABLE}
+        SET nome = coalesce(new.nome, ''), doc = {_SQLITE_DIGITS.format(col="new.document_number")}
+        WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS massas_fts_delete AFTER DELETE ON massas BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+]
+
+_SQLITE_BACKFILL = f"""
+    INSERT INTO {FTS_TABLE}(rowid, nome, doc)
+    SELECT id, coalesce(nome, ''), {_SQLITE_DIGITS.format(col="document_number")} FROM massas
+"""
+
+_POSTGRES_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_massas_nome_trgm ON massas USING gin (lower(nome) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_massas_document_digits_trgm ON massas "
+    "USING gin (regexp_replace(document_number, '\\D', '', 'g') gin_trgm_ops)",
+]
+
+# Index type per database dialect
+BACKENDS = {"sqlite": "fts5", "postgresql": "trigram"}
+
+# Set at startup: "fts5", "trigram" or None (plain LIKE)
+backend = None
+
+
+def use_existing_index(engine: Engine):
+    """Selects the search backend for a database whose index is already set up."""
+    global backend
+    backend = BACKENDS.get(engine.dialect.name)
+
+
+def setup_search_index(engine: Engine):
+    """
+    Creates the substring search index for nome/document_number.
+    SQLite gets an FTS5 trigram table kept in sync by triggers (so bulk
+    inserts are covered too); PostgreSQL gets pg_trgm GIN indexes.
+    """
+    global backend
+    dialect = engine.dialect.name
+
+    try:
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                is_new = not inspect(conn).has_table(FTS_TABLE)
+                for statement in _SQLITE_SETUP:
+                    conn.execute(text(statement))
+                if is_new:
+                    conn.execute(text(_SQLITE_BACKFILL))
+            elif dialect == "postgresql":
+                for statement in _POSTGRES_SETUP:
+                    conn.execute(text(statement))
+        backend = BACKENDS.get(dialect)
+    except Exception as e:
+        # e.g. SQLite built without FTS5, or no permission to create extensions
+        print(f"Error creating search index, falling back to LIKE: {e}")
+        backend = None
+
+
+def normalize_query(q: str):
+    """Returns (column, term): digit-only input searches documents, the rest searches names."""
+    q = q.strip()
+    if DOCUMENT_PATTERN.match(q):
+        return "doc", re.sub(r"\D", "", q)
+    return "nome", q.lower()
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def apply_search(query: Query, q: str) -> Query:
+    """Filters `query` to massas whose nome or document_number contains `q`."""
+    column, term = normalize_query(q)
+    if not term:
+        return query
+
+    if backend == "fts5" and len(term) >= MIN_TRIGRAM_LENGTH:
+        phrase = '"' + term.replace('"', '""') + '"'
+        matches = text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match").bindparams(
+            match=f"{column} : {phrase}"
+        )
+        return query.filter(models.Massa.id.in_(matches))
+
+    pattern = f"%{_escape_like(term)}%"
+    if column == "doc":
+        if backend == "trigram":
+            # Must match the indexed expression exactly
+            digits = func.regexp_replace(models.Massa.document_number, "\\D", "", "g")
+            return query.filter(digits.like(pattern, escape="\\"))
+        return query.filter(models.Massa.document_number.like(pattern, escape="\\"))
+    return query.filter(func.lower(models.Massa.nome).like(pattern, escape="\\"))
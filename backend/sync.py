@@ -0,0 +1,97 @@
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import DateTime, and_, exists, insert, literal, or_, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Deleted ids are remembered this long; an older cursor gets a full resync
+TOMBSTONE_TTL = int(os.getenv("TDM_TOMBSTONE_TTL", str(7 * 24 * 3600)))
+
+# updated_at is stamped before the write commits, so a change can become
+# visible only after a later delta already ran. Cursors handed out step back
+# this many seconds; clients merge by id, so rows sent twice are harmless.
+# This is the whole guarantee: a change reaches delta clients only if its
+# transaction commits at most SYNC_OVERLAP seconds after stamping updated_at.
+# Single UPDATEs commit right away and the generator commits per chunk;
+# any new bulk write must keep each commit under this bound too.
+SYNC_OVERLAP = int(os.getenv("TDM_SYNC_OVERLAP", "5"))
+
+
+def record_tombstones(db: Session, *criteria, now: Optional[datetime] = None):
+    """
+    Remembers the massas matching `criteria` as deleted. Call it right
+    before deleting them, in the same transaction.
+    """
+    now = now or datetime.now()
+    ids = select(models.Massa.id).where(*criteria)
+    Tombstone = models.MassaTombstone
+
+    db.query(Tombstone).filter(Tombstone.massa_id.in_(ids)).delete(synchronize_session=False)
+    db.execute(insert(Tombstone).from_select(
+        ["massa_id", "deleted_at"],
+        select(models.Massa.id, literal(now, DateTime(timezone=True))).where(*criteria),
+    ))
+    # Tombstones past the TTL are older than any cursor still served as a delta
+    db.query(Tombstone).filter(
+        Tombstone.deleted_at < now - timedelta(seconds=TOMBSTONE_TTL)
+    ).delete(synchronize_session=False)
+
+
+def delta(db: Session, updated_since: datetime, after_id: Optional[int] = None, limit: int = 10000) -> dict:
+    """
+    Massas changed since the cursor (updated_since, after_id), oldest change
+    first, plus the ids deleted since then. Changes are paged on the
+    (updated_at, id) index: while has_more is set, the returned cursor
+    continues right after the last row sent.
+
+    A first sync (or one older than TOMBSTONE_TTL) returns every massa with
+    full=True: the client must drop what it has before merging.
+    """
+    now = datetime.now()
+    if updated_since.tzinfo is not None:
+        # Timestamps are written with the server's local clock
+        updated_since = updated_since.astimezone().replace(tzinfo=None)
+    # Mid-pagination cursors (after_id set) are never "too old"
+    full = after_id is None and updated_since < now - timedelta(seconds=TOMBSTONE_TTL)
+
+    query = db.query(models.Massa)
+    if after_id is not None:
+        query = query.filter(or_(
+            models.Massa.updated_at > updated_since,
+            and_(models.Massa.updated_at == updated_since, models.Massa.id > after_id),
+        ))
+    elif not full:
+        query = query.filter(models.Massa.updated_at >= updated_since)
+    rows = query.order_by(models.Massa.updated_at, models.Massa.id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    deleted = []
+    if not full:
+        Tombstone = models.MassaTombstone
+        deleted = [
+            massa_id for (massa_id,) in
+            db.query(Tombstone.massa_id).filter(
+                Tombstone.deleted_at >= updated_since,
+                # SQLite may hand a deleted id out again; the live row wins
+                ~exists().where(models.Massa.id == Tombstone.massa_id),
+            )
+        ]
+
+    if has_more:
+        cursor_since, cursor_id = rows[-1].updated_at, rows[-1].id
+    else:
+        cursor_since, cursor_id = now - timedelta(seconds=SYNC_OVERLAP), None
+
+    return {
+        "massas": rows,
+        "deleted": deleted,
+        "updated_since": cursor_since,
+        "after_id": cursor_id,
+        "has_more": has_more,
+        "full": full,
+    }
@@ -1,30 +1,153 @@
+import importlib.util
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Union
+
 import requests
-from typing import Optional, Dict, Any
+
+
+def _load_shared_client():
+    """
+    The repository-root tdm_client.py, which owns the transport (pooled
+    session, retries with jitter, latency stats). It shares this module's
+    name, so it is loaded by path rather than imported.
+    """
+    path = Path(__file__).resolve().parent.parent / "tdm_client.py"
+    spec = importlib.util.spec_from_file_location("_tdm_shared_client", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+_shared = _load_shared_client()
+LatencyStats = _shared.LatencyStats
+IDEMPOTENT_METHODS = _shared.IDEMPOTENT_METHODS
+IDEMPOTENCY_HEADER = _shared.IDEMPOTENCY_HEADER
+
 
 class TDMClient:
     """
     Client utilizing the Test Data Management (TDM) API to fetch and manage test data.
+
+    Calls share a keep-alive connection pool sized for `pool_size` worker
+    threads (default: cpu_count + 4, like ThreadPoolExecutor). Idempotent
+    calls are retried on connection errors and 429/502/503/504 with
+    exponential backoff and full jitter.
     """
-    def __init__(self, base_url: str = "http://localhost:8000"):
+    def __init__(
+        self,
+        base_url: str = "http://localhost:8000",
+        pool_size: Optional[int] = None,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        backoff_max: float = 10,
+        timeout: float = 30
+    ):
         self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size or min(32, (os.cpu_count() or 1) + 4)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.stats = LatencyStats()
+
+        self.session = _shared._pooled_session(self.pool_size)
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        idempotent: Optional[bool] = None,
+        idempotency_key: bool = False,
+        **kwargs
+    ) -> requests.Response:
+        """
+        Sends a request through the pooled session, retrying transient failures.
+        Non-idempotent calls are only retried when the connection was never made.
+        With idempotency_key=True every attempt carries the same fresh
+        Idempotency-Key, so the server replays the first result and the call
+        is safe to retry.
+        Returns the final response without raising on HTTP errors.
+        """
+        if idempotency_key:
+            kwargs["headers"] = _shared._idempotency_headers(kwargs.get("headers"))
+            idempotent = True
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", self.timeout)
+        return _shared._send(
+            self.session, method, f"{self.base_url}{path}", idempotent, self.max_retries,
+            self.backoff, self.backoff_max, self.stats, _shared._endpoint_key(method, path), **kwargs
+        )
+
+    def warm_up(self, timeout: float = 120, connections: Optional[int] = None) -> Future:
+        """
+        Wakes a sleeping instance (e.g. Render free tier) in the background and
+        pre-opens `connections` pooled connections (default: pool_size).
+        Call it early, e.g. in pytest_configure, so the wake-up overlaps test
+        collection. Returns a Future resolving to True once /health answers 2xx
+        (the 502/503 Render's proxy sends while the instance boots don't count).
+        """
+        future = Future()
+
+        def ping():
+            try:
+                return self.session.get(f"{self.base_url}/health", timeout=self.timeout).ok
+            except requests.exceptions.RequestException:
+                return False
+
+        def run():
+            deadline = time.monotonic() + timeout
+            while not ping():
+                if time.monotonic() >= deadline:
+                    future.set_result(False)
+                    return
+                time.sleep(1)
+            count = connections or self.pool_size
+            with ThreadPoolExecutor(max_workers=count) as executor:
+                list(executor.map(lambda _: ping(), range(count)))
+            future.set_result(True)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-endpoint call counts, retries and latency percentiles (ms)."""
+        return self.stats.summary()
+
+    def close(self):
+        self.session.close()
 
     def get_available_massa(
         self, 
         region: Optional[str] = None, 
         uc_status: Optional[str] = None, 
         financial_status: Optional[str] = None,
-        test_name: str = "automated_test"
+        test_name: str = "automated_test",
+        where: Optional[Union[str, List[str]]] = None,
+        ttl: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Attempts to checkout (lock) a massa that matches criteria.
         Returns the massa dict if found, or raises Exception.
+
+        `where` takes counter predicates on any uc_*/fat_* column,
+        e.g. ["uc_ligada>=2", "fat_renegociacao=0"] or "uc_ligada>=2,fat_vencidas>0".
+
+        The massa is leased for `ttl` seconds (server default if None) and
+        returns to the pool on its own unless renewed with heartbeat().
         """
         params = {"consumer_id": test_name}
         if region: params["region"] = region
         if uc_status: params["uc_status"] = uc_status
         if financial_status: params["financial_status"] = financial_status
+        if where: params["where"] = [where] if isinstance(where, str) else list(where)
+        if ttl: params["ttl"] = ttl
 
-        response = requests.post(f"{self.base_url}/massas/checkout", params=params)
+        response = self._request("POST", "/massas/checkout", idempotency_key=True, params=params)
         
         if response.status_code == 200:
             return response.json()
@@ -38,8 +161,18 @@ class TDMClient:
         Releases a massa back to the pool or marks it as CONSUMED.
         """
         params = {"new_status": status}
-        response = requests.post(f"{self.base_url}/massas/{massa_id}/release", params=params)
+        # Setting a status is safe to repeat
+        response = self._request("POST", f"/massas/{massa_id}/release", idempotency_key=True, params=params)
+        response.raise_for_status()
+
+    def heartbeat(self, massa_id: int, ttl: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Renews the lease of a checked out massa. Raises if it already expired.
+        """
+        params = {"ttl": ttl} if ttl else {}
+        response = self._request("POST", f"/massas/{massa_id}/heartbeat", idempotent=True, params=params)
         response.raise_for_status()
+        return response.json()
 
     def mark_as_consumed(self, massa_id: int):
         self.release_massa(massa_id, "CONSUMED")
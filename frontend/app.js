@@ -18,10 +18,20 @@ let appSettings = {
 let isSelectionMode = false;
 let selectedIds = new Set();
 
-// Pagination State
-let currentPage = 1;
-let itemsPerPage = 25; // Default items per page
-const itemsPerPageOptions = [10, 25, 50, 100];
+// Virtual Scroll State
+const VIRTUAL_OVERSCAN = 8; // Extra rows rendered above/below the viewport
+const FILTER_DEBOUNCE_MS = 150;
+let rowHeight = 56; // Estimated row height, measured once rows are on screen
+let rowHeightMeasured = false;
+let tableData = []; // Rows currently bound to the table
+let tableVersion = 0; // Bumped whenever rows must be rebuilt (data, columns, selection mode)
+let tableColumns = []; // Visible column keys for the current render
+const renderedRows = new Map(); // Index in tableData -> <tr>
+const rowPool = []; // Detached <tr> elements ready for reuse
+let scrollFrame = null;
+
+// Pre-lowercased search fields per massa (built once per fetch)
+let searchIndex = new WeakMap();
 
 // Column Definitions (Metadata for Rendering)
 const COLUMN_DEFS = {
@@ -76,10 +86,17 @@ const COLUMN_DEFS = {
 };
 
 // ============ SETTINGS LOGIC ============
+// Version of the settings we last loaded/saved (server ETag). Sent back on
+// save so concurrent edits from another admin are detected, not overwritten.
+let settingsETag = null;
+
 async function fetchSettings() {
     try {
-        const response = await fetch(`${API_URL}/settings`);
+        const headers = settingsETag ? { 'If-None-Match': settingsETag } : {};
+        const response = await fetch(`${API_URL}/settings`, { headers });
+        if (response.status === 304) return; // Unchanged since last load
         if (response.ok) {
+            settingsETag = response.headers.get('ETag');
             appSettings = await response.json();
             // Re-render table and modal fields when settings change
             updateDynamicInterface();
@@ -91,12 +108,22 @@ async function fetchSettings() {
 
 async function saveSettings(settings) {
     try {
+        const headers = { 'Content-Type': 'application/json' };
+        if (settingsETag) headers['If-Match'] = settingsETag;
         const response = await fetch(`${API_URL}/settings`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers,
             body: JSON.stringify(settings)
         });
+        if (response.status === 412) {
+            // Someone else saved first: load their version instead of clobbering it
+            settingsETag = null;
+            await fetchSettings();
+            showToast('As configurações foram alteradas por outro usuário. Recarregadas; refaça sua alteração.', 'error');
+            return;
+        }
         if (response.ok) {
+            settingsETag = response.headers.get('ETag');
             appSettings = await response.json();
             updateDynamicInterface();
             showToast('Configurações salvas!', 'success');
@@ -182,89 +209,132 @@ function showToast(message, type = 'info') {
 }
 
 // ============ COLUMN FILTER FUNCTIONS ============
-function applyColumnFilters() {
-    const filterId = document.getElementById('col-filter-id')?.value.toLowerCase();
-    const filterNome = document.getElementById('col-filter-nome')?.value.toLowerCase();
-    const filterDoc = document.getElementById('col-filter-doc')?.value.toLowerCase();
-    const filterType = document.getElementById('col-filter-type')?.value;
-    const filterRegion = document.getElementById('col-filter-region')?.value;
-    const filterStatus = document.getElementById('col-filter-status')?.value;
-    const filterUc = document.getElementById('col-filter-uc')?.value;
-    const filterFaturas = document.getElementById('col-filter-faturas')?.value;
-    const filterTags = document.getElementById('col-filter-tags')?.value.toLowerCase();
-
-    const filtered = allMassas.filter(massa => {
-        // ID filter (text search)
-        if (filterId && !String(massa.id).includes(filterId)) return false;
-
-        // Name filter (text search)
-        if (filterNome && !(massa.nome || '').toLowerCase().includes(filterNome)) return false;
-
-        // Document filter (text search)
-        if (filterDoc && !massa.document_number.toLowerCase().includes(filterDoc)) return false;
-
-        // Type filter (exact match)
-        if (filterType && massa.document_type !== filterType) return false;
-
-        // Region filter (exact match)
-        if (filterRegion && massa.region !== filterRegion) return false;
-
-        // Status filter (exact match)
-        if (filterStatus && massa.status !== filterStatus) return false;
-
-        // UC filter - filter by presence of UC type
-        if (filterUc) {
-            if (filterUc === 'TEM_LIGADA' && (massa.uc_ligada || 0) <= 0) return false;
-            if (filterUc === 'TEM_DESLIGADA' && (massa.uc_desligada || 0) <= 0) return false;
-            if (filterUc === 'TEM_SUSPENSA' && (massa.uc_suspensa || 0) <= 0) return false;
-        }
+const UC_FILTERS = {
+    TEM_LIGADA: 'uc_ligada',
+    TEM_DESLIGADA: 'uc_desligada',
+    TEM_SUSPENSA: 'uc_suspensa'
+};
 
-        // Faturas filter - filter by presence of invoice type
-        if (filterFaturas) {
-            if (filterFaturas === 'TEM_VENCIDA' && (massa.fat_vencidas || 0) <= 0) return false;
-            if (filterFaturas === 'TEM_A_VENCER' && (massa.fat_a_vencer || 0) <= 0) return false;
-            if (filterFaturas === 'TEM_PAGA' && (massa.fat_pagas || 0) <= 0) return false;
-            if (filterFaturas === 'TEM_BOLETO_UNICO' && (massa.fat_boleto_unico || 0) <= 0) return false;
-            if (filterFaturas === 'TEM_MULTIFATURAS' && (massa.fat_multifaturas || 0) <= 0) return false;
-            if (filterFaturas === 'TEM_RENEGOCIACAO' && (massa.fat_renegociacao || 0) <= 0) return false;
-        }
+const FAT_FILTERS = {
+    TEM_VENCIDA: 'fat_vencidas',
+    TEM_A_VENCER: 'fat_a_vencer',
+    TEM_PAGA: 'fat_pagas',
+    TEM_BOLETO: 'fat_boleto_unico',
+    TEM_BOLETO_UNICO: 'fat_boleto_unico',
+    TEM_MULTI: 'fat_multifaturas',
+    TEM_MULTIFATURAS: 'fat_multifaturas',
+    TEM_RENEG: 'fat_renegociacao',
+    TEM_RENEGOCIACAO: 'fat_renegociacao'
+};
 
-        // Tags filter (text search)
-        if (filterTags) {
-            const tagsStr = (massa.tags || []).join(' ').toLowerCase();
-            if (!tagsStr.includes(filterTags)) return false;
-        }
+function buildSearchEntry(massa) {
+    return {
+        id: String(massa.id),
+        nome: (massa.nome || '').toLowerCase(),
+        doc: (massa.document_number || '').toLowerCase(),
+        tags: (massa.tags || []).join(' ').toLowerCase(),
+        meta: {} // Custom column values, lowercased on first use
+    };
+}
 
-        // Custom column filters
-        const customFilterInputs = document.querySelectorAll('.dynamic-col-filter input[data-key]');
-        for (const input of customFilterInputs) {
-            const key = input.dataset.key;
-            const filterValue = input.value.toLowerCase();
-            if (filterValue && !String((massa.metadata_info || {})[key] || '').toLowerCase().includes(filterValue)) {
-                return false;
-            }
-        }
+function buildSearchIndex(massas) {
+    searchIndex = new WeakMap();
+    massas.forEach(massa => searchIndex.set(massa, buildSearchEntry(massa)));
+}
+
+function getSearchEntry(massa) {
+    let entry = searchIndex.get(massa);
+    if (!entry) {
+        // Rows added or replaced locally after the last fetch
+        entry = buildSearchEntry(massa);
+        searchIndex.set(massa, entry);
+    }
+    return entry;
+}
+
+function getFilterValue(key) {
+    return document.getElementById(`col-filter-${key}`)?.value || '';
+}
+
+// Reads every filter input once and returns the list of active predicates
+function compileColumnFilters() {
+    const predicates = [];
+
+    const filterId = getFilterValue('id').toLowerCase();
+    if (filterId) predicates.push(m => getSearchEntry(m).id.includes(filterId));
+
+    const filterNome = getFilterValue('nome').toLowerCase();
+    if (filterNome) predicates.push(m => getSearchEntry(m).nome.includes(filterNome));
+
+    // Masked input like 123.456.789-00 matches the stored digits
+    let filterDoc = getFilterValue('document_number').toLowerCase();
+    if (/^[\d.\-/\s]+$/.test(filterDoc)) filterDoc = filterDoc.replace(/\D/g, '');
+    if (filterDoc) predicates.push(m => getSearchEntry(m).doc.includes(filterDoc));
+
+    const filterType = getFilterValue('document_type');
+    if (filterType) predicates.push(m => m.document_type === filterType);
+
+    const filterRegion = getFilterValue('region');
+    if (filterRegion) predicates.push(m => m.region === filterRegion);
+
+    const filterStatus = getFilterValue('status');
+    if (filterStatus) predicates.push(m => m.status === filterStatus);
+
+    // UC / Faturas filters - filter by presence of the counter type
+    const ucField = UC_FILTERS[getFilterValue('uc_counters')];
+    if (ucField) predicates.push(m => (m[ucField] || 0) > 0);
+
+    const fatField = FAT_FILTERS[getFilterValue('fat_counters')];
+    if (fatField) predicates.push(m => (m[fatField] || 0) > 0);
+
+    const filterTags = getFilterValue('tags').toLowerCase();
+    if (filterTags) predicates.push(m => getSearchEntry(m).tags.includes(filterTags));
 
-        return true;
+    // Custom column filters
+    document.querySelectorAll('input.dynamic-col-filter[data-key]').forEach(input => {
+        const key = input.dataset.key;
+        const value = input.value.toLowerCase();
+        if (!value) return;
+        predicates.push(m => {
+            const meta = getSearchEntry(m).meta;
+            if (!(key in meta)) meta[key] = String((m.metadata_info || {})[key] || '').toLowerCase();
+            return meta[key].includes(value);
+        });
     });
 
+    return predicates;
+}
+
+function applyColumnFilters() {
+    const predicates = compileColumnFilters();
+
+    const filtered = predicates.length === 0
+        ? allMassas
+        : allMassas.filter(massa => {
+            for (const predicate of predicates) {
+                if (!predicate(massa)) return false;
+            }
+            return true;
+        });
+
     filteredMassas = filtered; // Update global filtered state
     renderTable(filtered);
 }
 
+function debounce(fn, wait) {
+    let timer = null;
+    return (...args) => {
+        clearTimeout(timer);
+        timer = setTimeout(() => fn(...args), wait);
+    };
+}
+
+// Text inputs re-filter once typing pauses instead of on every keystroke
+const applyColumnFiltersDebounced = debounce(applyColumnFilters, FILTER_DEBOUNCE_MS);
+
 function clearColumnFilters() {
-    document.getElementById('col-filter-id').value = '';
-    document.getElementById('col-filter-nome').value = '';
-    document.getElementById('col-filter-doc').value = '';
-    document.getElementById('col-filter-type').value = '';
-    document.getElementById('col-filter-region').value = '';
-    document.getElementById('col-filter-status').value = '';
-    document.getElementById('col-filter-uc').value = '';
-    document.getElementById('col-filter-tags').value = '';
-
-    // Clear custom column filters
-    document.querySelectorAll('.dynamic-col-filter input[data-key]').forEach(input => input.value = '');
-    renderTable(allMassas);
+    document.querySelectorAll('.filter-row input, .filter-row select').forEach(el => el.value = '');
+    applyColumnFilters();
 }
 
 // ============ DASHBOARD & CHARTS ============
@@ -496,14 +566,116 @@ function toggleLoading(show) {
     if (el) el.style.display = show ? 'flex' : 'none';
 }
 
+// ============ LOCAL CACHE (DELTA SYNC) ============
+// Massas are kept in IndexedDB together with the server's sync cursor, so a
+// reload only downloads what changed (GET /massas/?updated_since=...) and
+// deleted ids (tombstones) instead of the whole pool.
+const MASSA_CACHE_DB = 'tdm-cache';
+const MASSA_CACHE_VERSION = 1;
+const MASSA_CURSOR_START = { updated_since: '1970-01-01T00:00:00', after_id: null };
+
+const massaById = new Map(); // Local copy, merged from deltas
+let massaCursor = null; // null until the IndexedDB copy was read
+let massaCacheDB = null;
+let massaSync = Promise.resolve(); // Serializes syncs so they don't interleave cursors
+
+function idbRequest(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function openMassaCache() {
+    if (massaCacheDB || !window.indexedDB) return massaCacheDB;
+    try {
+        const request = indexedDB.open(MASSA_CACHE_DB, MASSA_CACHE_VERSION);
+        request.onupgradeneeded = () => {
+            const db = request.result;
+            db.createObjectStore('massas', { keyPath: 'id' });
+            db.createObjectStore('meta');
+        };
+        massaCacheDB = await idbRequest(request);
+    } catch (error) {
+        // e.g. private browsing: keep working from memory only
+        console.error('IndexedDB unavailable, caching in memory only:', error);
+    }
+    return massaCacheDB;
+}
+
+async function readMassaCache(db) {
+    if (!db) return MASSA_CURSOR_START;
+    const tx = db.transaction(['massas', 'meta'], 'readonly');
+    const [massas, cursor] = await Promise.all([
+        idbRequest(tx.objectStore('massas').getAll()),
+        idbRequest(tx.objectStore('meta').get('cursor'))
+    ]);
+    if (!cursor) return MASSA_CURSOR_START;
+    massas.forEach(massa => massaById.set(massa.id, massa));
+    return cursor;
+}
+
+function applyMassaDelta(delta) {
+    if (delta.full) massaById.clear();
+    delta.deleted.forEach(id => massaById.delete(id));
+    delta.massas.forEach(massa => massaById.set(massa.id, massa));
+}
+
+function writeMassaDelta(db, delta, cursor) {
+    if (!db) return Promise.resolve();
+    // Rows and cursor in one transaction: the stored cursor never runs ahead of the rows
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(['massas', 'meta'], 'readwrite');
+        const store = tx.objectStore('massas');
+        if (delta.full) store.clear();
+        delta.deleted.forEach(id => store.delete(id));
+        delta.massas.forEach(massa => store.put(massa));
+        tx.objectStore('meta').put(cursor, 'cursor');
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+async function syncMassas() {
+    const db = await openMassaCache();
+    if (massaCursor === null) {
+        massaCursor = await readMassaCache(db);
+        if (massaById.size > 0) showMassas(); // Show the cached copy while the delta loads
+    }
+
+    let delta;
+    do {
+        const params = new URLSearchParams({ updated_since: massaCursor.updated_since });
+        if (massaCursor.after_id !== null) params.set('after_id', massaCursor.after_id);
+        const response = await fetch(`${API_URL}/massas/?${params}`);
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        delta = await response.json();
+
+        applyMassaDelta(delta);
+        const cursor = { updated_since: delta.updated_since, after_id: delta.after_id };
+        try {
+            await writeMassaDelta(db, delta, cursor);
+        } catch (error) {
+            console.error('Error writing massa cache:', error);
+        }
+        massaCursor = cursor;
+    } while (delta.has_more);
+}
+
+function showMassas() {
+    allMassas = Array.from(massaById.values()).sort((a, b) => a.id - b.id);
+    buildSearchIndex(allMassas);
+    applyColumnFilters(); // Apply any active column filters
+    updateDashboard(allMassas); // Update dashboard stats
+}
+
 async function fetchMassas() {
     toggleLoading(true);
+    const sync = massaSync.then(syncMassas);
+    massaSync = sync.catch(() => {});
     try {
-        const response = await fetch(`${API_URL}/massas/`);
-        const data = await response.json();
-        allMassas = data;
-        applyColumnFilters(); // Apply any active column filters
-        updateDashboard(allMassas); // Update dashboard stats
+        await sync;
+        showMassas();
     } catch (error) {
         console.error('Error fetching massas:', error);
         showToast('Erro ao conectar com servidor', 'error');
@@ -850,7 +1022,7 @@ function renderHeaders() {
             input.placeholder = 'Filtrar...';
             if (key === 'id') { input.placeholder = 'ID'; input.style.width = '50px'; }
             if (key === 'nome') input.placeholder = 'Nome...';
-            input.onkeyup = applyColumnFilters;
+            input.oninput = applyColumnFiltersDebounced;
             th.appendChild(input);
         } else if (def.filterType === 'select') {
             const select = document.createElement('select');
@@ -1101,305 +1273,267 @@ async function toggleColumnVisibility(key) {
     renderColumnsList(); // Refresh checkboxes
 }
 
-function renderTable(massas) {
-    const tbody = document.getElementById('table-body');
-    tbody.innerHTML = '';
-
-    // Pagination: Calculate total pages and slice data
-    const totalItems = massas.length;
-    const totalPages = Math.ceil(totalItems / itemsPerPage);
-
-    // Ensure currentPage is within valid range
-    if (currentPage > totalPages) currentPage = totalPages || 1;
-    if (currentPage < 1) currentPage = 1;
-
-    const startIndex = (currentPage - 1) * itemsPerPage;
-    const endIndex = startIndex + itemsPerPage;
-    const paginatedMassas = massas.slice(startIndex, endIndex);
-
-    // Render pagination controls
-    renderPaginationControls(totalItems, totalPages);
+function getVisibleColumns() {
+    // If column_order is not set (first load), use keys of COLUMN_DEFS + custom
+    const order = appSettings.column_order && appSettings.column_order.length > 0
+        ? appSettings.column_order
+        : [...Object.keys(COLUMN_DEFS), ...appSettings.custom_columns.map(c => c.key)];
+    return order.filter(key => !appSettings.hidden_columns.includes(key));
+}
 
-    paginatedMassas.forEach(massa => {
-        const tr = document.createElement('tr');
-        const isChecked = selectedIds.has(massa.id);
-        const statusPt = translateStatus(massa.status);
+function buildRowHtml(massa, columns) {
+    const isChecked = selectedIds.has(massa.id);
+    const statusPt = translateStatus(massa.status);
 
-        // Build UC tags with counts
-        // Build UC tags with counts (Semi-Compact Mode - Icon + Count + Label)
-        const ucTags = [];
-        if (massa.uc_ligada > 0) {
-            ucTags.push(`<span class="mini-tag tag-uc-ligada" title="Ligada"><i data-lucide="zap"></i> ${massa.uc_ligada} Ligada${massa.uc_ligada > 1 ? 's' : ''}</span>`);
-        }
-        if (massa.uc_desligada > 0) {
-            ucTags.push(`<span class="mini-tag tag-uc-desligada" title="Desligada"><i data-lucide="power-off"></i> ${massa.uc_desligada} Desligada${massa.uc_desligada > 1 ? 's' : ''}</span>`);
-        }
-        if (massa.uc_suspensa > 0) {
-            ucTags.push(`<span class="mini-tag tag-uc-suspensa" title="Suspensa"><i data-lucide="alert-triangle"></i> ${massa.uc_suspensa} Suspensa${massa.uc_suspensa > 1 ? 's' : ''}</span>`);
-        }
-        const ucDisplay = ucTags.length > 0 ? ucTags.join(' ') : '-';
+    // Build UC tags with counts
+    // Build UC tags with counts (Semi-Compact Mode - Icon + Count + Label)
+    const ucTags = [];
+    if (massa.uc_ligada > 0) {
+        ucTags.push(`<span class="mini-tag tag-uc-ligada" title="Ligada"><i data-lucide="zap"></i> ${massa.uc_ligada} Ligada${massa.uc_ligada > 1 ? 's' : ''}</span>`);
+    }
+    if (massa.uc_desligada > 0) {
+        ucTags.push(`<span class="mini-tag tag-uc-desligada" title="Desligada"><i data-lucide="power-off"></i> ${massa.uc_desligada} Desligada${massa.uc_desligada > 1 ? 's' : ''}</span>`);
+    }
+    if (massa.uc_suspensa > 0) {
+        ucTags.push(`<span class="mini-tag tag-uc-suspensa" title="Suspensa"><i data-lucide="alert-triangle"></i> ${massa.uc_suspensa} Suspensa${massa.uc_suspensa > 1 ? 's' : ''}</span>`);
+    }
+    const ucDisplay = ucTags.length > 0 ? ucTags.join(' ') : '-';
 
-        // Build Invoice tags with counts (Semi-Compact Mode - Icon + Count + Label)
-        const fatTags = [];
-        if (massa.fat_vencidas > 0) {
-            fatTags.push(`<span class="mini-tag tag-fat-vencida" title="Vencida"><i data-lucide="alert-circle"></i> ${massa.fat_vencidas} Vencida${massa.fat_vencidas > 1 ? 's' : ''}</span>`);
-        }
-        if (massa.fat_a_vencer > 0) {
-            fatTags.push(`<span class="mini-tag tag-fat-a-vencer" title="A Vencer"><i data-lucide="clock"></i> ${massa.fat_a_vencer} A Vencer</span>`);
-        }
-        if (massa.fat_pagas > 0) {
-            fatTags.push(`<span class="mini-tag tag-fat-paga" title="Paga"><i data-lucide="check-circle"></i> ${massa.fat_pagas} Paga${massa.fat_pagas > 1 ? 's' : ''}</span>`);
-        }
-        if (massa.fat_boleto_unico > 0) {
-            fatTags.push(`<span class="mini-tag tag-fat-boleto" title="Boleto Único"><i data-lucide="file"></i> ${massa.fat_boleto_unico} Boleto Único</span>`);
-        }
-        if (massa.fat_multifaturas > 0) {
-            fatTags.push(`<span class="mini-tag tag-fat-multi" title="Multifatura"><i data-lucide="files"></i> ${massa.fat_multifaturas} Multifatura${massa.fat_multifaturas > 1 ? 's' : ''}</span>`);
-        }
-        if (massa.fat_renegociacao > 0) {
-            fatTags.push(`<span class="mini-tag tag-fat-renego" title="Renegociação"><i data-lucide="history"></i> ${massa.fat_renegociacao} Renegociação</span>`);
-        }
-        const fatDisplay = fatTags.length > 0 ? fatTags.join(' ') : '-';
+    // Build Invoice tags with counts (Semi-Compact Mode - Icon + Count + Label)
+    const fatTags = [];
+    if (massa.fat_vencidas > 0) {
+        fatTags.push(`<span class="mini-tag tag-fat-vencida" title="Vencida"><i data-lucide="alert-circle"></i> ${massa.fat_vencidas} Vencida${massa.fat_vencidas > 1 ? 's' : ''}</span>`);
+    }
+    if (massa.fat_a_vencer > 0) {
+        fatTags.push(`<span class="mini-tag tag-fat-a-vencer" title="A Vencer"><i data-lucide="clock"></i> ${massa.fat_a_vencer} A Vencer</span>`);
+    }
+    if (massa.fat_pagas > 0) {
+        fatTags.push(`<span class="mini-tag tag-fat-paga" title="Paga"><i data-lucide="check-circle"></i> ${massa.fat_pagas} Paga${massa.fat_pagas > 1 ? 's' : ''}</span>`);
+    }
+    if (massa.fat_boleto_unico > 0) {
+        fatTags.push(`<span class="mini-tag tag-fat-boleto" title="Boleto Único"><i data-lucide="file"></i> ${massa.fat_boleto_unico} Boleto Único</span>`);
+    }
+    if (massa.fat_multifaturas > 0) {
+        fatTags.push(`<span class="mini-tag tag-fat-multi" title="Multifatura"><i data-lucide="files"></i> ${massa.fat_multifaturas} Multifatura${massa.fat_multifaturas > 1 ? 's' : ''}</span>`);
+    }
+    if (massa.fat_renegociacao > 0) {
+        fatTags.push(`<span class="mini-tag tag-fat-renego" title="Renegociação"><i data-lucide="history"></i> ${massa.fat_renegociacao} Renegociação</span>`);
+    }
+    const fatDisplay = fatTags.length > 0 ? fatTags.join(' ') : '-';
 
-        let rowHtml = '';
-        if (isSelectionMode) {
-            rowHtml += `<td><input type="checkbox" class="row-checkbox" data-id="${massa.id}" ${isChecked ? 'checked' : ''} onchange="toggleRowSelection(${massa.id}, this.checked)"></td>`;
-        }
+    let rowHtml = '';
+    if (isSelectionMode) {
+        rowHtml += `<td><input type="checkbox" class="row-checkbox" data-id="${massa.id}" ${isChecked ? 'checked' : ''} onchange="toggleRowSelection(${massa.id}, this.checked)"></td>`;
+    }
 
-        // Iterate over column_order to build the row
-        // If column_order is not set (first load), use keys of COLUMN_DEFS + custom
-        const order = appSettings.column_order && appSettings.column_order.length > 0
-            ? appSettings.column_order
-            : [...Object.keys(COLUMN_DEFS), ...appSettings.custom_columns.map(c => c.key)];
-
-        order.forEach(key => {
-            if (appSettings.hidden_columns.includes(key)) return;
-
-            let cellContent = '-';
-
-            // Standard Columns Logic
-            switch (key) {
-                case 'id':
-                    cellContent = `#${massa.id}`;
-                    break;
-                case 'nome':
-                    cellContent = `<strong>${massa.nome || '-'}</strong>`;
-                    break;
-                case 'document_number':
-                    cellContent = maskDocument(massa.document_number, massa.document_type);
-                    break;
-                case 'document_type':
-                    cellContent = massa.document_type;
-                    break;
-                case 'region':
-                    cellContent = massa.region;
-                    break;
-                case 'status':
-                    cellContent = `<span class="status-badge status-${massa.status.toLowerCase()}" title="${(massa.metadata_info || {}).status_comment || ''}">${statusPt}</span>`;
-                    break;
-                case 'uc_counters':
-                    cellContent = `<div class="tags-container">${ucDisplay}</div>`;
-                    break;
-                case 'fat_counters':
-                    cellContent = `<div class="tags-container">${fatDisplay}</div>`;
-                    break;
-                case 'tags':
-                    // If we had generic tags, they would go here. For now, empty or custom logic.
-                    // If 'tags' key is meant for 'Visualizar/Editar' action? No, actions is separate.
-                    // Looking at previous code, 'tags' column didn't seem to have content in the snippet I saw?
-                    // Ah, the original code had: ${!appSettings.hidden_columns.includes('tags') ? ... map custom_columns ... 
-                    // Wait, 'tags' in my COLUMN_DEFS might be a placeholder.
-                    // Let's assume it renders custom tags or just empty for now if no data.
-                    cellContent = (massa.tags || []).map(tag => `<span class="tag">${tag}</span>`).join('');
-                    if (cellContent) cellContent = `<div class="tags-container">${cellContent}</div>`;
-                    else cellContent = '-';
-                    break;
-                case 'actions':
-                    cellContent = `
-                        <button class="btn-icon" onclick="openViewModal(${massa.id})" title="Ver Detalhes">
-                            <i data-lucide="eye"></i>
-                        </button>
-                        <button class="btn-icon" onclick="openEditModal(${massa.id})" title="Editar">
-                            <i data-lucide="edit-2"></i>
-                        </button>
-                        <button class="btn-icon" onclick="deleteMassa(${massa.id})" title="Excluir" style="color: var(--danger);">
-                            <i data-lucide="trash-2"></i>
-                        </button>
-                    `;
-                    break;
-                default:
-                    // Custom Columns
-                    const customCol = appSettings.custom_columns.find(c => c.key === key);
-                    if (customCol) {
-                        let val = (massa.metadata_info || {})[key] || '-';
-                        if (val !== '-') {
-                            if (customCol.type === 'date') {
-                                const date = new Date(val);
-                                if (!isNaN(date.getTime())) {
-                                    val = date.toLocaleDateString('pt-BR', { timeZone: 'UTC' });
-                                }
-                            } else if (customCol.type === 'number') {
-                                if (!isNaN(val)) val = Number(val).toLocaleString('pt-BR');
-                            } else if (customCol.type === 'tag') {
-                                const tags = val.split(',').map(t => t.trim()).filter(t => t);
-                                val = `<div class="tags-container" style="justify-content: flex-start;">${tags.map(t => `<span class="tag">${t}</span>`).join('')}</div>`;
+    columns.forEach(key => {
+        let cellContent = '-';
+
+        // Standard Columns Logic
+        switch (key) {
+            case 'id':
+                cellContent = `#${massa.id}`;
+                break;
+            case 'nome':
+                cellContent = `<strong>${massa.nome || '-'}</strong>`;
+                break;
+            case 'document_number':
+                cellContent = maskDocument(massa.document_number, massa.document_type);
+                break;
+            case 'document_type':
+                cellContent = massa.document_type;
+                break;
+            case 'region':
+                cellContent = massa.region;
+                break;
+            case 'status':
+                cellContent = `<span class="status-badge status-${massa.status.toLowerCase()}" title="${(massa.metadata_info || {}).status_comment || ''}">${statusPt}</span>`;
+                break;
+            case 'uc_counters':
+                cellContent = `<div class="tags-container">${ucDisplay}</div>`;
+                break;
+            case 'fat_counters':
+                cellContent = `<div class="tags-container">${fatDisplay}</div>`;
+                break;
+            case 'tags':
+                // If we had generic tags, they would go here. For now, empty or custom logic.
+                // If 'tags' key is meant for 'Visualizar/Editar' action? No, actions is separate.
+                // Looking at previous code, 'tags' column didn't seem to have content in the snippet I saw?
+                // Ah, the original code had: ${!appSettings.hidden_columns.includes('tags') ? ... map custom_columns ... 
+                // Wait, 'tags' in my COLUMN_DEFS might be a placeholder.
+                // Let's assume it renders custom tags or just empty for now if no data.
+                cellContent = (massa.tags || []).map(tag => `<span class="tag">${tag}</span>`).join('');
+                if (cellContent) cellContent = `<div class="tags-container">${cellContent}</div>`;
+                else cellContent = '-';
+                break;
+            case 'actions':
+                cellContent = `
+                    <button class="btn-icon" onclick="openViewModal(${massa.id})" title="Ver Detalhes">
+                        <i data-lucide="eye"></i>
+                    </button>
+                    <button class="btn-icon" onclick="openEditModal(${massa.id})" title="Editar">
+                        <i data-lucide="edit-2"></i>
+                    </button>
+                    <button class="btn-icon" onclick="deleteMassa(${massa.id})" title="Excluir" style="color: var(--danger);">
+                        <i data-lucide="trash-2"></i>
+                    </button>
+                `;
+                break;
+            default:
+                // Custom Columns
+                const customCol = appSettings.custom_columns.find(c => c.key === key);
+                if (customCol) {
+                    let val = (massa.metadata_info || {})[key] || '-';
+                    if (val !== '-') {
+                        if (customCol.type === 'date') {
+                            const date = new Date(val);
+                            if (!isNaN(date.getTime())) {
+                                val = date.toLocaleDateString('pt-BR', { timeZone: 'UTC' });
                             }
+                        } else if (customCol.type === 'number') {
+                            if (!isNaN(val)) val = Number(val).toLocaleString('pt-BR');
+                        } else if (customCol.type === 'tag') {
+                            const tags = val.split(',').map(t => t.trim()).filter(t => t);
+                            val = `<div class="tags-container" style="justify-content: flex-start;">${tags.map(t => `<span class="tag">${t}</span>`).join('')}</div>`;
                         }
-                        cellContent = val;
                     }
-            }
-
-            if (key === 'actions') {
-                rowHtml += `<td><div class="action-buttons">${cellContent}</div></td>`;
-            } else {
-                rowHtml += `<td>${cellContent}</td>`;
-            }
-        });
+                    cellContent = val;
+                }
+        }
 
-        tr.innerHTML = rowHtml;
-        tbody.appendChild(tr);
+        if (key === 'actions') {
+            rowHtml += `<td><div class="action-buttons">${cellContent}</div></td>`;
+        } else {
+            rowHtml += `<td>${cellContent}</td>`;
+        }
     });
 
-    if (window.lucide) lucide.createIcons();
+    return rowHtml;
 }
 
-// ============ PAGINATION FUNCTIONS ============
-function renderPaginationControls(totalItems, totalPages) {
-    let container = document.getElementById('pagination-container');
+function createSpacerRow(id) {
+    const tr = document.createElement('tr');
+    tr.id = id;
+    tr.className = 'virtual-spacer';
+    tr.innerHTML = '<td></td>';
+    return tr;
+}
 
-    // Create container if not exists
-    if (!container) {
-        container = document.createElement('div');
-        container.id = 'pagination-container';
-        container.style.cssText = `
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-            padding: 16px 20px;
-            background: var(--bg-card);
-            border-radius: 12px;
-            margin-top: 15px;
-            border: 1px solid var(--border-color);
-            flex-wrap: wrap;
-            gap: 15px;
-        `;
+function setupVirtualTable() {
+    const container = document.querySelector('.table-container');
+    const tbody = document.getElementById('table-body');
+    if (!container || container.classList.contains('virtual')) return;
 
-        const tableSection = document.querySelector('.data-grid-section');
-        if (tableSection) {
-            tableSection.appendChild(container);
-        }
-    }
+    container.classList.add('virtual');
+    tbody.innerHTML = '';
+    tbody.appendChild(createSpacerRow('virtual-spacer-top'));
+    tbody.appendChild(createSpacerRow('virtual-spacer-bottom'));
+
+    const scheduleRender = () => {
+        if (scrollFrame) return;
+        scrollFrame = requestAnimationFrame(() => {
+            scrollFrame = null;
+            renderVisibleRows();
+        });
+    };
+    container.addEventListener('scroll', scheduleRender, { passive: true });
+    window.addEventListener('resize', scheduleRender);
+}
 
-    const startItem = totalItems === 0 ? 0 : (currentPage - 1) * itemsPerPage + 1;
-    const endItem = Math.min(currentPage * itemsPerPage, totalItems);
+function renderTable(massas) {
+    setupVirtualTable();
 
-    // Generate page buttons
-    let pageButtons = '';
-    const maxVisiblePages = 5;
-    let startPage = Math.max(1, currentPage - Math.floor(maxVisiblePages / 2));
-    let endPage = Math.min(totalPages, startPage + maxVisiblePages - 1);
+    tableData = massas;
+    tableColumns = getVisibleColumns();
+    tableVersion++; // Every bound row is stale now
 
-    if (endPage - startPage + 1 < maxVisiblePages) {
-        startPage = Math.max(1, endPage - maxVisiblePages + 1);
-    }
+    const colspan = tableColumns.length + (isSelectionMode ? 1 : 0);
+    document.querySelectorAll('.virtual-spacer td').forEach(td => td.colSpan = colspan);
 
-    // First page & ellipsis
-    if (startPage > 1) {
-        pageButtons += `<button class="pagination-btn" onclick="goToPage(1)" title="Primeira página">1</button>`;
-        if (startPage > 2) {
-            pageButtons += `<span style="color: var(--text-secondary); padding: 0 5px;">...</span>`;
-        }
-    }
+    renderTableFooter(massas.length);
+    renderVisibleRows();
+}
 
-    // Page numbers
-    for (let i = startPage; i <= endPage; i++) {
-        const isActive = i === currentPage;
-        pageButtons += `
-            <button class="pagination-btn ${isActive ? 'active' : ''}" 
-                    onclick="goToPage(${i})" 
-                    style="${isActive ? 'background: var(--primary); color: white;' : ''}">
-                ${i}
-            </button>
-        `;
+// Renders only the rows inside the scroll viewport (plus overscan).
+// Rows that stay in range are kept as-is; rows that scroll out are
+// detached into a pool and rebound to the rows scrolling in.
+function renderVisibleRows() {
+    const container = document.querySelector('.table-container');
+    const tbody = document.getElementById('table-body');
+    const topSpacer = document.getElementById('virtual-spacer-top');
+    const bottomSpacer = document.getElementById('virtual-spacer-bottom');
+    if (!container || !tbody || !topSpacer) return;
+
+    const total = tableData.length;
+    const headerHeight = container.querySelector('thead')?.offsetHeight || 0;
+    const scrollTop = Math.max(0, container.scrollTop - headerHeight);
+    const viewportHeight = container.clientHeight || window.innerHeight;
+
+    const start = Math.max(0, Math.floor(scrollTop / rowHeight) - VIRTUAL_OVERSCAN);
+    const end = Math.min(total, Math.ceil((scrollTop + viewportHeight) / rowHeight) + VIRTUAL_OVERSCAN);
+
+    // Recycle rows that left the range or belong to an older render
+    for (const [index, tr] of renderedRows) {
+        if (index < start || index >= end || tr._version !== tableVersion) {
+            renderedRows.delete(index);
+            tr.remove();
+            rowPool.push(tr);
+        }
     }
 
-    // Last page & ellipsis
-    if (endPage < totalPages) {
-        if (endPage < totalPages - 1) {
-            pageButtons += `<span style="color: var(--text-secondary); padding: 0 5px;">...</span>`;
+    let prev = topSpacer;
+    let created = false;
+    for (let i = start; i < end; i++) {
+        let tr = renderedRows.get(i);
+        if (!tr) {
+            tr = rowPool.pop() || document.createElement('tr');
+            tr.className = 'virtual-row';
+            tr.innerHTML = buildRowHtml(tableData[i], tableColumns);
+            tr._version = tableVersion;
+            renderedRows.set(i, tr);
+            created = true;
         }
-        pageButtons += `<button class="pagination-btn" onclick="goToPage(${totalPages})" title="Última página">${totalPages}</button>`;
+        if (prev.nextSibling !== tr) tbody.insertBefore(tr, prev.nextSibling);
+        prev = tr;
     }
 
-    container.innerHTML = `
-        <div style="display: flex; align-items: center; gap: 10px;">
-            <span style="color: var(--text-secondary); font-size: 0.9rem;">Itens por página:</span>
-            <select id="items-per-page" onchange="changeItemsPerPage(this.value)" style="
-                padding: 8px 12px;
-                border-radius: 8px;
-                border: 1px solid var(--border-color);
-                background: var(--bg-dark);
-                color: var(--text-primary);
-                cursor: pointer;
-                font-size: 0.9rem;
-            ">
-                ${itemsPerPageOptions.map(opt => `
-                    <option value="${opt}" ${opt === itemsPerPage ? 'selected' : ''}>${opt}</option>
-                `).join('')}
-            </select>
-        </div>
-        
-        <div style="display: flex; align-items: center; gap: 8px;">
-            <span style="color: var(--text-secondary); font-size: 0.9rem;">
-                Mostrando <strong style="color: var(--text-primary);">${startItem}-${endItem}</strong> de <strong style="color: var(--text-primary);">${totalItems}</strong> resultados
-            </span>
-        </div>
-        
-        <div style="display: flex; align-items: center; gap: 5px;">
-            <button class="pagination-btn" onclick="goToPage(1)" ${currentPage === 1 ? 'disabled' : ''} title="Primeira página" style="${currentPage === 1 ? 'opacity: 0.5; cursor: not-allowed;' : ''}">
-                <i data-lucide="chevrons-left" style="width: 16px; height: 16px;"></i>
-            </button>
-            <button class="pagination-btn" onclick="goToPage(${currentPage - 1})" ${currentPage === 1 ? 'disabled' : ''} title="Página anterior" style="${currentPage === 1 ? 'opacity: 0.5; cursor: not-allowed;' : ''}">
-                <i data-lucide="chevron-left" style="width: 16px; height: 16px;"></i>
-            </button>
-            
-            <div style="display: flex; align-items: center; gap: 3px; margin: 0 10px;">
-                ${pageButtons}
-            </div>
-            
-            <button class="pagination-btn" onclick="goToPage(${currentPage + 1})" ${currentPage === totalPages || totalPages === 0 ? 'disabled' : ''} title="Próxima página" style="${currentPage === totalPages || totalPages === 0 ? 'opacity: 0.5; cursor: not-allowed;' : ''}">
-                <i data-lucide="chevron-right" style="width: 16px; height: 16px;"></i>
-            </button>
-            <button class="pagination-btn" onclick="goToPage(${totalPages})" ${currentPage === totalPages || totalPages === 0 ? 'disabled' : ''} title="Última página" style="${currentPage === totalPages || totalPages === 0 ? 'opacity: 0.5; cursor: not-allowed;' : ''}">
-                <i data-lucide="chevrons-right" style="width: 16px; height: 16px;"></i>
-            </button>
-        </div>
-    `;
+    topSpacer.firstChild.style.height = `${start * rowHeight}px`;
+    bottomSpacer.firstChild.style.height = `${(total - end) * rowHeight}px`;
 
-    if (window.lucide) lucide.createIcons();
-}
+    if (created) {
+        if (window.lucide) lucide.createIcons({ root: tbody });
 
-function goToPage(page) {
-    const data = filteredMassas.length > 0 ? filteredMassas : allMassas;
-    const totalPages = Math.ceil(data.length / itemsPerPage);
+        // Measure the real row height the first time rows are on screen
+        const sample = renderedRows.get(start);
+        if (!rowHeightMeasured && sample && sample.offsetHeight > 0) {
+            rowHeightMeasured = true;
+            if (Math.abs(sample.offsetHeight - rowHeight) > 1) {
+                rowHeight = sample.offsetHeight;
+                renderVisibleRows();
+            }
+        }
+    }
+}
 
-    if (page < 1 || page > totalPages) return;
+function renderTableFooter(totalItems) {
+    let footer = document.getElementById('table-footer');
 
-    currentPage = page;
-    renderTable(data);
+    if (!footer) {
+        footer = document.createElement('div');
+        footer.id = 'table-footer';
+        footer.className = 'table-footer';
 
-    // Scroll to top of table
-    const tableSection = document.querySelector('.data-grid-section');
-    if (tableSection) {
-        tableSection.scrollIntoView({ behavior: 'smooth', block: 'start' });
+        const tableSection = document.querySelector('.data-grid-section');
+        if (tableSection) {
+            tableSection.appendChild(footer);
+        }
     }
-}
 
-function changeItemsPerPage(value) {
-    itemsPerPage = parseInt(value);
-    currentPage = 1; // Reset to first page
-    const data = filteredMassas.length > 0 ? filteredMassas : allMassas;
-    renderTable(data);
+    footer.innerHTML = `
+        <span>
+            <strong>${totalItems.toLocaleString('pt-BR')}</strong> de <strong>${allMassas.length.toLocaleString('pt-BR')}</strong> resultados
+        </span>
+    `;
 }
 
 function exportToCSV() {
@@ -1745,6 +1879,7 @@ async function saveEdit() {
 
             closeModal();
 
+            massaById.set(savedMassa.id, savedMassa);
             if (isNew) {
                 allMassas.push(savedMassa);
             } else {
@@ -1771,6 +1906,12 @@ async function saveEdit() {
 }
 
 // ============ FILE UPLOAD / IMPORT ============
+// CSV files are parsed by csv_worker.js and uploaded in batches. The index of the
+// last batch acknowledged in order is saved so a failed import can be resumed.
+const IMPORT_BATCH_SIZE = 1000; // Massas per upload request
+const IMPORT_CONCURRENCY = 3; // Upload requests in flight at once
+let importState = null;
+
 function handleFileUpload(event) {
     const file = event.target.files[0];
     if (!file) return;
@@ -1784,196 +1925,201 @@ function handleFileUpload(event) {
         return;
     }
 
-    // CSV file
-    const reader = new FileReader();
-    reader.onload = function (e) {
-        const text = e.target.result;
-        parseCSVAndUpload(text);
-    };
-    reader.readAsText(file, 'UTF-8');
-    event.target.value = '';
-}
-
-async function parseCSVAndUpload(text) {
-    const lines = text.split('\n').filter(line => line.trim());
-    if (lines.length < 2) {
-        showToast('Arquivo vazio ou inválido', 'error');
+    if (importState && importState.running) {
+        showToast('Já existe uma importação em andamento', 'warning');
+        event.target.value = '';
         return;
     }
 
-    // Detect separator (semicolon is common in Portuguese Excel)
-    const firstLine = lines[0];
-    let separator = ',';
-    if (firstLine.includes(';') && !firstLine.includes(',')) {
-        separator = ';';
-    } else if (firstLine.split(';').length > firstLine.split(',').length) {
-        separator = ';';
+    // CSV file - offer to resume a previous attempt of the same file
+    let skipBatches = 0;
+    const saved = parseInt(localStorage.getItem(importProgressKey(file))) || 0;
+    if (saved > 0 && confirm(`Esta planilha já foi parcialmente importada (${saved} lotes). Retomar de onde parou?`)) {
+        skipBatches = saved;
     }
-    console.log('Separador detectado:', separator);
-
-    // Parse headers
-    const headers = parseCSVLine(lines[0], separator);
-    console.log('Headers encontrados:', headers);
 
-    // Normalize headers for matching
-    const normalizedHeaders = headers.map(h =>
-        h.toLowerCase()
-            .normalize("NFD").replace(/[\u0300-\u036f]/g, "")
-            .replace(/[^a-z0-9]/g, "")
-    );
-    console.log('Headers normalizados:', normalizedHeaders);
-
-    // Find column indexes - matching user's spreadsheet format
-    const findIdx = (keywords) => {
-        const idx = normalizedHeaders.findIndex(h => keywords.some(k => h.includes(k)));
-        console.log(`Procurando ${keywords.join('/')} -> índice ${idx}`);
-        return idx;
-    };
-
-    // Column mapping based on user's spreadsheet:
-    // A: Tipo Doc, B: Documento, G: Região
-    const idxDocType = findIdx(['tipodoc', 'tipodo', 'tipo']);
-    const idxDocNum = findIdx(['documento']);
-    const idxNome = findIdx(['nome', 'name', 'razaosocial']);
-    const idxRegion = findIdx(['regiao']);
-    const idxQtdUcLigada = findIdx(['ucsligadas', 'qtducsligadas', 'ligadas']);
-    const idxQtdVencidas = findIdx(['faturasvencidas', 'qtdfaturasvencidas', 'vencidas']);
-    const idxQtdSuspensa = findIdx(['ucssuspensas', 'qtducssuspensas', 'suspensas']);
-    const idxQtdDesligada = findIdx(['ucsdesligadas', 'qtducsdesligadas', 'desligadas']);
-
-    console.log(`Índices: DocType=${idxDocType}, DocNum=${idxDocNum}, Region=${idxRegion}`);
-
-    // Helper function to pad document numbers with leading zeros
-
-    const padDocument = (docNum, docType) => {
-        // Remove any non-numeric characters
-        const numericOnly = docNum.replace(/\D/g, '');
+    startCSVImport(file, skipBatches);
+    event.target.value = '';
+}
 
-        // CPF = 11 digits, CNPJ = 14 digits
-        const targetLength = docType === 'CNPJ' ? 14 : 11;
+function importProgressKey(file) {
+    return `tdm-import-${file.name}-${file.size}-${file.lastModified}`;
+}
 
-        // Pad with leading zeros
-        return numericOnly.padStart(targetLength, '0');
+function startCSVImport(file, skipBatches = 0) {
+    const worker = new Worker('csv_worker.js');
+
+    importState = {
+        file,
+        worker,
+        running: true,
+        failed: false,
+        skipBatches,
+        ackedUpTo: skipBatches, // Every batch below this index is on the server
+        acked: new Set(),
+        queue: [],
+        inFlight: 0,
+        parseDone: false,
+        totalBatches: null,
+        bytesRead: 0,
+        totalBytes: file.size,
+        created: 0,
+        skipped: 0
     };
 
-    const massas = [];
+    worker.onmessage = (event) => handleImportMessage(importState, event.data);
+    worker.onerror = (event) => failImport(importState, event.message || 'Erro ao ler o arquivo');
 
-    for (let i = 1; i < lines.length; i++) {
-        const values = parseCSVLine(lines[i], separator);
-        if (values.length < 2) continue;
-
-        const massa = {};
-
-        // Core fields
-        massa.nome = idxNome > -1 && values[idxNome] ? values[idxNome].trim() : '';
-        massa.document_type = idxDocType > -1 && values[idxDocType] ? values[idxDocType].toUpperCase().trim() : 'CPF';
+    worker.postMessage({
+        type: 'start',
+        file,
+        customKeys: appSettings.custom_columns.map(c => c.key),
+        batchSize: IMPORT_BATCH_SIZE,
+        skipBatches,
+        maxPending: IMPORT_CONCURRENCY * 2
+    });
 
-        // Get raw document number and pad with leading zeros
-        const rawDocNum = idxDocNum > -1 && values[idxDocNum] ? values[idxDocNum].trim() : `${i}`;
-        massa.document_number = padDocument(rawDocNum, massa.document_type);
+    renderImportProgress(importState);
+    showToast(skipBatches > 0 ? 'Retomando importação...' : 'Importação iniciada', 'info');
+}
 
-        massa.region = idxRegion > -1 && values[idxRegion] ? values[idxRegion].trim() : 'Brasília';
+function handleImportMessage(state, msg) {
+    if (state.failed) return;
+
+    if (msg.type === 'batch') {
+        state.bytesRead = msg.bytesRead;
+        state.queue.push(msg);
+        pumpImportQueue(state);
+    } else if (msg.type === 'done') {
+        state.parseDone = true;
+        state.totalBatches = msg.batches;
+        state.bytesRead = msg.totalBytes;
+        if (msg.rowsParsed === 0) {
+            failImport(state, 'Arquivo vazio ou inválido');
+            return;
+        }
+        finishImportIfComplete(state);
+    } else if (msg.type === 'error') {
+        failImport(state, msg.message);
+    }
+    renderImportProgress(state);
+}
 
-        // Infer statuses
-        massa.status = "AVAILABLE";
+function pumpImportQueue(state) {
+    while (!state.failed && state.inFlight < IMPORT_CONCURRENCY && state.queue.length > 0) {
+        uploadImportBatch(state, state.queue.shift());
+    }
+}
 
-        // UC Counts - parse from CSV columns
-        massa.uc_ligada = idxQtdUcLigada > -1 ? parseInt(values[idxQtdUcLigada]) || 0 : 0;
-        massa.uc_desligada = idxQtdDesligada > -1 ? parseInt(values[idxQtdDesligada]) || 0 : 0;
-        massa.uc_suspensa = idxQtdSuspensa > -1 ? parseInt(values[idxQtdSuspensa]) || 0 : 0;
+async function uploadImportBatch(state, batch) {
+    state.inFlight++;
+    try {
+        const response = await fetch(`${API_URL}/massas/upload-csv`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(batch.massas)
+        });
 
-        // Financial Status
-        massa.financial_status = "ADIMPLENTE";
-        if (idxQtdVencidas > -1 && parseInt(values[idxQtdVencidas]) > 0) {
-            massa.financial_status = "COM_FATURAS_VENCIDAS";
+        if (!response.ok) {
+            const err = await response.json().catch(() => ({}));
+            throw new Error(err.detail || response.statusText);
         }
 
-        // Store ALL columns as metadata (including the newly mapped ones)
-        // We iterate headers again to capture everything
-        massa.metadata_info = {};
+        const result = await response.json();
+        state.created += result.created || 0;
+        state.skipped += result.skipped || 0;
+        acknowledgeImportBatch(state, batch.index);
+    } catch (error) {
+        console.error('Error uploading batch:', error);
+        failImport(state, error.message);
+        return;
+    } finally {
+        state.inFlight--;
+    }
 
-        headers.forEach((header, index) => {
-            if (values[index] !== undefined && values[index].trim() !== '') {
-                // Try to find the key we generated/matched
-                // If it was a standard column, we might not need it in metadata, but storing it doesn't hurt.
-                // Ideally we map check the slug again.
+    state.worker.postMessage({ type: 'ack' });
+    pumpImportQueue(state);
+    finishImportIfComplete(state);
+    renderImportProgress(state);
+}
 
-                const slug = header.trim().toLowerCase()
-                    .normalize("NFD").replace(/[\u0300-\u036f]/g, "")
-                    .replace(/[^a-z0-9]/g, "_");
+function acknowledgeImportBatch(state, index) {
+    state.acked.add(index);
+    // Advance the resume point over every contiguous acknowledged batch
+    while (state.acked.has(state.ackedUpTo)) {
+        state.acked.delete(state.ackedUpTo);
+        state.ackedUpTo++;
+    }
+    localStorage.setItem(importProgressKey(state.file), state.ackedUpTo);
+}
 
-                // If this slug is in custom_columns, store it!
-                if (appSettings.custom_columns.some(c => c.key === slug)) {
-                    massa.metadata_info[slug] = values[index].trim();
-                }
-            }
-        });
+function finishImportIfComplete(state) {
+    if (!state.running || !state.parseDone || state.inFlight > 0 || state.queue.length > 0) return;
+    if (state.ackedUpTo < state.totalBatches) return;
 
-        massa.tags = [];
-        if (massa.financial_status !== "ADIMPLENTE") massa.tags.push("com_divida");
-        if (massa.uc_ligada > 0) massa.tags.push("com_luz");
+    state.running = false;
+    state.worker.terminate();
+    localStorage.removeItem(importProgressKey(state.file));
+    removeImportProgress();
 
-        massas.push(massa);
-    }
+    showToast(`Importados ${state.created} itens. ${state.skipped} duplicados ignorados.`, 'success');
+    fetchMassas();
+}
 
-    console.log(`Processadas ${massas.length} massas`);
-    if (massas.length > 0) {
-        console.log('Exemplo:', massas[0]);
-    }
+function failImport(state, message) {
+    if (state.failed) return;
+    state.failed = true;
+    state.running = false;
+    state.worker.terminate();
+    renderImportProgress(state);
+    showToast('Erro na importação: ' + message, 'error');
+}
 
-    uploadMassas(massas);
+function resumeImport() {
+    if (!importState || !importState.failed) return;
+    startCSVImport(importState.file, importState.ackedUpTo);
 }
 
-function parseCSVLine(line, separator = ',') {
-    // Handle CSV with possible quoted fields
-    const result = [];
-    let current = '';
-    let inQuotes = false;
+function renderImportProgress(state) {
+    let container = document.getElementById('import-progress');
 
-    for (let i = 0; i < line.length; i++) {
-        const char = line[i];
+    if (!container) {
+        container = document.createElement('div');
+        container.id = 'import-progress';
+        container.className = 'import-progress';
 
-        if (char === '"') {
-            inQuotes = !inQuotes;
-        } else if (char === separator && !inQuotes) {
-            result.push(current.trim());
-            current = '';
-        } else {
-            current += char;
+        const tableSection = document.querySelector('.data-grid-section');
+        if (tableSection) {
+            tableSection.insertBefore(container, tableSection.firstChild);
         }
     }
-    result.push(current.trim());
 
-    return result;
-}
+    const percent = state.totalBytes > 0 ? Math.floor((state.bytesRead / state.totalBytes) * 100) : 0;
+    const uploaded = (state.created + state.skipped).toLocaleString('pt-BR');
 
-async function uploadMassas(massas) {
-    if (massas.length === 0) {
-        showToast('Nenhuma massa válida para importar', 'warning');
-        return;
-    }
+    container.classList.toggle('failed', state.failed);
+    container.innerHTML = `
+        <div class="import-progress-info">
+            <span>${state.failed ? 'Importação interrompida' : 'Importando planilha...'} <strong>${percent}%</strong></span>
+            <span>${uploaded} linhas enviadas · ${state.skipped.toLocaleString('pt-BR')} duplicadas</span>
+            ${state.failed ? `
+                <button class="btn btn-secondary" onclick="resumeImport()">
+                    <i data-lucide="rotate-cw"></i> Retomar
+                </button>
+                <button class="btn-icon" onclick="removeImportProgress()" title="Fechar">
+                    <i data-lucide="x"></i>
+                </button>` : ''}
+        </div>
+        <div class="import-progress-bar"><div style="width: ${percent}%;"></div></div>
+    `;
 
-    try {
-        const response = await fetch(`${API_URL}/massas/upload-csv`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify(massas)
-        });
+    if (window.lucide) lucide.createIcons({ root: container });
+}
 
-        if (response.ok) {
-            const result = await response.json();
-            showToast('Importação realizada com sucesso!', 'success');
-            fetchMassas();
-        } else {
-            const err = await response.json();
-            showToast('Erro na importação: ' + (err.detail || response.statusText), 'error');
-        }
-    } catch (error) {
-        console.error('Error uploading:', error);
-        showToast('Erro ao conectar com servidor', 'error');
-    }
+function removeImportProgress() {
+    document.getElementById('import-progress')?.remove();
 }
 
 // ============ SIDEBAR LOGIC ============
@@ -2079,7 +2225,7 @@ function renderAdminColumnsList() {
                 input.placeholder = 'Filtrar...';
                 if (key === 'id') { input.placeholder = 'ID'; input.style.width = '50px'; }
                 if (key === 'nome') input.placeholder = 'Nome...';
-                input.onkeyup = applyColumnFilters;
+                input.oninput = applyColumnFiltersDebounced;
                 th.appendChild(input);
             } else if (def.filterType === 'select') {
                 const select = document.createElement('select');
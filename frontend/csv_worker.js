@@ -0,0 +1,263 @@
+// CSV Import Worker
+// Streams the selected File in chunks, parses it off the UI thread and posts
+// massas back to the page in fixed-size batches. The page acknowledges every
+// uploaded batch, which bounds how far parsing can run ahead of the upload.
+
+const QUOTE = 34; // "
+const LF = 10; // \n
+const CR = 13; // \r
+
+let pendingBatches = 0;
+let maxPendingBatches = 4;
+let creditWaiter = null;
+
+self.onmessage = (event) => {
+    const msg = event.data;
+    if (msg.type === 'start') {
+        maxPendingBatches = msg.maxPending || maxPendingBatches;
+        importFile(msg).catch(error => {
+            self.postMessage({ type: 'error', message: error.message || String(error) });
+        });
+    } else if (msg.type === 'ack') {
+        pendingBatches--;
+        if (creditWaiter) {
+            creditWaiter();
+            creditWaiter = null;
+        }
+    }
+};
+
+function waitForCredit() {
+    if (pendingBatches < maxPendingBatches) return Promise.resolve();
+    return new Promise(resolve => creditWaiter = resolve);
+}
+
+// ============ CSV PARSER ============
+// Incremental parser: handles quoted fields with separators, escaped quotes ("")
+// and line breaks inside quotes, even when they are split across chunks.
+function createCSVParser(separator, onRow) {
+    const SEP = separator.charCodeAt(0);
+    let field = '';
+    let row = [];
+    let inQuotes = false;
+    let quotePending = false; // Saw a quote inside quotes; next char decides
+
+    const endField = () => {
+        row.push(field.trim());
+        field = '';
+    };
+
+    const endRow = () => {
+        endField();
+        if (row.some(v => v !== '')) onRow(row);
+        row = [];
+    };
+
+    return {
+        push(chunk) {
+            let start = 0;
+            for (let i = 0; i < chunk.length; i++) {
+                const ch = chunk.charCodeAt(i);
+
+                if (quotePending) {
+                    quotePending = false;
+                    if (ch === QUOTE) {
+                        field += '"';
+                        start = i + 1;
+                        continue;
+                    }
+                    inQuotes = false;
+                }
+
+                if (inQuotes) {
+                    if (ch === QUOTE) {
+                        field += chunk.slice(start, i);
+                        start = i + 1;
+                        quotePending = true;
+                    }
+                    continue;
+                }
+
+                if (ch === QUOTE) {
+                    field += chunk.slice(start, i);
+                    start = i + 1;
+                    inQuotes = true;
+                } else if (ch === SEP) {
+                    field += chunk.slice(start, i);
+                    start = i + 1;
+                    endField();
+                } else if (ch === LF) {
+                    field += chunk.slice(start, i);
+                    start = i + 1;
+                    endRow();
+                } else if (ch === CR) {
+                    field += chunk.slice(start, i);
+                    start = i + 1;
+                }
+            }
+            field += chunk.slice(start);
+        },
+
+        end() {
+            if (field !== '' || row.length > 0) endRow();
+        }
+    };
+}
+
+// Semicolon is common in Portuguese Excel exports
+function detectSeparator(firstLine) {
+    if (firstLine.includes(';') && !firstLine.includes(',')) return ';';
+    if (firstLine.split(';').length > firstLine.split(',').length) return ';';
+    return ',';
+}
+
+// ============ ROW MAPPING ============
+const normalizeHeader = (h) => h.toLowerCase()
+    .normalize("NFD").replace(/[\u0300-\u036f]/g, "")
+    .replace(/[^a-z0-9]/g, "");
+
+const slugifyHeader = (h) => h.trim().toLowerCase()
+    .normalize("NFD").replace(/[\u0300-\u036f]/g, "")
+    .replace(/[^a-z0-9]/g, "_");
+
+// Pad document numbers with leading zeros (CPF = 11 digits, CNPJ = 14 digits)
+function padDocument(docNum, docType) {
+    const numericOnly = docNum.replace(/\D/g, '');
+    const targetLength = docType === 'CNPJ' ? 14 : 11;
+    return numericOnly.padStart(targetLength, '0');
+}
+
+function createRowMapper(headers, customKeys) {
+    const normalizedHeaders = headers.map(normalizeHeader);
+    const findIdx = (keywords) => normalizedHeaders.findIndex(h => keywords.some(k => h.includes(k)));
+
+    // Column mapping based on user's spreadsheet:
+    // A: Tipo Doc, B: Documento, G: Região
+    const idxDocType = findIdx(['tipodoc', 'tipodo', 'tipo']);
+    const idxDocNum = findIdx(['documento']);
+    const idxNome = findIdx(['nome', 'name', 'razaosocial']);
+    const idxRegion = findIdx(['regiao']);
+    const idxQtdUcLigada = findIdx(['ucsligadas', 'qtducsligadas', 'ligadas']);
+    const idxQtdVencidas = findIdx(['faturasvencidas', 'qtdfaturasvencidas', 'vencidas']);
+    const idxQtdSuspensa = findIdx(['ucssuspensas', 'qtducssuspensas', 'suspensas']);
+    const idxQtdDesligada = findIdx(['ucsdesligadas', 'qtducsdesligadas', 'desligadas']);
+
+    // Only columns configured as custom columns are stored as metadata
+    const customKeySet = new Set(customKeys);
+    const metadataColumns = headers
+        .map((header, index) => ({ key: slugifyHeader(header), index }))
+        .filter(col => customKeySet.has(col.key));
+
+    return (values, rowNumber) => {
+        const massa = {};
+
+        // Core fields
+        massa.nome = idxNome > -1 && values[idxNome] ? values[idxNome] : '';
+        massa.document_type = idxDocType > -1 && values[idxDocType] ? values[idxDocType].toUpperCase() : 'CPF';
+
+        const rawDocNum = idxDocNum > -1 && values[idxDocNum] ? values[idxDocNum] : `${rowNumber}`;
+        massa.document_number = padDocument(rawDocNum, massa.document_type);
+
+        massa.region = idxRegion > -1 && values[idxRegion] ? values[idxRegion] : 'Brasília';
+        massa.status = "AVAILABLE";
+
+        // UC Counts - parse from CSV columns
+        massa.uc_ligada = idxQtdUcLigada > -1 ? parseInt(values[idxQtdUcLigada]) || 0 : 0;
+        massa.uc_desligada = idxQtdDesligada > -1 ? parseInt(values[idxQtdDesligada]) || 0 : 0;
+        massa.uc_suspensa = idxQtdSuspensa > -1 ? parseInt(values[idxQtdSuspensa]) || 0 : 0;
+
+        // Financial Status
+        massa.financial_status = "ADIMPLENTE";
+        if (idxQtdVencidas > -1 && parseInt(values[idxQtdVencidas]) > 0) {
+            massa.financial_status = "COM_FATURAS_VENCIDAS";
+        }
+
+        massa.metadata_info = {};
+        metadataColumns.forEach(col => {
+            if (values[col.index]) massa.metadata_info[col.key] = values[col.index];
+        });
+
+        massa.tags = [];
+        if (massa.financial_status !== "ADIMPLENTE") massa.tags.push("com_divida");
+        if (massa.uc_ligada > 0) massa.tags.push("com_luz");
+
+        return massa;
+    };
+}
+
+// ============ IMPORT LOOP ============
+async function importFile({ file, customKeys = [], batchSize = 1000, skipBatches = 0 }) {
+    const reader = file.stream().getReader();
+    const decoder = new TextDecoder('utf-8');
+
+    let parser = null;
+    let headerBuffer = '';
+    let mapRow = null;
+    let rowNumber = 0;
+    let rowsParsed = 0;
+    let batchIndex = 0;
+    let batch = [];
+    let bytesRead = 0;
+    const ready = []; // Full batches waiting to be posted
+
+    const onRow = (values) => {
+        if (!mapRow) {
+            mapRow = createRowMapper(values, customKeys);
+            return;
+        }
+        rowNumber++;
+        if (values.length < 2) return;
+        batch.push(mapRow(values, rowNumber));
+        rowsParsed++;
+        if (batch.length >= batchSize) {
+            ready.push(batch);
+            batch = [];
+        }
+    };
+
+    const flush = async () => {
+        while (ready.length > 0) {
+            const massas = ready.shift();
+            const index = batchIndex++;
+            // Batches acknowledged in a previous attempt are parsed but not resent
+            if (index < skipBatches) continue;
+
+            await waitForCredit();
+            pendingBatches++;
+            self.postMessage({ type: 'batch', index, massas, rowsParsed, bytesRead, totalBytes: file.size });
+        }
+    };
+
+    const feed = (text) => {
+        if (parser) {
+            parser.push(text);
+            return;
+        }
+        // Wait for the complete first line to pick the separator
+        headerBuffer += text;
+        const newline = headerBuffer.indexOf('\n');
+        if (newline === -1) return;
+        parser = createCSVParser(detectSeparator(headerBuffer.slice(0, newline)), onRow);
+        parser.push(headerBuffer);
+        headerBuffer = '';
+    };
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        bytesRead += value.byteLength;
+        feed(decoder.decode(value, { stream: true }));
+        await flush();
+    }
+
+    feed(decoder.decode());
+    if (!parser && headerBuffer) {
+        parser = createCSVParser(detectSeparator(headerBuffer), onRow);
+        parser.push(headerBuffer);
+    }
+    if (parser) parser.end();
+    if (batch.length > 0) ready.push(batch);
+    await flush();
+
+    self.postMessage({ type: 'done', batches: batchIndex, rowsParsed, totalBytes: file.size });
+}
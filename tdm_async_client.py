@@ -0,0 +1,505 @@
+"""
+TDM Async Client - Cliente assíncrono (asyncio) para automação de testes
+
+Mesma interface do TDMClient, para suítes baseadas em asyncio (ex: Playwright
+async). Todas as chamadas compartilham um pool de conexões keep-alive e um
+limite de requisições simultâneas, então um único event loop pode reservar
+massas para centenas de cenários ao mesmo tempo sem uma thread por chamada.
+
+Instalação:
+    pip install httpx
+    # copie tdm_client.py e tdm_async_client.py para seu projeto
+
+Uso básico:
+    from tdm_async_client import AsyncTDMClient, AsyncTDMMassaContext
+
+    async with AsyncTDMClient("https://seu-app.onrender.com") as tdm:
+        massa = await tdm.get_available_massa(doc_type="CPF")
+        # Usar no teste...
+        await tdm.release_massa(massa["id"])
+
+        # Ou, com liberação automática:
+        async with AsyncTDMMassaContext(tdm, doc_type="CPF") as massa:
+            ...
+"""
+
+import asyncio
+import os
+import socket
+import time
+from typing import Optional, Dict, List, Any, Union
+
+import httpx
+
+from tdm_client import (
+    IDEMPOTENT_METHODS,
+    RETRY_STATUSES,
+    LatencyStats,
+    _criteria_params,
+    _endpoint_key,
+    _idempotency_headers,
+    _retry_delay,
+)
+
+
+class AsyncTDMClient:
+    """
+    Cliente assíncrono para o sistema de Gerenciamento de Massas de Teste (TDM).
+
+    Attributes:
+        api_url: URL base da API do TDM
+        timeout: Timeout padrão para requisições (segundos)
+        lease_ttl: Duração da reserva (segundos) pedida em cada checkout
+        consumer_id: Identificação deste processo nas reservas
+        stats: Latência das chamadas por endpoint (ver latency_stats())
+    """
+
+    def __init__(
+        self,
+        api_url: str = None,
+        timeout: float = 30,
+        lease_ttl: int = 900,
+        auto_renew: bool = True,
+        consumer_id: str = None,
+        max_concurrency: int = 20,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        backoff_max: float = 10
+    ):
+        """
+        Inicializa o cliente TDM assíncrono.
+
+        Args:
+            api_url: URL da API. Se não fornecida, usa a variável de ambiente
+                     TDM_API_URL ou https://tdm-api-vn0v.onrender.com como fallback.
+            timeout: Timeout para requisições em segundos.
+            lease_ttl: Segundos que uma massa reservada fica IN_USE sem renovação.
+            auto_renew: Se True, renova as reservas em uma task em segundo plano.
+            consumer_id: Identificação nas reservas (padrão: host e PID).
+            max_concurrency: Requisições simultâneas (e conexões keep-alive)
+                             no máximo; as demais aguardam a vez no cliente.
+            max_retries: Novas tentativas para chamadas idempotentes que
+                         falham por rede ou com 429/502/503/504.
+            backoff: Espera base (segundos) da primeira nova tentativa; dobra
+                     a cada tentativa, com jitter aleatório.
+            backoff_max: Espera máxima entre tentativas (segundos).
+        """
+        self.api_url = api_url or os.getenv("TDM_API_URL", "https://tdm-api-vn0v.onrender.com")
+        self.timeout = timeout
+        self.lease_ttl = lease_ttl
+        self.auto_renew = auto_renew
+        self.consumer_id = consumer_id or f"tdm_async_client@{socket.gethostname()}:{os.getpid()}"
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.stats = LatencyStats()
+
+        # O semáforo limita as requisições em voo ao tamanho do pool, então
+        # nenhuma fica esperando conexão dentro do httpx (e estourando timeout)
+        self._http = httpx.AsyncClient(
+            base_url=self.api_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # Reservas renovadas automaticamente: {endpoint de heartbeat: ttl}
+        # e o próximo heartbeat de cada uma (time.monotonic())
+        self._leases: Dict[str, int] = {}
+        self._renew_at: Dict[str, float] = {}
+        self._renew_wake = asyncio.Event()
+        self._renew_task: Optional[asyncio.Task] = None
+
+    async def _request(
+        self,
+        method: str,
+        endpoint: str,
+        idempotent: bool = None,
+        quiet_statuses=(),
+        idempotency_key: bool = False,
+        **kwargs
+    ) -> Any:
+        """
+        Faz uma requisição HTTP para a API.
+
+        Chamadas idempotentes (GET/PUT/DELETE ou idempotent=True) são
+        repetidas em falhas transitórias. As demais só são repetidas quando
+        a conexão nem chegou a ser aberta. Com idempotency_key=True a chamada
+        leva um Idempotency-Key (o mesmo em todas as tentativas) e pode ser
+        repetida com segurança. Erros HTTP com status em `quiet_statuses`
+        (respostas esperadas, ex: 404 no checkout) não são registrados no log.
+        """
+        if idempotency_key:
+            kwargs["headers"] = _idempotency_headers(kwargs.get("headers"))
+            idempotent = True
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+
+        key = _endpoint_key(method, endpoint)
+        start = time.perf_counter()
+        retries = 0
+        error = True
+
+        try:
+            while True:
+                response = None
+                try:
+                    async with self._semaphore:
+                        response = await self._http.request(method, endpoint, **kwargs)
+                    failure = None
+                    retryable = idempotent and response.status_code in RETRY_STATUSES
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    # A requisição não chegou a ser enviada
+                    failure, retryable = e, True
+                except httpx.TransportError as e:
+                    failure, retryable = e, idempotent
+
+                if retryable and retries < self.max_retries:
+                    retries += 1
+                    await self._wait_before_retry(retries, response)
+                    continue
+
+                if failure is not None:
+                    raise failure
+                response.raise_for_status()
+                error = False
+
+                if response.text:
+                    return response.json()
+                return None
+        except httpx.HTTPError as e:
+            if not (isinstance(e, httpx.HTTPStatusError) and e.response.status_code in quiet_statuses):
+                print(f"[TDM] Erro na requisição: {e}")
+            raise
+        finally:
+            self.stats.record(key, time.perf_counter() - start, retries, error)
+
+    async def _wait_before_retry(self, attempt: int, response=None):
+        """Backoff exponencial com jitter; respeita Retry-After quando presente."""
+        await asyncio.sleep(_retry_delay(attempt, response, self.backoff, self.backoff_max))
+
+    # ==================== CONEXÃO E DESEMPENHO ====================
+
+    async def warm_up(self, timeout: float = 120, connections: int = None) -> bool:
+        """
+        Acorda a API e já abre as conexões do pool.
+
+        Para rodar em paralelo com o resto do setup, agende como task:
+        asyncio.create_task(tdm.warm_up()).
+
+        Returns:
+            True quando /health respondeu 2xx, False se isso não aconteceu
+            dentro do timeout (o 502/503 do proxy do Render não conta)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                response = await self._http.get("/health", timeout=min(self.timeout, timeout))
+                if response.is_success:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(1)
+
+        async def ping():
+            try:
+                async with self._semaphore:
+                    await self._http.get("/health")
+            except httpx.HTTPError:
+                pass
+
+        await asyncio.gather(*(ping() for _ in range(connections or self.max_concurrency)))
+        return True
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Latência das chamadas feitas por este cliente, por endpoint:
+        chamadas, erros, novas tentativas, média, p50, p95, p99 e máximo (ms).
+        """
+        return self.stats.summary()
+
+    # ==================== MÉTODOS DE BUSCA ====================
+
+    async def get_all_massas(self) -> List[Dict]:
+        """Retorna todas as massas cadastradas."""
+        return await self._request("GET", "/massas/")
+
+    async def get_massa_by_id(self, massa_id: int) -> Optional[Dict]:
+        """Busca uma massa específica pelo ID."""
+        return await self._request("GET", f"/massas/{massa_id}")
+
+    async def search_massas(
+        self,
+        status: str = None,
+        region: str = None,
+        document_type: str = None,
+        tags: List[str] = None,
+        q: str = None,
+        where: Union[str, List[str]] = None
+    ) -> List[Dict]:
+        """Busca massas com filtros específicos (mesmos filtros do TDMClient)."""
+        params = _criteria_params(region, document_type, tags, where)
+        if status:
+            params["status"] = status
+        if q:
+            params["q"] = q
+        return await self._request("GET", "/massas/", params=params)
+
+    # ==================== MÉTODOS DE RESERVA ====================
+
+    async def get_available_massa(
+        self,
+        region: str = None,
+        doc_type: str = None,
+        tags: List[str] = None,
+        auto_reserve: bool = True,
+        where: Union[str, List[str]] = None,
+        ttl: int = None
+    ) -> Optional[Dict]:
+        """
+        Busca e reserva (checkout) uma massa disponível.
+
+        Returns:
+            Dicionário com dados da massa ou None se não encontrar
+        """
+        if not auto_reserve:
+            massas = await self.search_massas(
+                status="AVAILABLE", region=region, document_type=doc_type, tags=tags, where=where
+            )
+            if not massas:
+                print("[TDM] Nenhuma massa disponível encontrada com os critérios especificados")
+                return None
+            return massas[0]
+
+        ttl = ttl or self.lease_ttl
+        params = _criteria_params(region, doc_type, tags, where)
+        params.update({"consumer_id": self.consumer_id, "ttl": ttl})
+
+        try:
+            massa = await self._request(
+                "POST", "/massas/checkout", idempotency_key=True, quiet_statuses=(404,), params=params
+            )
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                print("[TDM] Nenhuma massa disponível encontrada com os critérios especificados")
+                return None
+            raise
+
+        self._track_lease(f"/massas/{massa['id']}/heartbeat", ttl)
+        print(f"[TDM] Massa #{massa['id']} reservada com sucesso")
+        return massa
+
+    async def get_available_massas(
+        self,
+        count: int,
+        region: str = None,
+        doc_type: str = None,
+        tags: List[str] = None,
+        ttl: int = None
+    ) -> List[Dict]:
+        """Reserva `count` massas de uma vez (tudo ou nada); lista vazia se faltar."""
+        line = {"count": count, "region": region, "document_type": doc_type, "tags": tags or []}
+        run = await self.allocate_run([line], ttl=ttl)
+        return run["massas"] if run else []
+
+    async def reserve_massa(self, massa_id: int, reserved_for: str = None) -> bool:
+        """Reserva uma massa específica para uso, com lease renovado automaticamente."""
+        try:
+            data = {"status": "IN_USE"}
+            if reserved_for:
+                data["reserved_for"] = reserved_for
+            params = {"consumer_id": self.consumer_id, "ttl": self.lease_ttl}
+            await self._request("PUT", f"/massas/{massa_id}", json=data, params=params)
+            self._track_lease(f"/massas/{massa_id}/heartbeat", self.lease_ttl)
+            return True
+        except Exception:
+            return False
+
+    # ==================== RESERVA EM LOTE (RUNS) ====================
+
+    async def allocate_run(self, lines: List[Dict], ttl: int = None) -> Optional[Dict]:
+        """
+        Reserva todas as massas de uma execução em uma transação (ver
+        TDMClient.allocate_run). Retorna None se o pool não atende o manifesto.
+        """
+        ttl = ttl or self.lease_ttl
+        body = {"consumer_id": self.consumer_id, "lines": lines, "ttl": ttl}
+        try:
+            run = await self._request("POST", "/runs", idempotency_key=True, quiet_statuses=(409,), json=body)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 409:
+                print(f"[TDM] Manifesto não atendido: {e.response.json().get('detail')}")
+                return None
+            raise
+
+        self._track_lease(f"/runs/{run['run']['id']}/heartbeat", ttl)
+        print(f"[TDM] Run {run['run']['id']}: {len(run['massas'])} massas reservadas")
+        return run
+
+    async def release_run(self, run_id: str, status: str = "AVAILABLE") -> int:
+        """Libera (ou consome) todas as massas de um run. Retorna quantas."""
+        result = await self._request(
+            "POST", f"/runs/{run_id}/release", idempotency_key=True, params={"new_status": status}
+        )
+        self._forget_lease(f"/runs/{run_id}/heartbeat")
+        return result["released"]
+
+    # ==================== RESERVAS (LEASE) ====================
+
+    async def heartbeat(self, massa_id: int, ttl: int = None) -> bool:
+        """Renova a reserva de uma massa; False se já expirou ou foi liberada."""
+        return await self._renew(f"/massas/{massa_id}/heartbeat", ttl or self.lease_ttl)
+
+    async def _renew(self, path: str, ttl: int) -> bool:
+        params = {"ttl": ttl}
+        if path.startswith("/massas/"):
+            params["consumer_id"] = self.consumer_id
+        try:
+            result = await self._request("POST", path, idempotent=True, quiet_statuses=(404, 409), params=params)
+        except httpx.HTTPStatusError:
+            return False
+        return bool(result.get("renewed", 1))
+
+    def _track_lease(self, path: str, ttl: int):
+        if not self.auto_renew:
+            return
+        self._leases[path] = ttl
+        self._renew_at[path] = time.monotonic() + ttl / 3
+        # Acorda o loop: a reserva nova pode vencer antes da espera atual
+        self._renew_wake.set()
+        if self._renew_task is None:
+            self._renew_task = asyncio.create_task(self._renew_loop())
+
+    def _forget_lease(self, path: str):
+        self._leases.pop(path, None)
+        self._renew_at.pop(path, None)
+
+    async def _renew_loop(self):
+        """Renova cada reserva a cada 1/3 do seu próprio TTL; as que vencem juntas, em paralelo."""
+        while True:
+            now = time.monotonic()
+            due = {path: self._leases[path] for path, at in self._renew_at.items() if at <= now}
+            if not due:
+                next_at = min(self._renew_at.values(), default=now + self.lease_ttl / 3)
+                self._renew_wake.clear()
+                try:
+                    await asyncio.wait_for(self._renew_wake.wait(), next_at - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            for path, ttl in due.items():
+                self._renew_at[path] = now + ttl / 3
+            results = await asyncio.gather(
+                *(self._renew(path, ttl) for path, ttl in due.items()),
+                return_exceptions=True,
+            )
+            for path, renewed in zip(due, results):
+                # Ignora reservas liberadas enquanto o heartbeat estava em curso
+                if renewed is False and path in self._leases:
+                    print(f"[TDM] Reserva expirada: {path.rsplit('/', 1)[0]}")
+                    self._forget_lease(path)
+
+    # ==================== MÉTODOS DE ATUALIZAÇÃO ====================
+
+    async def update_status(self, massa_id: int, status: str) -> bool:
+        """Atualiza o status de uma massa (AVAILABLE, IN_USE, BLOCKED, CONSUMED)."""
+        try:
+            await self._request("PUT", f"/massas/{massa_id}", json={"status": status})
+            if status != "IN_USE":
+                self._forget_lease(f"/massas/{massa_id}/heartbeat")
+            return True
+        except Exception:
+            return False
+
+    async def _release(self, massa_id: int, status: str) -> bool:
+        """Encerra a reserva com o status dado (POST /release, com Idempotency-Key)."""
+        try:
+            await self._request(
+                "POST", f"/massas/{massa_id}/release", idempotency_key=True, params={"new_status": status}
+            )
+            self._forget_lease(f"/massas/{massa_id}/heartbeat")
+            return True
+        except Exception:
+            return False
+
+    async def release_massa(self, massa_id: int) -> bool:
+        """Libera uma massa após o uso, marcando como AVAILABLE."""
+        success = await self._release(massa_id, "AVAILABLE")
+        if success:
+            print(f"[TDM] Massa #{massa_id} liberada com sucesso")
+        return success
+
+    async def consume_massa(self, massa_id: int) -> bool:
+        """Marca uma massa como consumida (não pode mais ser usada)."""
+        success = await self._release(massa_id, "CONSUMED")
+        if success:
+            print(f"[TDM] Massa #{massa_id} marcada como consumida")
+        return success
+
+    async def block_massa(self, massa_id: int, reason: str = None) -> bool:
+        """Bloqueia uma massa (ex: dados inválidos, problema detectado); `reason` aparece só no log."""
+        success = await self._release(massa_id, "BLOCKED")
+        if success:
+            print(f"[TDM] Massa #{massa_id} bloqueada" + (f": {reason}" if reason else ""))
+        return success
+
+    async def release_massas(self, massa_ids: List[int], status: str = "AVAILABLE") -> List[bool]:
+        """Libera (ou consome/bloqueia) várias massas em paralelo."""
+        return await asyncio.gather(*(self._release(massa_id, status) for massa_id in massa_ids))
+
+    # ==================== MÉTODOS DE CRIAÇÃO ====================
+
+    async def create_massa(self, data: Dict) -> Optional[Dict]:
+        """Cria uma nova massa no sistema (mesmos campos do TDMClient.create_massa)."""
+        return await self._request("POST", "/massas/", json=data)
+
+    # ==================== CONTEXT MANAGER ====================
+
+    async def __aenter__(self):
+        """Permite uso com 'async with'."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Fecha o pool de conexões ao sair do context manager."""
+        await self.close()
+
+    async def close(self):
+        """Para a renovação automática e fecha o pool de conexões."""
+        if self._renew_task is not None:
+            self._renew_task.cancel()
+            try:
+                await self._renew_task
+            except asyncio.CancelledError:
+                pass
+            self._renew_task = None
+        await self._http.aclose()
+
+
+# ==================== CLASSE HELPER PARA TESTES ====================
+
+class AsyncTDMMassaContext:
+    """
+    Versão 'async with' do TDMMassaContext: reserva uma massa na entrada e
+    libera na saída, mesmo se o teste falhar.
+
+    Example:
+        async with AsyncTDMMassaContext(tdm, doc_type="CPF") as massa:
+            await page.fill("#cpf", massa["document_number"])
+    """
+
+    def __init__(self, client: AsyncTDMClient, **search_kwargs):
+        self.client = client
+        self.search_kwargs = search_kwargs
+        self.massa = None
+
+    async def __aenter__(self) -> Optional[Dict]:
+        self.massa = await self.client.get_available_massa(**self.search_kwargs)
+        return self.massa
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.massa:
+            await self.client.release_massa(self.massa["id"])
@@ -23,8 +23,253 @@ Uso básico:
 """
 
 import requests
+import json
 import os
-from typing import Optional, Dict, List, Any
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, List, Any, Union
+
+# Respostas transitórias (ex: 502 do proxy do Render) que valem nova tentativa
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# Métodos que podem ser repetidos sem risco de efeito duplicado
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+def _default_pool_size() -> int:
+    """Uma conexão por worker, no mesmo padrão do ThreadPoolExecutor."""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _idempotency_headers(headers: Dict[str, str] = None) -> Dict[str, str]:
+    """Cabeçalhos com uma Idempotency-Key nova, a mesma em todas as tentativas da chamada."""
+    return {**(headers or {}), IDEMPOTENCY_HEADER: uuid.uuid4().hex}
+
+
+def _endpoint_key(method: str, endpoint: str) -> str:
+    """Agrupa a latência por endpoint: IDs no caminho viram {id}."""
+    return f"{method} {re.sub(r'/([0-9]+|[0-9a-f]{32})(?=/|$)', '/{id}', endpoint)}"
+
+
+def _pooled_session(pool_size: int) -> requests.Session:
+    """
+    Sessão com até `pool_size` conexões reaproveitadas entre chamadas (sem
+    novo handshake TCP/TLS); as novas tentativas são feitas em _send, não
+    pelo urllib3.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _retry_delay(attempt: int, response, backoff: float, backoff_max: float) -> float:
+    """Backoff exponencial com jitter; respeita Retry-After quando presente."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(backoff_max, float(retry_after))
+    # "Full jitter": evita que vários workers tentem de novo juntos
+    return random.uniform(0, min(backoff_max, backoff * 2 ** (attempt - 1)))
+
+
+def _send(
+    session: requests.Session,
+    method: str,
+    url: str,
+    idempotent: bool,
+    max_retries: int,
+    backoff: float,
+    backoff_max: float,
+    stats: "LatencyStats",
+    key: str,
+    **kwargs
+) -> requests.Response:
+    """
+    Envia a requisição, repetindo falhas transitórias (conexão, 429/502/503/504).
+    Chamadas não idempotentes só são repetidas quando a conexão nem chegou a
+    ser aberta. Retorna a resposta final sem levantar erro HTTP e registra a
+    latência em `stats` sob `key`. Usado também por client/tdm_client.py.
+    """
+    start = time.perf_counter()
+    retries = 0
+    error = True
+    
+    try:
+        while True:
+            response = None
+            try:
+                response = session.request(method, url, **kwargs)
+                failure = None
+                retryable = idempotent and response.status_code in RETRY_STATUSES
+            except requests.exceptions.ConnectTimeout as e:
+                # A requisição não chegou a ser enviada
+                failure, retryable = e, True
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                failure, retryable = e, idempotent
+            
+            if retryable and retries < max_retries:
+                retries += 1
+                time.sleep(_retry_delay(retries, response, backoff, backoff_max))
+                continue
+            
+            if failure is not None:
+                raise failure
+            error = not response.ok
+            return response
+    finally:
+        stats.record(key, time.perf_counter() - start, retries, error)
+
+
+def _criteria_params(
+    region: str = None,
+    doc_type: str = None,
+    tags: List[str] = None,
+    where: Union[str, List[str]] = None
+) -> Dict[str, Any]:
+    """Parâmetros de consulta dos critérios de busca/checkout."""
+    params = {}
+    if region:
+        params["region"] = region
+    if doc_type:
+        params["document_type"] = doc_type
+    if tags:
+        params["tags"] = ",".join(tags)
+    if where:
+        params["where"] = [where] if isinstance(where, str) else list(where)
+    return params
+
+
+class LatencyStats:
+    """
+    Latência das chamadas à API, agrupada por endpoint.
+    
+    Guarda as últimas `window` medições de cada endpoint para calcular
+    percentis sem crescer indefinidamente.
+    """
+    
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+    
+    def record(self, key: str, seconds: float, retries: int = 0, error: bool = False):
+        with self._lock:
+            samples = self._samples.setdefault(key, deque(maxlen=self.window))
+            samples.append(seconds)
+            counts = self._counts.setdefault(key, {"calls": 0, "errors": 0, "retries": 0})
+            counts["calls"] += 1
+            counts["retries"] += retries
+            counts["errors"] += int(error)
+    
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Retorna {endpoint: {calls, errors, retries, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}}."""
+        with self._lock:
+            snapshot = {key: (sorted(samples), dict(self._counts[key])) for key, samples in self._samples.items()}
+        
+        result = {}
+        for key, (samples, counts) in snapshot.items():
+            pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+            result[key] = {
+                **counts,
+                "mean_ms": sum(samples) / len(samples) * 1000,
+                "p50_ms": pick(0.50),
+                "p95_ms": pick(0.95),
+                "p99_ms": pick(0.99),
+                "max_ms": samples[-1] * 1000,
+            }
+        return result
+    
+    def report(self) -> str:
+        """Tabela de texto com o resumo, para imprimir no fim da execução."""
+        lines = [f"{'endpoint':<40} {'calls':>6} {'err':>4} {'retry':>5} {'p50':>8} {'p95':>8} {'max':>8}"]
+        for key, s in sorted(self.summary().items()):
+            lines.append(
+                f"{key:<40} {s['calls']:>6} {s['errors']:>4} {s['retries']:>5} "
+                f"{s['p50_ms']:>6.0f}ms {s['p95_ms']:>6.0f}ms {s['max_ms']:>6.0f}ms"
+            )
+        return "\n".join(lines)
+
+
+class MassaCache:
+    """
+    Cópia local das massas, atualizada por delta (GET /massas/?updated_since=).
+    
+    Guarda o cursor devolvido pelo servidor: cada sincronização baixa só as
+    massas alteradas e os IDs excluídos desde a anterior. Com `path`, a cópia
+    é gravada em um arquivo JSON e reaproveitada pelas próximas execuções
+    (ex: relatórios noturnos).
+    """
+    
+    # Cursor de quem ainda não tem nada: o servidor responde com todas as massas
+    START = "1970-01-01T00:00:00"
+    
+    def __init__(self, path: str = None):
+        self.path = path
+        self.massas: Dict[int, Dict] = {}
+        self.updated_since = self.START
+        self.after_id: Optional[int] = None
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+    
+    def params(self) -> Dict[str, Any]:
+        """Cursor da próxima chamada de delta."""
+        params = {"updated_since": self.updated_since}
+        if self.after_id is not None:
+            params["after_id"] = self.after_id
+        return params
+    
+    def merge(self, delta: Dict):
+        """Aplica um delta do servidor: exclusões, depois inclusões/alterações."""
+        if delta["full"]:
+            self.massas.clear()
+        for massa_id in delta["deleted"]:
+            self.massas.pop(massa_id, None)
+        for massa in delta["massas"]:
+            self.massas[massa["id"]] = massa
+        self.updated_since = delta["updated_since"]
+        self.after_id = delta["after_id"]
+    
+    def values(self) -> List[Dict]:
+        return [self.massas[massa_id] for massa_id in sorted(self.massas)]
+    
+    def clear(self):
+        self.massas.clear()
+        self.updated_since = self.START
+        self.after_id = None
+    
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.massas = {massa["id"]: massa for massa in data["massas"]}
+            self.updated_since = data["updated_since"]
+            self.after_id = data.get("after_id")
+        except (OSError, ValueError, KeyError) as e:
+            # Arquivo corrompido ou de outro formato: sincroniza do zero
+            print(f"[TDM] Cache local ignorado ({self.path}): {e}")
+            self.clear()
+    
+    def save(self):
+        """Grava o arquivo (se houver) de forma atômica."""
+        if not self.path:
+            return
+        data = {"updated_since": self.updated_since, "after_id": self.after_id, "massas": self.values()}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
 
 
 class TDMClient:
@@ -34,9 +279,24 @@ class TDMClient:
     Attributes:
         api_url: URL base da API do TDM
         timeout: Timeout padrão para requisições (segundos)
+        lease_ttl: Duração da reserva (segundos) pedida em cada checkout
+        consumer_id: Identificação deste processo nas reservas
+        stats: Latência das chamadas por endpoint (ver latency_stats())
     """
     
-    def __init__(self, api_url: str = None, timeout: int = 30):
+    def __init__(
+        self,
+        api_url: str = None,
+        timeout: int = 30,
+        lease_ttl: int = 900,
+        auto_renew: bool = True,
+        consumer_id: str = None,
+        pool_size: int = None,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        backoff_max: float = 10,
+        local_cache: Union[bool, str] = False
+    ):
         """
         Inicializa o cliente TDM.
         
@@ -44,32 +304,172 @@ class TDMClient:
             api_url: URL da API. Se não fornecida, usa a variável de ambiente 
                      TDM_API_URL ou https://tdm-api-vn0v.onrender.com como fallback.
             timeout: Timeout para requisições em segundos.
+            lease_ttl: Segundos que uma massa reservada fica IN_USE sem renovação.
+                       Se o processo morrer, a massa volta ao pool depois disso.
+            auto_renew: Se True, renova as reservas em segundo plano enquanto
+                        a massa não for liberada.
+            consumer_id: Identificação nas reservas (padrão: host e PID).
+            pool_size: Conexões keep-alive mantidas abertas. Use o número de
+                       threads que chamam o cliente (padrão: cpu_count + 4, até 32).
+            max_retries: Novas tentativas para chamadas idempotentes que
+                         falham por rede ou com 429/502/503/504.
+            backoff: Espera base (segundos) da primeira nova tentativa; dobra
+                     a cada tentativa, com jitter aleatório.
+            backoff_max: Espera máxima entre tentativas (segundos).
+            local_cache: Se True, get_all_massas() mantém uma cópia local e
+                         baixa só o que mudou desde a última chamada. Com um
+                         caminho de arquivo, a cópia também é gravada em disco
+                         e reaproveitada entre execuções.
         """
         self.api_url = api_url or os.getenv("TDM_API_URL", "https://tdm-api-vn0v.onrender.com")
         self.timeout = timeout
-        self._session = requests.Session()
-    
-    def _request(self, method: str, endpoint: str, **kwargs) -> Any:
-        """Faz uma requisição HTTP para a API."""
+        self.lease_ttl = lease_ttl
+        self.auto_renew = auto_renew
+        self.consumer_id = consumer_id or f"tdm_client@{socket.gethostname()}:{os.getpid()}"
+        self.pool_size = pool_size or _default_pool_size()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.stats = LatencyStats()
+        self.cache = None
+        if local_cache:
+            self.cache = MassaCache(local_cache if isinstance(local_cache, str) else None)
+        
+        self._session = _pooled_session(self.pool_size)
+        
+        # Reservas renovadas automaticamente: {endpoint de heartbeat: ttl}
+        # e o próximo heartbeat de cada uma (time.monotonic())
+        self._leases: Dict[str, int] = {}
+        self._renew_at: Dict[str, float] = {}
+        self._lease_lock = threading.Lock()
+        self._renew_stop = threading.Event()
+        self._renew_wake = threading.Event()
+        self._renew_thread = None
+    
+    def _request(
+        self,
+        method: str,
+        endpoint: str,
+        idempotent: bool = None,
+        quiet_statuses=(),
+        idempotency_key: bool = False,
+        **kwargs
+    ) -> Any:
+        """
+        Faz uma requisição HTTP para a API.
+        
+        Chamadas idempotentes (GET/PUT/DELETE ou idempotent=True) são
+        repetidas em falhas transitórias. As demais só são repetidas quando
+        a conexão nem chegou a ser aberta. Com idempotency_key=True a chamada
+        leva um Idempotency-Key (o mesmo em todas as tentativas), então o
+        servidor devolve o resultado da primeira execução e ela pode ser
+        repetida com segurança, inclusive após timeout. Erros HTTP com status
+        em `quiet_statuses` (respostas esperadas, ex: 404 no checkout) não
+        são registrados no log.
+        """
         url = f"{self.api_url}{endpoint}"
         kwargs.setdefault("timeout", self.timeout)
+        if idempotency_key:
+            kwargs["headers"] = _idempotency_headers(kwargs.get("headers"))
+            idempotent = True
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
         
         try:
-            response = self._session.request(method, url, **kwargs)
+            response = _send(
+                self._session, method, url, idempotent, self.max_retries, self.backoff,
+                self.backoff_max, self.stats, _endpoint_key(method, endpoint), **kwargs
+            )
             response.raise_for_status()
-            
             if response.text:
                 return response.json()
             return None
         except requests.exceptions.RequestException as e:
-            print(f"[TDM] Erro na requisição: {e}")
+            if not (isinstance(e, requests.exceptions.HTTPError) and e.response.status_code in quiet_statuses):
+                print(f"[TDM] Erro na requisição: {e}")
             raise
     
+    # ==================== CONEXÃO E DESEMPENHO ====================
+    
+    def warm_up(self, timeout: float = 120, connections: int = None) -> Future:
+        """
+        Acorda a API em segundo plano e já abre as conexões do pool.
+        
+        Instâncias gratuitas do Render dormem quando ociosas e levam dezenas
+        de segundos para acordar. Chame warm_up() no início da sessão de
+        testes (ex: em pytest_configure) para que isso aconteça em paralelo
+        com a coleta dos testes.
+        
+        Args:
+            timeout: Tempo máximo (segundos) esperando a API responder.
+            connections: Conexões a abrir em paralelo (padrão: pool_size).
+            
+        Returns:
+            Future que resolve para True quando /health respondeu 2xx, ou
+            False se isso não aconteceu dentro do timeout. Enquanto a
+            instância acorda, o proxy do Render responde 502/503: essas
+            respostas não contam.
+        """
+        future = Future()
+        
+        def run():
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    if self._session.get(f"{self.api_url}/health", timeout=min(self.timeout, timeout)).ok:
+                        break
+                except requests.exceptions.RequestException:
+                    pass
+                if time.monotonic() >= deadline:
+                    future.set_result(False)
+                    return
+                time.sleep(1)
+            
+            # Abre várias conexões ao mesmo tempo para encher o pool keep-alive
+            count = connections or self.pool_size
+            with ThreadPoolExecutor(max_workers=count) as executor:
+                list(executor.map(lambda _: self._ping(), range(count)))
+            future.set_result(True)
+        
+        threading.Thread(target=run, daemon=True).start()
+        return future
+    
+    def _ping(self):
+        try:
+            self._session.get(f"{self.api_url}/health", timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            pass
+    
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Latência das chamadas feitas por este cliente, por endpoint:
+        chamadas, erros, novas tentativas, média, p50, p95, p99 e máximo (ms).
+        """
+        return self.stats.summary()
+    
     # ==================== MÉTODOS DE BUSCA ====================
     
     def get_all_massas(self) -> List[Dict]:
-        """Retorna todas as massas cadastradas."""
-        return self._request("GET", "/massas")
+        """
+        Retorna todas as massas cadastradas.
+        
+        Com local_cache, atualiza a cópia local por delta (só as massas
+        alteradas/excluídas desde a última chamada) e a retorna.
+        """
+        if self.cache is None:
+            return self._request("GET", "/massas/")
+        return self._sync_cache()
+    
+    def _sync_cache(self) -> List[Dict]:
+        """Busca as alterações desde a última sincronização e as aplica ao cache local."""
+        with self.cache.lock:
+            while True:
+                delta = self._request("GET", "/massas/", params=self.cache.params())
+                self.cache.merge(delta)
+                if not delta["has_more"]:
+                    break
+            self.cache.save()
+            return self.cache.values()
     
     def get_massa_by_id(self, massa_id: int) -> Optional[Dict]:
         """Busca uma massa específica pelo ID."""
@@ -80,7 +480,9 @@ class TDMClient:
         status: str = None,
         region: str = None,
         document_type: str = None,
-        tags: List[str] = None
+        tags: List[str] = None,
+        q: str = None,
+        where: Union[str, List[str]] = None
     ) -> List[Dict]:
         """
         Busca massas com filtros específicos.
@@ -90,21 +492,20 @@ class TDMClient:
             region: Filtrar por região (sudeste, nordeste, etc.)
             document_type: Filtrar por tipo (CPF ou CNPJ)
             tags: Filtrar por tags
+            q: Trecho do nome ou do documento (aceita máscara, ex: "123.456")
+            where: Condições sobre os contadores uc_*/fat_*,
+                   ex: ["uc_ligada>=2", "fat_renegociacao=0"]
             
         Returns:
             Lista de massas que atendem aos critérios
         """
-        params = {}
+        params = _criteria_params(region, document_type, tags, where)
         if status:
             params["status"] = status
-        if region:
-            params["region"] = region
-        if document_type:
-            params["document_type"] = document_type
-        if tags:
-            params["tags"] = ",".join(tags)
+        if q:
+            params["q"] = q
         
-        return self._request("GET", "/massas", params=params)
+        return self._request("GET", "/massas/", params=params)
     
     # ==================== MÉTODOS DE RESERVA ====================
     
@@ -113,20 +514,26 @@ class TDMClient:
         region: str = None,
         doc_type: str = None,
         tags: List[str] = None,
-        auto_reserve: bool = True
+        auto_reserve: bool = True,
+        where: Union[str, List[str]] = None,
+        ttl: int = None
     ) -> Optional[Dict]:
         """
         Busca e reserva automaticamente uma massa disponível.
         
         Esta é a principal função para uso em testes automatizados.
         Ela busca a primeira massa disponível que atende aos critérios
-        e a marca como IN_USE automaticamente.
+        e a marca como IN_USE automaticamente, em uma única operação
+        no servidor (checkout), com reserva renovada automaticamente.
         
         Args:
             region: Região desejada (opcional)
             doc_type: Tipo de documento - "CPF" ou "CNPJ" (opcional)
             tags: Tags que a massa deve ter (opcional)
             auto_reserve: Se True, marca automaticamente como IN_USE
+            where: Condições sobre os contadores (opcional),
+                   ex: ["uc_ligada>=2", "fat_vencidas>=3"]
+            ttl: Duração da reserva em segundos (padrão: lease_ttl)
             
         Returns:
             Dicionário com dados da massa ou None se não encontrar
@@ -134,30 +541,110 @@ class TDMClient:
         Example:
             >>> massa = tdm.get_available_massa(doc_type="CPF")
             >>> print(f"CPF: {massa['document_number']}")
+            >>> massa = tdm.get_available_massa(where=["uc_ligada>=2", "fat_renegociacao=0"])
         """
-        massas = self.search_massas(
-            status="AVAILABLE",
-            region=region,
-            document_type=doc_type,
-            tags=tags
-        )
-        
-        if not massas:
-            print("[TDM] Nenhuma massa disponível encontrada com os critérios especificados")
-            return None
+        if not auto_reserve:
+            massas = self.search_massas(
+                status="AVAILABLE",
+                region=region,
+                document_type=doc_type,
+                tags=tags,
+                where=where
+            )
+            if not massas:
+                print("[TDM] Nenhuma massa disponível encontrada com os critérios especificados")
+                return None
+            return massas[0]
         
-        massa = massas[0]
+        ttl = ttl or self.lease_ttl
+        params = _criteria_params(region, doc_type, tags, where)
+        params.update({"consumer_id": self.consumer_id, "ttl": ttl})
         
-        if auto_reserve:
-            self.update_status(massa["id"], "IN_USE")
-            print(f"[TDM] Massa #{massa['id']} reservada com sucesso")
+        try:
+            massa = self._request(
+                "POST", "/massas/checkout", idempotency_key=True, quiet_statuses=(404,), params=params
+            )
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                print("[TDM] Nenhuma massa disponível encontrada com os critérios especificados")
+                return None
+            raise
         
+        self._track_lease(f"/massas/{massa['id']}/heartbeat", ttl)
+        print(f"[TDM] Massa #{massa['id']} reservada com sucesso")
         return massa
     
+    def get_available_massas(
+        self,
+        count: int,
+        region: str = None,
+        doc_type: str = None,
+        tags: List[str] = None,
+        ttl: int = None
+    ) -> List[Dict]:
+        """
+        Reserva `count` massas de uma vez (tudo ou nada).
+        
+        As massas ficam ligadas a um run; libere todas com
+        release_run(massas[0]["run_id"]) ou uma a uma com release_massa().
+        
+        Returns:
+            Lista de massas, ou lista vazia se não houver `count` disponíveis
+        """
+        line = {"count": count, "region": region, "document_type": doc_type, "tags": tags or []}
+        run = self.allocate_run([line], ttl=ttl)
+        return run["massas"] if run else []
+    
+    # ==================== RESERVA EM LOTE (RUNS) ====================
+    
+    def allocate_run(self, lines: List[Dict], ttl: int = None) -> Optional[Dict]:
+        """
+        Reserva todas as massas de uma execução de testes em uma transação.
+        
+        Args:
+            lines: Linhas do manifesto, cada uma com critérios e quantidade, ex:
+                   [{"document_type": "CPF", "region": "Nordeste", "count": 5},
+                    {"min": {"fat_vencidas": 1}, "count": 2}]
+            ttl: Duração da reserva em segundos (padrão: lease_ttl)
+            
+        Returns:
+            {"run": {...}, "lines": [[ids], ...], "massas": [...]} ou None se
+            o pool não atende o manifesto (nada é reservado nesse caso)
+        """
+        ttl = ttl or self.lease_ttl
+        body = {"consumer_id": self.consumer_id, "lines": lines, "ttl": ttl}
+        try:
+            run = self._request("POST", "/runs", idempotency_key=True, quiet_statuses=(409,), json=body)
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 409:
+                print(f"[TDM] Manifesto não atendido: {e.response.json().get('detail')}")
+                return None
+            raise
+        
+        self._track_lease(f"/runs/{run['run']['id']}/heartbeat", ttl)
+        print(f"[TDM] Run {run['run']['id']}: {len(run['massas'])} massas reservadas")
+        return run
+    
+    def release_run(self, run_id: str, status: str = "AVAILABLE") -> int:
+        """
+        Libera (ou consome, com status="CONSUMED") todas as massas de um run.
+        
+        Returns:
+            Quantidade de massas liberadas
+        """
+        result = self._request(
+            "POST", f"/runs/{run_id}/release", idempotency_key=True, params={"new_status": status}
+        )
+        self._forget_lease(f"/runs/{run_id}/heartbeat")
+        return result["released"]
+    
     def reserve_massa(self, massa_id: int, reserved_for: str = None) -> bool:
         """
         Reserva uma massa específica para uso.
         
+        A reserva tem a mesma expiração (lease_ttl) de um checkout e é
+        renovada automaticamente até a massa ser liberada.
+        
         Args:
             massa_id: ID da massa a reservar
             reserved_for: Identificador de quem está reservando (opcional)
@@ -170,11 +657,79 @@ class TDMClient:
             if reserved_for:
                 data["reserved_for"] = reserved_for
                 
-            self._request("PUT", f"/massas/{massa_id}", json=data)
+            params = {"consumer_id": self.consumer_id, "ttl": self.lease_ttl}
+            self._request("PUT", f"/massas/{massa_id}", json=data, params=params)
+            self._track_lease(f"/massas/{massa_id}/heartbeat", self.lease_ttl)
             return True
         except Exception:
             return False
     
+    # ==================== RESERVAS (LEASE) ====================
+    
+    def heartbeat(self, massa_id: int, ttl: int = None) -> bool:
+        """
+        Renova a reserva de uma massa por mais `ttl` segundos.
+        
+        Chamado automaticamente quando auto_renew=True; use diretamente
+        apenas se desativou a renovação automática.
+        
+        Returns:
+            True se renovada, False se a reserva já expirou ou foi liberada
+        """
+        return self._renew(f"/massas/{massa_id}/heartbeat", ttl or self.lease_ttl)
+    
+    def _renew(self, path: str, ttl: int) -> bool:
+        """Chama um endpoint de heartbeat (massa ou run); False se nada foi renovado."""
+        params = {"ttl": ttl}
+        if path.startswith("/massas/"):
+            params["consumer_id"] = self.consumer_id
+        try:
+            result = self._request("POST", path, idempotent=True, quiet_statuses=(404, 409), params=params)
+        except requests.exceptions.HTTPError:
+            return False
+        return bool(result.get("renewed", 1))
+    
+    def _track_lease(self, path: str, ttl: int):
+        """Passa a renovar a reserva em `path` (endpoint de heartbeat)."""
+        if not self.auto_renew:
+            return
+        with self._lease_lock:
+            self._leases[path] = ttl
+            self._renew_at[path] = time.monotonic() + ttl / 3
+            # Acorda o loop: a reserva nova pode vencer antes da espera atual
+            self._renew_wake.set()
+            if self._renew_thread is None:
+                self._renew_thread = threading.Thread(target=self._renew_loop, daemon=True)
+                self._renew_thread.start()
+    
+    def _forget_lease(self, path: str):
+        with self._lease_lock:
+            self._leases.pop(path, None)
+            self._renew_at.pop(path, None)
+    
+    def _renew_loop(self):
+        """Renova cada reserva a cada 1/3 do seu próprio TTL."""
+        while not self._renew_stop.is_set():
+            with self._lease_lock:
+                now = time.monotonic()
+                due = {path: self._leases[path] for path, at in self._renew_at.items() if at <= now}
+                for path, ttl in due.items():
+                    self._renew_at[path] = now + ttl / 3
+                next_at = min(self._renew_at.values(), default=now + self.lease_ttl / 3)
+                self._renew_wake.clear()
+            if not due:
+                self._renew_wake.wait(next_at - now)
+                continue
+            for path, ttl in due.items():
+                try:
+                    renewed = self._renew(path, ttl)
+                except requests.exceptions.RequestException:
+                    continue  # Tenta de novo no próximo ciclo
+                # Ignora reservas liberadas enquanto o heartbeat estava em curso
+                if not renewed and path in self._leases:
+                    print(f"[TDM] Reserva expirada: {path.rsplit('/', 1)[0]}")
+                    self._forget_lease(path)
+    
     # ==================== MÉTODOS DE ATUALIZAÇÃO ====================
     
     def update_status(self, massa_id: int, status: str) -> bool:
@@ -190,6 +745,24 @@ class TDMClient:
         """
         try:
             self._request("PUT", f"/massas/{massa_id}", json={"status": status})
+            if status != "IN_USE":
+                self._forget_lease(f"/massas/{massa_id}/heartbeat")
+            return True
+        except Exception:
+            return False
+    
+    def _release(self, massa_id: int, status: str) -> bool:
+        """
+        Encerra a reserva de uma massa com o status dado (POST /release).
+        
+        Leva um Idempotency-Key: repetir a chamada após um timeout não libera
+        de novo uma massa que outro consumidor já reservou nesse meio tempo.
+        """
+        try:
+            self._request(
+                "POST", f"/massas/{massa_id}/release", idempotency_key=True, params={"new_status": status}
+            )
+            self._forget_lease(f"/massas/{massa_id}/heartbeat")
             return True
         except Exception:
             return False
@@ -207,7 +780,7 @@ class TDMClient:
         Returns:
             True se liberada com sucesso
         """
-        success = self.update_status(massa_id, "AVAILABLE")
+        success = self._release(massa_id, "AVAILABLE")
         if success:
             print(f"[TDM] Massa #{massa_id} liberada com sucesso")
         return success
@@ -225,7 +798,7 @@ class TDMClient:
         Returns:
             True se consumida com sucesso
         """
-        success = self.update_status(massa_id, "CONSUMED")
+        success = self._release(massa_id, "CONSUMED")
         if success:
             print(f"[TDM] Massa #{massa_id} marcada como consumida")
         return success
@@ -236,21 +809,15 @@ class TDMClient:
         
         Args:
             massa_id: ID da massa a bloquear
-            reason: Motivo do bloqueio (opcional)
+            reason: Motivo do bloqueio (opcional, aparece só no log)
             
         Returns:
             True se bloqueada com sucesso
         """
-        data = {"status": "BLOCKED"}
-        if reason:
-            data["status_obs"] = reason
-            
-        try:
-            self._request("PUT", f"/massas/{massa_id}", json=data)
-            print(f"[TDM] Massa #{massa_id} bloqueada")
-            return True
-        except Exception:
-            return False
+        success = self._release(massa_id, "BLOCKED")
+        if success:
+            print(f"[TDM] Massa #{massa_id} bloqueada" + (f": {reason}" if reason else ""))
+        return success
     
     # ==================== MÉTODOS DE CRIAÇÃO ====================
     
@@ -270,7 +837,7 @@ class TDMClient:
         Returns:
             Dicionário com a massa criada ou None se falhar
         """
-        return self._request("POST", "/massas", json=data)
+        return self._request("POST", "/massas/", json=data)
     
     # ==================== CONTEXT MANAGER ====================
     
@@ -280,6 +847,14 @@ class TDMClient:
     
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Fecha a sessão ao sair do context manager."""
+        self.close()
+    
+    def close(self):
+        """Para a renovação automática e fecha a sessão HTTP."""
+        self._renew_stop.set()
+        self._renew_wake.set()
+        if self._renew_thread is not None:
+            self._renew_thread.join(timeout=self.timeout)
         self._session.close()
 
 
@@ -290,10 +865,11 @@ class TDMMassaContext:
     Context Manager para uso automático de massa em testes.
     
     Automaticamente reserva uma massa no início e libera no final,
-    mesmo se o teste falhar.
+    mesmo se o teste falhar. Enquanto o bloco roda, a reserva é renovada
+    em segundo plano; se o processo morrer, ela expira sozinha no servidor.
     
     Example:
-        with TDMMassaContext(tdm, doc_type="CPF") as massa:
+        with TDMMassaContext(tdm, doc_type="CPF", ttl=300) as massa:
             driver.find_element("id", "cpf").send_keys(massa["document_number"])
             # ... resto do teste
         # Massa liberada automaticamente
@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# A throwaway SQLite file for the whole session; the background loops are
+# off so every sweep, purge and replenish in a test is explicit
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='tdm-tests-')}/tdm.db"
+os.environ["TDM_REPLENISH_INTERVAL"] = "0"
+os.environ["TDM_LEASE_REAP_INTERVAL"] = "0"
+os.environ["TDM_IDEMPOTENCY_PURGE_INTERVAL"] = "0"
+os.environ["TDM_SETTINGS_CACHE_TTL"] = "0"
+
+from fastapi.testclient import TestClient
+
+from backend import config, database, events, generator, models, schemas
+from backend.main import app
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+    # Every test starts from an empty database
+    events.recorder.flush()
+    with database.get_engine().begin() as conn:
+        for table in reversed(models.Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    config._cache.update(settings=None, version=None, checked_at=0.0)
+
+
+@pytest.fixture
+def db(client):
+    session = database.SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_massas(db):
+    """Generates massas (see schemas.GenerateRequest) and returns their ids."""
+    def make(count: int = 10, **spec) -> list:
+        before = {massa_id for (massa_id,) in db.query(models.Massa.id)}
+        generator.generate_massas(db, schemas.GenerateRequest(count=count, **spec))
+        return sorted({massa_id for (massa_id,) in db.query(models.Massa.id)} - before)
+    return make
+
+
+@pytest.fixture
+def recorded_events(client):
+    """Events written so far (optionally of one type), oldest first."""
+    def read(event_type: str = None) -> list:
+        events.recorder.flush()
+        session = database.SessionLocal()
+        try:
+            query = session.query(models.MassaEvent).order_by(models.MassaEvent.id)
+            if event_type:
+                query = query.filter(models.MassaEvent.event_type == event_type)
+            return query.all()
+        finally:
+            session.close()
+    return read
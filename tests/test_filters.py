@@ -0,0 +1,43 @@
+import pytest
+
+from backend import filters
+
+
+@pytest.mark.parametrize("params, where, expected", [
+    ({"min_uc_ligada": "2"}, [], ({"uc_ligada": 2}, {})),
+    ({"max_fat_vencidas": "3"}, [], ({}, {"fat_vencidas": 3})),
+    ({"uc_ligada": "1"}, [], ({"uc_ligada": 1}, {"uc_ligada": 1})),
+    ({"uc_ligada>": "2"}, [], ({"uc_ligada": 2}, {})),  # uc_ligada>=2 in the URL
+    ({"uc_ligada<": "2"}, [], ({}, {"uc_ligada": 2})),  # uc_ligada<=2 in the URL
+    ({"uc_ligada>1": ""}, [], ({"uc_ligada": 2}, {})),  # uc_ligada>1 in the URL
+    ({"uc_ligada<3": ""}, [], ({}, {"uc_ligada": 2})),
+    ({"uc_status": "ligada"}, [], ({"uc_ligada": 1}, {})),
+    ({}, ["uc_ligada>=2,fat_vencidas=0"], ({"uc_ligada": 2, "fat_vencidas": 0}, {"fat_vencidas": 0})),
+    ({"min_uc_ligada": "1"}, ["uc_ligada>3"], ({"uc_ligada": 4}, {})),  # The tighter bound wins
+])
+def test_counter_bounds(params, where, expected):
+    assert filters.counter_bounds(params, where) == expected
+
+
+@pytest.mark.parametrize("params, where", [
+    ({"uc_ligada": "x"}, []),
+    ({"uc_ligada!": "2"}, []),  # Names a counter but isn't a predicate
+    ({"min_uc_ligadas": "1"}, []),  # Misspelled counter
+    ({"uc_status": "quebrada"}, []),
+    ({}, ["uc_nada>1"]),
+    ({}, ["uc_ligada~1"]),
+])
+def test_unreadable_predicates_are_rejected(params, where):
+    with pytest.raises(ValueError):
+        filters.counter_bounds(params, where)
+
+
+def test_strict_predicate_in_the_url_filters_and_bad_ones_answer_400(client, make_massas):
+    make_massas(6, counters={"uc_ligada": {1: 1}})
+    make_massas(4, counters={"uc_ligada": {3: 1}})
+
+    assert len(client.get("/massas/?uc_ligada>1").json()) == 4
+    assert len(client.get("/massas/?uc_ligada<3").json()) == 6
+    assert client.get("/massas/?uc_ligada!1").status_code == 400
+    assert client.post("/massas/checkout?uc_ligada>5").status_code == 404
+    assert client.post("/massas/checkout?uc_ligada>2").json()["uc_ligada"] == 3
@@ -0,0 +1,79 @@
+import random
+
+from backend import config, generator, locks, models
+
+
+def test_check_digits_match_known_documents():
+    assert generator.cpf_from_base(111444777) == "11144477735"
+    assert generator.cnpj_from_base(11222333) == "11222333000181"
+    assert generator.is_valid_document("11144477735")
+    assert generator.is_valid_document("11222333000181")
+    assert not generator.is_valid_document("11144477736")
+    assert not generator.is_valid_document("11111111111")
+
+
+def test_generated_documents_are_valid_unique_and_skip_existing():
+    taken = set(generator.generate_documents("CPF", 500, random.Random(1)))
+    fresh = generator.generate_documents("CPF", 500, random.Random(1), existing=lambda batch: batch & taken)
+
+    assert len(set(fresh)) == 500
+    assert not taken & set(fresh)
+    assert all(generator.is_valid_document(doc) for doc in fresh)
+    assert all(len(doc) == 14 for doc in generator.generate_documents("CNPJ", 50, random.Random(2)))
+
+
+def test_generate_never_reuses_a_document_in_the_table(db, make_massas):
+    make_massas(300, seed=7)
+    make_massas(300, seed=7)  # Same draws: every number collides and is redrawn
+
+    docs = [doc for (doc,) in db.query(models.Massa.document_number)]
+    assert len(docs) == len(set(docs)) == 600
+
+
+def test_generate_commits_each_chunk_with_its_own_stamp(db, make_massas, monkeypatch):
+    monkeypatch.setattr(generator, "INSERT_CHUNK_SIZE", 4)
+    make_massas(10)
+
+    stamps = {stamp for (stamp,) in db.query(models.Massa.updated_at)}
+    assert len(stamps) == 3
+
+
+def test_rule_criteria_cover_tags_and_counter_ranges():
+    rule = config.ReplenishRule(
+        document_type="CPF", region="NE", low_watermark=1, target=2,
+        tags=["pix"], counters={"uc_ligada": {1: 1, 3: 1, 9: 0}},
+    )
+    criteria = generator.rule_criteria(rule)
+
+    assert criteria.tags == ["pix"]
+    assert criteria.min == {"uc_ligada": 1}
+    assert criteria.max == {"uc_ligada": 3}
+
+
+def test_replenish_counts_only_the_rule_bucket(db, make_massas):
+    make_massas(5, region={"NE": 1}, tags=["other"])
+    rule = config.ReplenishRule(document_type="CPF", region="NE", low_watermark=3, target=4, tags=["pix"])
+
+    report = generator.replenish_pool(db, [rule])
+
+    assert report[0]["available_before"] == 0
+    assert report[0]["created"] == 4
+    assert generator.replenish_pool(db, [rule]) == []
+
+
+def test_replenish_skips_while_another_worker_holds_the_lock(db):
+    rule = config.ReplenishRule(document_type="CPF", region="NE", low_watermark=3, target=4)
+    token = locks.acquire(db, generator.REPLENISH_LOCK, 60)
+    try:
+        assert generator.replenish_pool(db, [rule]) == []
+        assert db.query(models.Massa).count() == 0
+    finally:
+        locks.release(db, generator.REPLENISH_LOCK, token)
+
+    assert generator.replenish_pool(db, [rule])[0]["created"] == 4
+
+
+def test_expired_lock_can_be_taken_over(db):
+    assert locks.acquire(db, "job", 0) is not None
+    assert locks.acquire(db, "job", 60) is not None
+    assert locks.acquire(db, "job", 60) is None
@@ -0,0 +1,116 @@
+import threading
+from datetime import datetime, timedelta
+
+from backend import idempotency, models
+
+KEY = {"Idempotency-Key": "key-1"}
+
+
+def _in_use(db):
+    db.expire_all()
+    return db.query(models.Massa).filter(models.Massa.status == "IN_USE").count()
+
+
+def test_repeated_key_replays_the_first_checkout(client, db, make_massas):
+    make_massas(3)
+
+    first = client.post("/massas/checkout", params={"consumer_id": "ci"}, headers=KEY)
+    again = client.post("/massas/checkout", params={"consumer_id": "ci"}, headers=KEY)
+
+    assert again.json()["id"] == first.json()["id"]
+    assert again.headers[idempotency.REPLAYED_HEADER] == "true"
+    assert idempotency.REPLAYED_HEADER not in first.headers
+    assert _in_use(db) == 1
+
+
+def test_key_reused_for_another_request_is_422(client, make_massas):
+    make_massas(2)
+    client.post("/massas/checkout", params={"consumer_id": "ci"}, headers=KEY)
+
+    assert client.post("/massas/checkout", params={"consumer_id": "other"}, headers=KEY).status_code == 422
+
+
+def test_failed_request_gives_the_key_back(client, make_massas):
+    assert client.post("/massas/checkout", headers=KEY).status_code == 404
+
+    make_massas(1)
+    response = client.post("/massas/checkout", headers=KEY)
+    assert response.status_code == 200
+    assert idempotency.REPLAYED_HEADER not in response.headers
+
+
+def test_concurrent_retries_run_the_checkout_once(client, db, make_massas):
+    make_massas(5)
+    responses = []
+
+    def checkout():
+        responses.append(client.post("/massas/checkout", params={"consumer_id": "ci"}, headers=KEY))
+
+    threads = [threading.Thread(target=checkout) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert {r.status_code for r in responses} == {200}
+    assert len({r.json()["id"] for r in responses}) == 1
+    assert _in_use(db) == 1
+
+
+def _make_pending(db, key, age):
+    """Turns a stored key back into an in-flight one that started `age` ago."""
+    record = db.get(models.IdempotencyKey, key)
+    record.status_code = None
+    record.response = None
+    record.created_at = datetime.now() - age
+    db.commit()
+
+
+def test_key_still_in_progress_is_409(client, db, make_massas, monkeypatch):
+    monkeypatch.setattr(idempotency, "PENDING_WAIT", 0.2)
+    make_massas(2)
+    client.post("/massas/checkout", headers=KEY)
+    _make_pending(db, "key-1", timedelta(seconds=1))
+
+    assert client.post("/massas/checkout", headers=KEY).status_code == 409
+
+
+def test_abandoned_key_is_taken_over_by_the_retry(client, db, make_massas):
+    make_massas(2)
+    first = client.post("/massas/checkout", headers=KEY).json()
+    _make_pending(db, "key-1", timedelta(seconds=idempotency.PENDING_TIMEOUT + 1))
+
+    retry = client.post("/massas/checkout", headers=KEY)
+
+    assert retry.status_code == 200
+    assert idempotency.REPLAYED_HEADER not in retry.headers
+    assert retry.json()["id"] != first["id"]  # The dead request's work isn't replayed
+    assert client.post("/massas/checkout", headers=KEY).json()["id"] == retry.json()["id"]
+
+
+def test_keyed_run_and_release_replay(client, db, make_massas):
+    make_massas(4)
+    manifest = {"lines": [{"count": 2}]}
+
+    run = client.post("/runs", json=manifest, headers=KEY).json()
+    assert client.post("/runs", json=manifest, headers=KEY).json()["run"]["id"] == run["run"]["id"]
+    assert _in_use(db) == 2
+
+    massa_id = run["lines"][0][0]
+    release = {"Idempotency-Key": "key-2"}
+    client.post(f"/massas/{massa_id}/release", params={"new_status": "CONSUMED"}, headers=release)
+    replayed = client.post(f"/massas/{massa_id}/release", params={"new_status": "CONSUMED"}, headers=release)
+    assert replayed.headers[idempotency.REPLAYED_HEADER] == "true"
+
+
+def test_expired_keys_are_purged_and_free_again(client, db, make_massas):
+    make_massas(2)
+    first = client.post("/massas/checkout", headers=KEY).json()
+
+    assert idempotency.purge_expired(db, datetime.now() + timedelta(seconds=idempotency.KEY_TTL + 1)) == 1
+    assert client.post("/massas/checkout", headers=KEY).json()["id"] != first["id"]
+
+
+def test_overlong_key_is_400(client):
+    headers = {"Idempotency-Key": "k" * (idempotency.MAX_KEY_LENGTH + 1)}
+    assert client.post("/massas/checkout", headers=headers).status_code == 400
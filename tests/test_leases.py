@@ -0,0 +1,130 @@
+import threading
+from datetime import datetime, timedelta
+
+from backend import database, events, leases, locks, models
+
+LATER = timedelta(seconds=60)
+
+
+def _status(db, massa_id):
+    db.expire_all()
+    return db.get(models.Massa, massa_id)
+
+
+def test_checkout_leases_the_massa(client, make_massas, recorded_events):
+    make_massas(1, region={"NE": 1})
+
+    massa = client.post("/massas/checkout", params={"region": "NE", "consumer_id": "ci", "ttl": 30}).json()
+
+    assert massa["status"] == "IN_USE"
+    assert massa["last_used_by"] == "ci"
+    expires = datetime.fromisoformat(massa["lease_expires_at"])
+    assert timedelta(seconds=25) < expires - datetime.now() <= timedelta(seconds=30)
+    assert [e.massa_id for e in recorded_events(events.CHECKOUT)] == [massa["id"]]
+
+
+def test_checkout_of_an_empty_pool_is_404_and_exhausted(client, recorded_events):
+    response = client.post("/massas/checkout", params={"region": "NE", "consumer_id": "ci"})
+
+    assert response.status_code == 404
+    assert [e.criteria for e in recorded_events(events.EXHAUSTED)] == ["region=NE"]
+
+
+def test_concurrent_checkouts_get_distinct_massas_until_the_pool_is_empty(client, make_massas, monkeypatch):
+    # A tiny window makes most checkouts lose races; none may give up early
+    monkeypatch.setattr(leases, "CHECKOUT_CANDIDATES", 2)
+    ids = make_massas(30)
+    results = []
+    lock = threading.Lock()
+
+    def checkout(n):
+        db = database.SessionLocal()
+        try:
+            query = db.query(models.Massa).filter(models.Massa.status == "AVAILABLE")
+            massa = leases.checkout(db, query, f"worker-{n}")
+            with lock:
+                results.append(massa.id if massa else None)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=checkout, args=(n,)) for n in range(36)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    claimed = [massa_id for massa_id in results if massa_id is not None]
+    assert sorted(claimed) == ids
+    assert results.count(None) == 6
+
+
+def test_heartbeat_renews_only_a_live_lease(client, db, make_massas):
+    make_massas(1)
+    massa = client.post("/massas/checkout", params={"consumer_id": "ci", "ttl": 1}).json()
+
+    renewed = client.post(f"/massas/{massa['id']}/heartbeat", params={"ttl": 120, "consumer_id": "ci"})
+    assert renewed.status_code == 200
+    assert datetime.fromisoformat(renewed.json()["lease_expires_at"]) > datetime.now() + timedelta(seconds=100)
+    assert client.post(f"/massas/{massa['id']}/heartbeat", params={"consumer_id": "other"}).status_code == 409
+
+    leases.reap_expired(db, datetime.now() + timedelta(seconds=200))
+    assert client.post(f"/massas/{massa['id']}/heartbeat").status_code == 409
+
+
+def test_reaper_returns_expired_massas_and_records_expire(client, db, make_massas, recorded_events):
+    expired, renewed = make_massas(2)
+    for massa_id in (expired, renewed):
+        client.put(f"/massas/{massa_id}", json={"status": "IN_USE"}, params={"consumer_id": "ci", "ttl": 1})
+    client.post(f"/massas/{renewed}/heartbeat", params={"ttl": 3600})
+
+    assert leases.reap_expired(db, datetime.now() + LATER) == 1
+
+    assert _status(db, expired).status == "AVAILABLE"
+    assert _status(db, expired).lease_expires_at is None
+    assert _status(db, renewed).status == "IN_USE"
+    assert [(e.massa_id, e.consumer_id) for e in recorded_events(events.EXPIRE)] == [(expired, "ci")]
+
+
+def test_reaper_skips_a_lease_renewed_after_it_was_read(client, db, make_massas, recorded_events, monkeypatch):
+    raced, expired = make_massas(2)
+    for massa_id in (raced, expired):
+        client.put(f"/massas/{massa_id}", json={"status": "IN_USE"}, params={"consumer_id": "ci", "ttl": 1})
+    real_update = leases.update
+
+    def heartbeat_then_update(*args, **kwargs):
+        # A heartbeat lands between the reaper's SELECT and its UPDATE
+        other = database.SessionLocal()
+        other.get(models.Massa, raced).lease_expires_at = datetime.now() + timedelta(hours=1)
+        other.commit()
+        other.close()
+        return real_update(*args, **kwargs)
+    monkeypatch.setattr(leases, "update", heartbeat_then_update)
+
+    assert leases.reap_expired(db, datetime.now() + LATER) == 1
+
+    assert _status(db, raced).status == "IN_USE"
+    assert [e.massa_id for e in recorded_events(events.EXPIRE)] == [expired]
+
+
+def test_reaper_runs_in_one_worker_at_a_time(client, db, make_massas, recorded_events):
+    (massa_id,) = make_massas(1)
+    client.put(f"/massas/{massa_id}", json={"status": "IN_USE"}, params={"ttl": 1})
+
+    token = locks.acquire(db, leases.REAP_LOCK, 60)
+    assert leases.reap_expired(db, datetime.now() + LATER) == 0
+    locks.release(db, leases.REAP_LOCK, token)
+
+    assert leases.reap_expired(db, datetime.now() + LATER) == 1
+    assert leases.reap_expired(db, datetime.now() + LATER) == 0
+    assert len(recorded_events(events.EXPIRE)) == 1
+
+
+def test_put_in_use_is_leased_only_when_asked(client, db, make_massas):
+    manual, leased = make_massas(2)
+
+    assert client.put(f"/massas/{manual}", json={"status": "IN_USE"}).json()["lease_expires_at"] is None
+    assert client.put(f"/massas/{leased}", json={"status": "IN_USE"}, params={"consumer_id": "ci"}).json()["lease_expires_at"]
+
+    leases.reap_expired(db, datetime.now() + timedelta(days=2))
+    assert _status(db, manual).status == "IN_USE"
+    assert _status(db, leased).status == "AVAILABLE"
@@ -0,0 +1,132 @@
+import itertools
+import random
+import threading
+
+import pytest
+
+from backend import database, models, runs, schemas
+
+
+def _feasible(candidates, counts):
+    """Brute force: is there any assignment of distinct massas to every slot?"""
+    slots = [line for line, count in enumerate(counts) for _ in range(count)]
+
+    def place(slot, used):
+        if slot == len(slots):
+            return True
+        return any(place(slot + 1, used | {m}) for m in candidates[slots[slot]] if m not in used)
+    return place(0, frozenset())
+
+
+def test_match_lines_finds_the_allocation_greedy_order_missed():
+    plan = runs.match_lines([[3, 5], [0, 2, 6], [2, 4, 5], [0, 3]], [1, 2, 1, 1])
+
+    assert [len(ids) for ids in plan] == [1, 2, 1, 1]
+    assert len(set(itertools.chain.from_iterable(plan))) == 5
+
+
+def test_match_lines_agrees_with_brute_force():
+    rng = random.Random(0)
+    for _ in range(3000):
+        lines = rng.randint(1, 4)
+        candidates = [rng.sample(range(8), rng.randint(0, 4)) for _ in range(lines)]
+        counts = [rng.randint(1, 2) for _ in range(lines)]
+        try:
+            plan = runs.match_lines(candidates, counts)
+        except runs.RunInfeasible:
+            assert not _feasible(candidates, counts)
+            continue
+        assert all(len(ids) == count and set(ids) <= set(c) for ids, count, c in zip(plan, counts, candidates))
+        assert len(set(itertools.chain.from_iterable(plan))) == sum(counts)
+
+
+def test_match_lines_reports_each_short_line():
+    with pytest.raises(runs.RunInfeasible) as info:
+        runs.match_lines([[1], [1], [2, 3]], [1, 1, 3])
+
+    assert info.value.shortages == [
+        {"line": 1, "requested": 1, "available": 0},
+        {"line": 2, "requested": 3, "available": 2},
+    ]
+
+
+def test_run_allocates_overlapping_lines_and_releases_them(client, make_massas):
+    make_massas(3, region={"NE": 1})
+    make_massas(2, region={"SE": 1})
+
+    response = client.post("/runs", json={"consumer_id": "ci", "lines": [{"count": 2}, {"region": "NE", "count": 3}]})
+    assert response.status_code == 200
+    allocation = response.json()
+    assert len(allocation["lines"][0]) == 2
+    assert {m["region"] for m in allocation["massas"] if m["id"] in allocation["lines"][1]} == {"NE"}
+    assert all(m["status"] == "IN_USE" for m in allocation["massas"])
+
+    run_id = allocation["run"]["id"]
+    assert client.post(f"/runs/{run_id}/release").json()["released"] == 5
+    massas = client.get("/massas/").json()
+    assert all(m["status"] == "AVAILABLE" and m["run_id"] is None for m in massas)
+
+
+def test_infeasible_run_takes_nothing(client, make_massas):
+    make_massas(3)
+
+    response = client.post("/runs", json={"lines": [{"count": 2}, {"count": 2}]})
+
+    assert response.status_code == 409
+    assert response.json()["detail"]["shortages"] == [{"line": 1, "requested": 2, "available": 1}]
+    assert all(m["status"] == "AVAILABLE" for m in client.get("/massas/").json())
+
+
+def test_massa_taken_out_of_a_run_is_not_released_by_it(client, make_massas):
+    make_massas(2)
+    allocation = client.post("/runs", json={"lines": [{"count": 2}]}).json()
+    moved, kept = allocation["lines"][0]
+
+    client.put(f"/massas/{moved}", json={"status": "AVAILABLE"})
+    client.put(f"/massas/{moved}", json={"status": "IN_USE"}, params={"consumer_id": "someone"})
+    released = client.post(f"/runs/{allocation['run']['id']}/release").json()["released"]
+
+    assert released == 1
+    assert client.get(f"/massas/{moved}").json()["status"] == "IN_USE"
+    assert client.get(f"/massas/{kept}").json()["status"] == "AVAILABLE"
+
+
+def test_tag_wildcards_are_matched_literally(client, make_massas):
+    make_massas(2, tags=["baixaXrenda"])
+    wanted = make_massas(1, tags=["baixa_renda"])
+
+    response = client.post("/runs", json={"lines": [{"tags": ["baixa_renda"], "count": 1}]})
+    assert response.json()["lines"] == [wanted]
+    assert client.post("/runs", json={"lines": [{"tags": ["baixa_renda"], "count": 1}]}).status_code == 409
+
+
+def test_concurrent_runs_never_share_a_massa(client, make_massas):
+    make_massas(20)
+    results = []
+
+    def allocate():
+        db = database.SessionLocal()
+        try:
+            request = schemas.RunCreate(lines=[schemas.ManifestLine(count=3)])
+            results.append(runs.allocate_run(db, request)[1][0])
+        except runs.RunInfeasible:
+            results.append([])
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=allocate) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    taken = [massa_id for ids in results for massa_id in ids]
+    assert all(len(ids) in (0, 3) for ids in results)
+    assert len(taken) == len(set(taken))
+
+    db = database.SessionLocal()
+    try:
+        in_use = {massa_id for (massa_id,) in db.query(models.Massa.id).filter(models.Massa.status == "IN_USE")}
+    finally:
+        db.close()
+    assert in_use == set(taken)
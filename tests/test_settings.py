@@ -0,0 +1,59 @@
+import pytest
+
+from backend import config, database, models
+
+RULE = {"document_type": "CPF", "region": "NE", "low_watermark": 5, "target": 10}
+
+
+@pytest.fixture(autouse=True)
+def no_legacy_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "SETTINGS_FILE", str(tmp_path / "settings.json"))
+
+
+def test_get_sends_an_etag_and_answers_304_when_unchanged(client):
+    response = client.get("/settings")
+    etag = response.headers["ETag"]
+
+    assert response.json()["replenish_rules"] == []
+    assert client.get("/settings", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_post_with_the_current_etag_bumps_the_version(client):
+    etag = client.get("/settings").headers["ETag"]
+
+    response = client.post("/settings", json={"replenish_rules": [RULE]}, headers={"If-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert client.get("/settings", headers={"If-None-Match": etag}).json()["replenish_rules"][0]["region"] == "NE"
+    assert config.load_settings().replenish_rules[0].target == 10
+
+
+def test_stale_etag_gets_412_and_nothing_is_overwritten(client):
+    etag = client.get("/settings").headers["ETag"]
+    client.post("/settings", json={"hidden_columns": ["nome"]}, headers={"If-Match": etag})
+
+    response = client.post("/settings", json={"hidden_columns": ["uf"]}, headers={"If-Match": etag})
+
+    assert response.status_code == 412
+    assert client.get("/settings").json()["hidden_columns"] == ["nome"]
+
+
+def test_bad_if_match_is_400(client):
+    assert client.post("/settings", json={}, headers={"If-Match": '"v1"'}).status_code == 400
+
+
+def test_a_write_from_another_worker_is_picked_up(client):
+    etag = client.get("/settings").headers["ETag"]
+
+    # Another process writes straight to the table
+    db = database.SessionLocal()
+    row = db.get(models.AppSettings, config.SETTINGS_ROW_ID)
+    row.data = {**row.data, "column_order": ["id"]}
+    row.version += 1
+    db.commit()
+    db.close()
+
+    response = client.get("/settings")
+    assert response.headers["ETag"] != etag
+    assert response.json()["column_order"] == ["id"]
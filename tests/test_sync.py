@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, timezone
+
+from backend import models, sync
+
+START = "1970-01-01T00:00:00"
+
+
+def _age(db, ids, seconds):
+    """Backdates updated_at, as if the massas last changed `seconds` ago."""
+    db.query(models.Massa).filter(models.Massa.id.in_(ids)).update(
+        {models.Massa.updated_at: datetime.now() - timedelta(seconds=seconds)}, synchronize_session=False
+    )
+    db.commit()
+
+
+def _sync(client, cursor):
+    params = {"updated_since": cursor["updated_since"]}
+    if cursor.get("after_id") is not None:
+        params["after_id"] = cursor["after_id"]
+    return client.get("/massas/", params={**params, **cursor.get("extra", {})}).json()
+
+
+def test_first_sync_is_full(client, make_massas):
+    ids = make_massas(3)
+
+    delta = client.get("/massas/", params={"updated_since": START}).json()
+
+    assert delta["full"] is True
+    assert sorted(m["id"] for m in delta["massas"]) == ids
+    assert delta["has_more"] is False
+
+
+def test_delta_returns_changes_and_tombstones(client, db, make_massas):
+    changed, deleted, untouched = make_massas(3)
+    _age(db, [changed, deleted, untouched], 3600)
+    cursor = client.get("/massas/", params={"updated_since": START}).json()
+
+    client.put(f"/massas/{changed}", json={"status": "BLOCKED"})
+    client.delete(f"/massas/{deleted}")
+    delta = _sync(client, cursor)
+
+    assert delta["full"] is False
+    assert [m["id"] for m in delta["massas"]] == [changed]
+    assert delta["deleted"] == [deleted]
+
+
+def test_paging_returns_every_change_once(client, db, make_massas):
+    ids = make_massas(7)
+    _age(db, ids, 3600)
+    cursor = {"updated_since": (datetime.now() - timedelta(hours=2)).isoformat(), "extra": {"limit": 3}}
+    seen = []
+
+    while True:
+        delta = _sync(client, cursor)
+        seen += [m["id"] for m in delta["massas"]]
+        cursor.update(updated_since=delta["updated_since"], after_id=delta["after_id"])
+        if not delta["has_more"]:
+            break
+
+    assert sorted(seen) == ids
+    assert len(seen) == len(set(seen))
+
+
+def test_change_committed_late_within_the_overlap_is_not_missed(client, db, make_massas):
+    (early,) = make_massas(1)
+    _age(db, [early], 3600)
+    cursor = client.get("/massas/", params={"updated_since": START}).json()
+
+    # Stamped before the cursor was handed out, committed only after it
+    (late,) = make_massas(1)
+    _age(db, [late], sync.SYNC_OVERLAP - 1)
+
+    assert [m["id"] for m in _sync(client, cursor)["massas"]] == [late]
+
+
+def test_timezone_aware_cursor_is_read_as_local_time(client, db, make_massas):
+    (massa_id,) = make_massas(1)
+    _age(db, [massa_id], 3600)
+    since = (datetime.now() - timedelta(hours=2)).astimezone(timezone.utc).isoformat()
+
+    delta = client.get("/massas/", params={"updated_since": since}).json()
+
+    assert delta["full"] is False
+    assert [m["id"] for m in delta["massas"]] == [massa_id]
+
+
+def test_delete_all_leaves_tombstones_for_every_massa(client, db, make_massas):
+    ids = make_massas(3)
+    cursor = {"updated_since": (datetime.now() - timedelta(hours=1)).isoformat()}
+
+    client.delete("/massas/all")
+
+    assert sorted(_sync(client, cursor)["deleted"]) == ids
+
+
+def test_updated_since_rejects_filters(client):
+    response = client.get("/massas/", params={"updated_since": START, "region": "NE"})
+    assert response.status_code == 400